@@ -25,21 +25,1016 @@
 
 import logging
 import json
+import os
 import math
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import http.client
 import time
 import threading
+import concurrent.futures
+import select
+import functools
+import bisect
+import contextlib
+import socket
+import asyncio
+import ssl
+import heapq
+import itertools
+import random
+import colorsys
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 XY = namedtuple('XY', ['x', 'y'])
+# prioritätsklassen der zugriffe auf eine bridge, kleinere zahl heisst höhere priorität
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_POLL = 2
+PRIORITY_NAMES = ('interactive', 'bulk', 'poll')
 logger = logging.getLogger('HUE:')
 
+class HueGamut():
+    # farbraum (dreieck im CIE xy diagramm) eines lampentyps. die geometrie des dreiecks wird einmal beim anlegen
+    # berechnet, damit die prüfung und die projektion auf die kanten pro farbe nur noch ein paar multiplikationen sind
+    __slots__ = ('red', 'lime', 'blue', '_v1x', '_v1y', '_v2x', '_v2y', '_denominator', '_edges')
+
+    def __init__(self, red, lime, blue):
+        self.red = XY(*red)
+        self.lime = XY(*lime)
+        self.blue = XY(*blue)
+        self._v1x = self.lime.x - self.red.x
+        self._v1y = self.lime.y - self.red.y
+        self._v2x = self.blue.x - self.red.x
+        self._v2y = self.blue.y - self.red.y
+        self._denominator = self._v1x * self._v2y - self._v1y * self._v2x
+        if self._denominator == 0:
+            raise ValueError('gamut corners {0} {1} {2} do not form a triangle'.format(red, lime, blue))
+        # kanten red-lime, blue-red, lime-blue als (ax, ay, abx, aby, ab2)
+        self._edges = []
+        for a, b in ((self.red, self.lime), (self.blue, self.red), (self.lime, self.blue)):
+            abx = b.x - a.x
+            aby = b.y - a.y
+            self._edges.append((a.x, a.y, abx, aby, abx * abx + aby * aby))
+        self._edges = tuple(self._edges)
+
+    def contains(self, x, y):
+        # prüfung über baryzentrische koordinaten
+        qx = x - self.red.x
+        qy = y - self.red.y
+        s = (qx * self._v2y - qy * self._v2x) / self._denominator
+        t = (self._v1x * qy - self._v1y * qx) / self._denominator
+        return (s >= 0.0) and (t >= 0.0) and (s + t <= 1.0)
+
+    def closest(self, x, y):
+        # nächster punkt auf den kanten des dreiecks
+        closestX = closestY = lowest = None
+        for ax, ay, abx, aby, ab2 in self._edges:
+            t = ((x - ax) * abx + (y - ay) * aby) / ab2
+            if t < 0.0:
+                t = 0.0
+            elif t > 1.0:
+                t = 1.0
+            px = ax + abx * t
+            py = ay + aby * t
+            distance = (x - px) * (x - px) + (y - py) * (y - py)
+            if lowest is None or distance < lowest:
+                lowest = distance
+                closestX = px
+                closestY = py
+        return closestX, closestY
+
+    def fit(self, x, y):
+        # punkt im farbraum oder der nächste punkt auf dem rand
+        if self.contains(x, y):
+            return x, y
+        return self.closest(x, y)
+
+class HueConnectionPool():
+    # pool von keep-alive verbindungen zu einem host (bridge). damit muss nicht für jeden request ein neuer
+    # tcp handshake gemacht werden und die kleine verbindungstabelle der bridge läuft nicht voll
+    # fehler, bei denen eine wiederverwendete verbindung von der bridge geschlossen wurde und neu aufgebaut wird
+    _resetErrors = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, http.client.RemoteDisconnected, http.client.BadStatusLine)
+
+    def __init__(self, host, secure=False, size=2, idleTimeout=30, maxResponseSize=0):
+        self._host = host
+        self._secure = secure
+        # anzahl der verbindungen, die im leerlauf offen gehalten werden. 0 heisst keine wiederverwendung
+        self._size = size
+        # nach dieser zeit in sekunden wird eine verbindung nicht mehr wiederverwendet
+        self._idleTimeout = idleTimeout
+        # grösste erlaubte antwort in bytes, damit eine fehlerhafte antwort nicht den speicher füllt. 0 heisst unbegrenzt
+        self._maxResponseSize = maxResponseSize
+        self._idleConnections = []
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout):
+        if self._secure:
+            return http.client.HTTPSConnection(self._host, timeout=timeout)
+        return http.client.HTTPConnection(self._host, timeout=timeout)
+
+    def _is_healthy(self, conn, lastUsed):
+        # eine verbindung im leerlauf ist nur dann noch brauchbar, wenn sie nicht zu alt ist und der socket nichts
+        # zu lesen hat. ist der socket lesbar, hat die bridge die verbindung geschlossen (eof)
+        if conn.sock is None or time.time() - lastUsed > self._idleTimeout:
+            return False
+        try:
+            readable, writable, failed = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def _get(self, timeout):
+        # liefert eine gesunde verbindung aus dem pool oder eine neue. der zweite wert sagt, ob sie wiederverwendet ist
+        with self._lock:
+            while self._idleConnections:
+                conn, lastUsed = self._idleConnections.pop()
+                if self._is_healthy(conn, lastUsed):
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        return self._connect(timeout), False
+
+    def _put(self, conn):
+        with self._lock:
+            if conn.sock is not None and len(self._idleConnections) < self._size:
+                self._idleConnections.append((conn, time.time()))
+                return
+        conn.close()
+
+    def request(self, method, url, body=None, headers={}, timeout=2):
+        # führt einen request aus und liefert die antwort und den komplett gelesenen inhalt. der inhalt muss
+        # gelesen sein, bevor die verbindung wieder in den pool gehen kann. wurde eine wiederverwendete verbindung
+        # von der bridge zurückgesetzt, dann wird einmal mit einer neuen verbindung wiederholt
+        conn, reused = self._get(timeout)
+        try:
+            conn.request(method, url, body, headers)
+            resp = conn.getresponse()
+            content = self._read(resp)
+        except self._resetErrors:
+            conn.close()
+            if not reused:
+                raise
+            conn = self._connect(timeout)
+            try:
+                conn.request(method, url, body, headers)
+                resp = conn.getresponse()
+                content = self._read(resp)
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._put(conn)
+        return resp, content
+
+    def _read(self, resp):
+        # liest die antwort komplett, aber höchstens maxResponseSize bytes. bei einer grösseren antwort wird die
+        # verbindung durch die exception geschlossen, der rest wird nicht mehr gelesen
+        if not self._maxResponseSize:
+            return resp.read()
+        if resp.length is not None and resp.length > self._maxResponseSize:
+            raise ValueError('response of {0} bytes exceeds max_response_size'.format(resp.length))
+        content = resp.read(self._maxResponseSize + 1)
+        if len(content) > self._maxResponseSize:
+            raise ValueError('response exceeds max_response_size of {0} bytes'.format(self._maxResponseSize))
+        # bei chunked transfer ohne länge muss das ende noch gelesen werden, sonst ist die verbindung nicht frei
+        if not resp.isclosed() and resp.read(1):
+            raise ValueError('response exceeds max_response_size of {0} bytes'.format(self._maxResponseSize))
+        return content
+
+    def close(self):
+        with self._lock:
+            for conn, lastUsed in self._idleConnections:
+                conn.close()
+            self._idleConnections = []
+
+class HueAsyncResponse():
+    # antwort eines requests über den HueAsyncTransport mit den attributen von http.client.HTTPResponse, die ausgewertet werden
+    __slots__ = ('status', 'reason', 'headers', 'will_close')
+
+    def __init__(self, status, reason, headers, will_close):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.will_close = will_close
+
+    def getheaders(self):
+        return self.headers
+
+class HueAsyncTransport():
+    # alternative zu den HueConnectionPools: alle requests an die bridges laufen als coroutinen in einem event loop
+    # in einem eigenen thread. damit bindet ein laufender request keinen thread mehr, auch viele gleichzeitige
+    # befehle brauchen keine zusätzlichen threads. pro host werden size keep-alive verbindungen benutzt, weitere
+    # requests warten im event loop auf eine freie verbindung
+    _resetErrors = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, asyncio.IncompleteReadError)
+
+    def __init__(self, name, size=2, idleTimeout=30, maxResponseSize=0):
+        self._name = name
+        self._size = max(size, 1)
+        self._idleTimeout = idleTimeout
+        self._maxResponseSize = maxResponseSize
+        # host -> [(reader, writer, lastUsed)] und host -> semaphore, beides nur im event loop benutzt
+        self._idleConnections = {}
+        self._semaphores = {}
+        self._loop = None
+        self._thread = None
+        self.alive = False
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=self._name)
+        self._thread.start()
+        self.alive = True
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._loop.close()
+
+    def stop(self):
+        if not self.alive:
+            return
+        self.alive = False
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(5)
+        except Exception as e:
+            logger.warning('HUE: HueAsyncTransport: problem stopping {0}: {1}'.format(self._name, e))
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    async def _shutdown(self):
+        # offene requests abbrechen und die verbindungen schliessen
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for connections in self._idleConnections.values():
+            for reader, writer, lastUsed in connections:
+                writer.close()
+        self._idleConnections = {}
+
+    def submit(self, coroutine):
+        # übergabe einer coroutine aus einem beliebigen thread, liefert ein concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def request_blocking(self, host, secure, method, url, body=None, headers={}, timeout=2):
+        # für aufrufer, die auf die antwort warten (polling): wie HueConnectionPool.request
+        future = self.submit(self.request(host, secure, method, url, body, headers, timeout))
+        try:
+            return future.result(timeout + 1)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise socket.timeout('timed out')
+
+    async def request(self, host, secure, method, url, body=None, headers={}, timeout=2):
+        # die zeit bis eine verbindung frei ist, zählt zum timeout
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self._size)
+        try:
+            return await asyncio.wait_for(self._request(host, secure, method, url, body, headers), timeout)
+        except asyncio.TimeoutError:
+            # gleiche meldung wie bei http.client, damit der fehler im errorstatus item landet
+            raise socket.timeout('timed out')
+
+    async def _request(self, host, secure, method, url, body, headers):
+        async with self._semaphores[host]:
+            reader, writer, reused = await self._get(host, secure)
+            try:
+                resp, content = await self._exchange(reader, writer, host, method, url, body, headers)
+            except self._resetErrors:
+                writer.close()
+                if not reused:
+                    raise
+                # die bridge hat die wiederverwendete verbindung geschlossen, einmal mit einer neuen wiederholen
+                reader, writer = await self._connect(host, secure)
+                try:
+                    resp, content = await self._exchange(reader, writer, host, method, url, body, headers)
+                except BaseException:
+                    writer.close()
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+            if resp.will_close:
+                writer.close()
+            else:
+                self._idleConnections.setdefault(host, []).append((reader, writer, time.time()))
+            return resp, content
+
+    async def _connect(self, host, secure):
+        hostName, separator, port = host.partition(':')
+        if secure:
+            # die bridge hat ein selbst signiertes zertifikat
+            return await asyncio.open_connection(hostName, int(port or 443), ssl=ssl._create_unverified_context())
+        return await asyncio.open_connection(hostName, int(port or 80))
+
+    async def _get(self, host, secure):
+        # liefert eine verbindung im leerlauf, wenn sie nicht zu alt ist und die bridge sie nicht geschlossen hat
+        connections = self._idleConnections.get(host, [])
+        while connections:
+            reader, writer, lastUsed = connections.pop()
+            if time.time() - lastUsed <= self._idleTimeout and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._connect(host, secure)
+        return reader, writer, False
+
+    def _check_size(self, size):
+        if self._maxResponseSize and size > self._maxResponseSize:
+            raise ValueError('response of {0} bytes exceeds max_response_size'.format(size))
+
+    async def _exchange(self, reader, writer, host, method, url, body, headers):
+        # ein request / response nach HTTP/1.1
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        requestLines = ['{0} {1} HTTP/1.1'.format(method, url), 'Host: ' + host, 'Accept-Encoding: identity']
+        if body is not None:
+            requestLines.append('Content-Length: {0}'.format(len(body)))
+        for header, value in headers.items():
+            requestLines.append('{0}: {1}'.format(header, value))
+        writer.write(('\r\n'.join(requestLines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await writer.drain()
+        statusLine = await reader.readline()
+        if not statusLine:
+            raise ConnectionResetError('connection closed by bridge')
+        statusParts = statusLine.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        version = statusParts[0]
+        status = int(statusParts[1])
+        reason = statusParts[2] if len(statusParts) > 2 else ''
+        responseHeaders = []
+        headerValues = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header, separator, value = line.decode('latin-1').partition(':')
+            responseHeaders.append((header.strip(), value.strip()))
+            headerValues[header.strip().lower()] = value.strip().lower()
+        connection = headerValues.get('connection', '')
+        willClose = connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive')
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            content = b''
+        elif 'chunked' in headerValues.get('transfer-encoding', ''):
+            chunks = []
+            size = 0
+            while True:
+                chunkSize = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if chunkSize == 0:
+                    # trailer bis zur leerzeile überlesen
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                size += chunkSize
+                self._check_size(size)
+                chunks.append(await reader.readexactly(chunkSize))
+                await reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in headerValues:
+            self._check_size(int(headerValues['content-length']))
+            content = await reader.readexactly(int(headerValues['content-length']))
+        else:
+            # ohne länge endet die antwort mit dem schliessen der verbindung
+            content = await reader.read(self._maxResponseSize + 1 if self._maxResponseSize else -1)
+            self._check_size(len(content))
+            willClose = True
+        return HueAsyncResponse(status, reason, responseHeaders, willClose), content
+
+class HuePriorityLock():
+    # lock einer bridge, bei dem die wartenden nach ihrer priorität und bei gleicher priorität in der reihenfolge
+    # ihrer anfrage drankommen. ein laufender request wird nicht unterbrochen
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._locked = False
+        # heap aus (priorität, laufende nummer)
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def acquire(self, priority=PRIORITY_POLL):
+        with self._condition:
+            if not self._locked and not self._waiting:
+                self._locked = True
+                return
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            while self._locked or self._waiting[0] != entry:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._locked = True
+
+    def release(self):
+        with self._condition:
+            self._locked = False
+            self._condition.notify_all()
+
+class HueCommandQueue():
+    # warteschlange der schreibbefehle für eine bridge. befehle für die gleiche lampe / gruppe, die noch nicht
+    # gesendet wurden, werden zusammengefasst, so dass nur der letzte wert von bri, xy, ct usw. übertragen wird.
+    # gesendet wird in einem eigenen thread mit einer maximalen rate, die die bridge verarbeiten kann. von den
+    # sendebereiten befehlen geht der mit der höchsten priorität zuerst, bei gleicher priorität der älteste
+    # die werte der farbmodi. die bridge wendet xy vor ct vor hue/sat an, ein befehl darf daher nur die werte eines
+    # farbmodus enthalten: attribut -> attribute der anderen farbmodi
+    _otherColormodeKeys = {'xy': ('ct', 'ct_inc', 'hue', 'sat', 'hue_inc', 'sat_inc'), 'xy_inc': ('ct', 'ct_inc', 'hue', 'sat', 'hue_inc', 'sat_inc'),
+                           'ct': ('xy', 'xy_inc', 'hue', 'sat', 'hue_inc', 'sat_inc'), 'ct_inc': ('xy', 'xy_inc', 'hue', 'sat', 'hue_inc', 'sat_inc'),
+                           'hue': ('xy', 'xy_inc', 'ct', 'ct_inc'), 'sat': ('xy', 'xy_inc', 'ct', 'ct_inc'),
+                           'hue_inc': ('xy', 'xy_inc', 'ct', 'ct_inc'), 'sat_inc': ('xy', 'xy_inc', 'ct', 'ct_inc')}
+
+    def __init__(self, name, sendMethod, rate=10, groupWindow=0, groupResolver=None, limitMethod=None):
+        self._name = name
+        self._sendMethod = sendMethod
+        # limitMethod begrenzt zusammengefasste werte auf das, was die bridge versteht
+        self._limitMethod = limitMethod
+        self._interval = 1.0 / rate
+        # lampenbefehle warten mindestens groupWindow sekunden, damit gleiche befehle an alle lampen einer gruppe
+        # erkannt und durch einen gruppenbefehl ersetzt werden können. groupResolver liefert die passenden gruppen
+        self._groupWindow = groupWindow
+        self._groupResolver = groupResolver
+        # (resource, id) -> state, die reihenfolge ist die des ersten eintrags
+        self._pending = OrderedDict()
+        self._pendingTimes = {}
+        self._pendingPriorities = {}
+        self._condition = threading.Condition()
+        self._nextSend = 0
+        self._thread = None
+        # grösste anzahl wartender befehle seit dem start
+        self.maxDepth = 0
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+        self._thread = threading.Thread(target=self._run, name=self._name)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.alive = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def put(self, resource, resourceId, state, priority=PRIORITY_BULK):
+        # neuer befehl, bei einem noch nicht gesendeten befehl für das gleiche objekt wird zusammengefasst. der
+        # zusammengefasste befehl bekommt die höhere priorität
+        with self._condition:
+            key = (resource, resourceId)
+            if key in self._pending:
+                self._merge(self._pending[key], state)
+                self._pendingPriorities[key] = min(self._pendingPriorities[key], priority)
+            else:
+                self._pending[key] = dict(state)
+                self._pendingTimes[key] = time.time()
+                self._pendingPriorities[key] = priority
+                if len(self._pending) > self.maxDepth:
+                    self.maxDepth = len(self._pending)
+            self._condition.notify()
+
+    def _merge(self, pendingState, state):
+        for key, value in state.items():
+            # ein neuer farbwert ersetzt die offenen werte der anderen farbmodi, sonst gewinnt z.b. ein älteres xy
+            # gegen ein neueres ct
+            for otherKey in self._otherColormodeKeys.get(key, ()):
+                pendingState.pop(otherKey, None)
+            if key.endswith('_inc'):
+                # relative werte werden aufaddiert, ausser es liegt schon ein absoluter wert vor
+                if key[:-4] in pendingState:
+                    pendingState[key[:-4]] = self._limit(key[:-4], pendingState[key[:-4]] + value)
+                    continue
+                # ein relativer wert 0 hält einen laufenden übergang an (ende dimmen) und ersetzt den offenen wert.
+                # ein relativer wert in die andere richtung ersetzt ihn auch, sonst hebt ein richtungswechsel beim
+                # dimmen den offenen wert auf
+                if value != 0 and pendingState.get(key, 0) * value > 0:
+                    value = self._limit(key, pendingState[key] + value)
+            else:
+                # ein absoluter wert ersetzt einen noch offenen relativen wert
+                pendingState.pop(key + '_inc', None)
+            pendingState[key] = value
+
+    def _limit(self, key, value):
+        if self._limitMethod is None:
+            return value
+        return self._limitMethod(key, value)
+
+    def qsize(self):
+        return len(self._pending)
+
+    def is_pending(self, resource, resourceId):
+        # True, solange für das objekt noch ein befehl wartet
+        return (resource, resourceId) in self._pending
+
+    def delay(self):
+        # ungefähre zeit in sekunden, bis ein jetzt eingestellter befehl gesendet ist
+        return max(self._nextSend - time.time(), 0) + self._groupWindow + self._interval * len(self._pending)
+
+    def _ready_time(self, key):
+        # zeitpunkt, ab dem der befehl gesendet werden darf
+        if key[0] == 'lights' and self._groupResolver is not None:
+            return max(self._nextSend, self._pendingTimes[key] + self._groupWindow)
+        return self._nextSend
+
+    def _next_key(self, now):
+        # der nächste zu sendende befehl und, wenn noch keiner sendebereit ist, der zeitpunkt des ersten
+        nextKey = None
+        readyTime = None
+        for key in self._pending:
+            keyReadyTime = self._ready_time(key)
+            if keyReadyTime <= now:
+                if nextKey is None or self._pendingPriorities[key] < self._pendingPriorities[nextKey]:
+                    nextKey = key
+            elif readyTime is None or keyReadyTime < readyTime:
+                readyTime = keyReadyTime
+        return nextKey, readyTime
+
+    def _substitute_groups(self, resourceId, state, priority, commandTime):
+        # sucht unter den wartenden lampenbefehlen die mit identischem state. decken diese alle lampen einer
+        # bekannten gruppe ab, dann wird stattdessen ein gruppenbefehl gesendet
+        lampIds = set([resourceId])
+        for (pendingResource, pendingId), pendingState in self._pending.items():
+            if pendingResource == 'lights' and pendingState == state:
+                lampIds.add(pendingId)
+        commands = []
+        if len(lampIds) > 1:
+            for hueGroupId, hueGroupLampIds in self._groupResolver(lampIds):
+                groupPriority = priority
+                groupTime = commandTime
+                lampIds -= hueGroupLampIds
+                for hueLampId in hueGroupLampIds:
+                    if hueLampId != resourceId:
+                        del self._pending[('lights', hueLampId)]
+                        groupTime = min(groupTime, self._pendingTimes.pop(('lights', hueLampId)))
+                        groupPriority = min(groupPriority, self._pendingPriorities.pop(('lights', hueLampId)))
+                commands.append(('groups', hueGroupId, state, groupPriority, groupTime))
+        if resourceId in lampIds:
+            commands.append(('lights', resourceId, state, priority, commandTime))
+        return commands
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # warten bis ein befehl ansteht und die rate einen neuen befehl zulässt. in der zwischenzeit
+                # eintreffende befehle werden zusammengefasst
+                key = None
+                while self.alive:
+                    if not self._pending:
+                        self._condition.wait()
+                        continue
+                    now = time.time()
+                    key, readyTime = self._next_key(now)
+                    if key is not None:
+                        break
+                    self._condition.wait(readyTime - now)
+                if not self.alive:
+                    return
+                resource, resourceId = key
+                state = self._pending.pop(key)
+                commandTime = self._pendingTimes.pop(key)
+                priority = self._pendingPriorities.pop(key)
+                if resource == 'lights' and self._groupResolver is not None:
+                    commands = self._substitute_groups(resourceId, state, priority, commandTime)
+                else:
+                    commands = [(resource, resourceId, state, priority, commandTime)]
+            for resource, resourceId, state, priority, commandTime in commands:
+                try:
+                    self._sendMethod(resource, resourceId, state, priority, commandTime)
+                except Exception as e:
+                    logger.error('HUE: HueCommandQueue: problem sending {0} {1} {2}: {3}'.format(resource, resourceId, state, e))
+            self._nextSend = time.time() + self._interval * len(commands)
+
+class HueRefreshQueue():
+    # geplante lesezugriffe auf einzelne lampen und gruppen nach einem schreibbefehl. alle lesezugriffe laufen
+    # nacheinander in einem thread. ist der erste fällig, wird noch window sekunden gewartet und dann alles, was für
+    # die gleiche bridge fällig ist, zusammen an refreshMethod(bridge, [(resource, id), ...]) übergeben
+    def __init__(self, name, refreshMethod, window=0.2):
+        self._name = name
+        self._refreshMethod = refreshMethod
+        self._window = window
+        # (bridge, resource, id) -> zeitpunkt der fälligkeit
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+        self._thread = threading.Thread(target=self._run, name=self._name)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.alive = False
+            self._pending.clear()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def put(self, refreshKey, delay):
+        # eine noch ausstehende abfrage des gleichen objektes wird auf die neue fälligkeit verschoben. liefert
+        # False, wenn die warteschlange nicht läuft
+        with self._condition:
+            if not self.alive:
+                return False
+            self._pending[refreshKey] = time.time() + delay
+            self._condition.notify()
+            return True
+
+    def qsize(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.alive and (not self._pending or min(self._pending.values()) + self._window > time.time()):
+                    if self._pending:
+                        self._condition.wait(min(self._pending.values()) + self._window - time.time())
+                    else:
+                        self._condition.wait()
+                if not self.alive:
+                    return
+                now = time.time()
+                hueBridgeId = min(self._pending, key=self._pending.get)[0]
+                refreshKeys = [refreshKey for refreshKey, dueTime in self._pending.items() if refreshKey[0] == hueBridgeId and dueTime <= now]
+                for refreshKey in refreshKeys:
+                    del self._pending[refreshKey]
+            try:
+                self._refreshMethod(hueBridgeId, [(hueResource, hueObjectId) for refreshBridgeId, hueResource, hueObjectId in refreshKeys])
+            except Exception as e:
+                logger.error('HUE: HueRefreshQueue: problem reading back bridge {0}: {1}'.format(hueBridgeId, e))
+
+class HueEventStream():
+    # liest den event stream (server sent events) einer bridge in einem eigenen thread und übergibt jedes event
+    # an die eventMethod. bei abbruch der verbindung wird mit wachsendem abstand neu verbunden
+    def __init__(self, name, url, user, eventMethod, timeout=300):
+        self._name = name
+        self._url = url
+        self._user = user
+        self._eventMethod = eventMethod
+        # die bridge sendet regelmässig keep-alive kommentare, kommt so lange nichts, wird neu verbunden
+        self._timeout = timeout
+        self._conn = None
+        # der socket wird extra gemerkt, http.client gibt ihn bei 'Connection: close' an die antwort weiter und
+        # vergisst ihn in der verbindung
+        self._sock = None
+        self._thread = None
+        self._stopEvent = threading.Event()
+        self._backoff = 1
+        self.connected = False
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name=self._name)
+        self._thread.start()
+
+    def stop(self):
+        self.alive = False
+        self._stopEvent.set()
+        sock = self._sock
+        if sock is not None:
+            # das blockierende lesen des streams wird durch das schliessen des sockets beendet
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while self.alive:
+            try:
+                self._read_stream()
+            except Exception as e:
+                if self.alive:
+                    logger.warning('HUE: HueEventStream: {0} connection to {1} lost: {2}'.format(self._name, self._url, e))
+            self.connected = False
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._sock = None
+            self._stopEvent.wait(self._backoff)
+            self._backoff = min(self._backoff * 2, 60)
+
+    def _read_stream(self):
+        lurl = self._url.split('/')
+        host = lurl[2]
+        purl = '/' + '/'.join(lurl[3:])
+        if self._url.startswith('https'):
+            # die bridge hat ein selbst signiertes zertifikat
+            self._conn = http.client.HTTPSConnection(host, timeout=self._timeout, context=ssl._create_unverified_context())
+        else:
+            self._conn = http.client.HTTPConnection(host, timeout=self._timeout)
+        self._conn.request('GET', purl, headers={'hue-application-key': self._user, 'Accept': 'text/event-stream'})
+        self._sock = self._conn.sock
+        if not self.alive:
+            return
+        resp = self._conn.getresponse()
+        if resp.status != 200:
+            raise Exception('status {0} {1}'.format(resp.status, resp.reason))
+        self.connected = True
+        self._backoff = 1
+        data = []
+        while self.alive:
+            line = resp.readline()
+            if not line:
+                # stream wurde von der bridge beendet
+                return
+            line = line.decode('utf-8').rstrip('\r\n')
+            if line == '':
+                # leerzeile schliesst ein event ab
+                if data:
+                    self._eventMethod(json.loads('\n'.join(data)))
+                    data = []
+            elif line.startswith('data:'):
+                data.append(line[5:].lstrip())
+            # kommentare (':') und die felder id, event und retry werden nicht gebraucht
+
+class HueItemBinding():
+    # in parse_item vorbereitete daten eines send items: ids, übergangszeit, wertegrenzen und die items für on, bri
+    # und rgb der gleichen lampe / gruppe. damit muss beim schreiben nichts mehr gesucht oder umgerechnet werden
+    __slots__ = ('hueBridgeId', 'hueObjectId', 'hueSend', 'hueLampType', 'hueIndex', 'transitionTime', 'valueRange', 'siblings')
+
+    def __init__(self, hueBridgeId, hueObjectId, hueSend, hueLampType=0, transitionTime=0, valueRange=None):
+        self.hueBridgeId = hueBridgeId
+        self.hueObjectId = hueObjectId
+        self.hueSend = hueSend
+        self.hueLampType = hueLampType
+        self.hueIndex = hueBridgeId if hueObjectId is None else hueBridgeId + '.' + hueObjectId
+        self.transitionTime = transitionTime
+        self.valueRange = valueRange
+        self.siblings = None
+
+class HueEffect():
+    # ein laufender effekt: die ziele sind (resource, id, lampentyp), params die parameter des effekts. die zeiten
+    # sind in sekunden, duration 0 heisst ohne ende
+    __slots__ = ('effectId', 'name', 'hueBridgeId', 'targets', 'fps', 'duration', 'params', 'start', 'nextFrame', 'frames', 'framesDropped', 'lastStates', 'random')
+
+    def __init__(self, effectId, name, hueBridgeId, targets, fps, duration, params):
+        self.effectId = effectId
+        self.name = name
+        self.hueBridgeId = hueBridgeId
+        self.targets = targets
+        self.fps = fps
+        self.duration = duration
+        self.params = params
+        self.start = time.time()
+        self.nextFrame = self.start
+        self.frames = 0
+        self.framesDropped = 0
+        # zuletzt gesendeter status pro ziel, gleiche bilder werden nicht noch einmal gesendet
+        self.lastStates = {}
+        self.random = random.Random()
+
+class HueEffectEngine():
+    # rechnet die bilder der laufenden effekte im takt ihrer bildrate in einem eigenen thread. ist ein bild fällig,
+    # werden alle ziele eines effekts zusammen berechnet. kommt der thread nicht hinterher, werden die verpassten
+    # bilder ausgelassen und es geht mit dem bild zur aktuellen zeit weiter
+    def __init__(self, name, renderMethod, finishMethod):
+        self._name = name
+        self._renderMethod = renderMethod
+        self._finishMethod = finishMethod
+        self._effects = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+        self._thread = threading.Thread(target=self._run, name=self._name)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self.alive = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add(self, effect):
+        with self._condition:
+            self._effects[effect.effectId] = effect
+            self._condition.notify()
+
+    def remove(self, effectIds):
+        # beendet die effekte und liefert die beendeten zurück
+        with self._condition:
+            removed = [self._effects.pop(effectId) for effectId in effectIds if effectId in self._effects]
+            self._condition.notify()
+        return removed
+
+    def get(self):
+        with self._condition:
+            return list(self._effects.values())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.alive and (not self._effects or min(effect.nextFrame for effect in self._effects.values()) > time.time()):
+                    if self._effects:
+                        self._condition.wait(min(effect.nextFrame for effect in self._effects.values()) - time.time())
+                    else:
+                        self._condition.wait()
+                if not self.alive:
+                    return
+                now = time.time()
+                dueEffects = [effect for effect in self._effects.values() if effect.nextFrame <= now]
+            for effect in dueEffects:
+                elapsed = now - effect.start
+                finished = effect.duration > 0 and elapsed >= effect.duration
+                try:
+                    self._renderMethod(effect, effect.duration if finished else elapsed)
+                except Exception as e:
+                    logger.error('HUE: HueEffectEngine: problem in effect {0} {1}: {2}'.format(effect.effectId, effect.name, e))
+                effect.frames += 1
+                # nächstes bild im raster der bildrate. liegt es schon in der vergangenheit, werden die verpassten
+                # bilder ausgelassen
+                frame = int(elapsed * effect.fps) + 1
+                currentFrame = int((time.time() - effect.start) * effect.fps) + 1
+                if currentFrame > frame:
+                    effect.framesDropped += currentFrame - frame
+                    frame = currentFrame
+                effect.nextFrame = effect.start + frame / effect.fps
+                if finished and self.remove([effect.effectId]):
+                    self._finishMethod(effect)
+
+class HueCircuitBreaker():
+    # schutz vor einer nicht erreichbaren bridge. nach threshold verbindungsfehlern in folge wird die bridge gesperrt
+    # (open), alle requests schlagen dann sofort fehl, ohne auf den timeout zu warten. nach der wartezeit darf ein
+    # einzelner request als probe durch (half_open). gelingt er, ist die bridge wieder frei (closed), sonst wird die
+    # wartezeit bis maxBackoff verdoppelt. die probe zählt bei jedem fehler als fehlgeschlagen, nicht nur bei
+    # verbindungsfehlern, sonst bliebe die bridge in half_open gesperrt
+    def __init__(self, threshold=3, backoff=5, maxBackoff=300):
+        self._threshold = threshold
+        self._backoff = backoff
+        self._maxBackoff = maxBackoff
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._currentBackoff = backoff
+        self._nextProbe = 0
+        self.state = 'closed'
+
+    def allow(self):
+        # darf ein request gesendet werden
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() >= self._nextProbe:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def success(self):
+        # liefert True, wenn die bridge damit wieder freigegeben wurde
+        with self._lock:
+            released = self.state != 'closed'
+            self.state = 'closed'
+            self._failures = 0
+            self._currentBackoff = self._backoff
+            return released
+
+    def failure(self, connectionError=True):
+        # liefert True, wenn die bridge damit gesperrt wurde. andere fehler als verbindungsfehler zählen nur für
+        # die probe
+        with self._lock:
+            if not connectionError and self.state != 'half_open':
+                return False
+            self._failures += 1
+            if self.state == 'half_open':
+                self._currentBackoff = min(self._currentBackoff * 2, self._maxBackoff)
+            elif self.state == 'open' or self._failures < self._threshold:
+                return False
+            opened = self.state == 'closed'
+            self.state = 'open'
+            self._nextProbe = time.time() + self._currentBackoff
+            return opened
+
+    def backoff(self):
+        return self._currentBackoff
+
+class HueBridgeStats():
+    # laufzeitstatistik einer bridge: dauer der requests als histogramm, warte- und haltezeiten des bridge locks,
+    # dauer der abfragezyklen sowie fehler und timeouts. die zeiten werden in sekunden gesammelt und in ms ausgegeben
+    # obere grenzen der histogrammklassen in ms, die letzte klasse nimmt alles darüber auf
+    _latencyBuckets = (5, 10, 25, 50, 100, 250, 500, 1000, 2000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.requestErrors = 0
+        self.requestTimeouts = 0
+        self.requestsRejected = 0
+        self.commandErrors = 0
+        self.commandsSent = 0
+        self.commandsSuppressed = 0
+        self.commandValuesSuppressed = 0
+        self._latencyHistogram = [0] * (len(self._latencyBuckets) + 1)
+        # [anzahl, summe, maximum, letzter wert]
+        self._latency = [0, 0.0, 0.0, 0.0]
+        self._lockWait = [0, 0.0, 0.0, 0.0]
+        self._lockHold = [0, 0.0, 0.0, 0.0]
+        # abfrageart -> [anzahl, summe, maximum, letzter wert]
+        self._polls = {}
+        # pro prioritätsklasse die wartezeit auf den bridge lock und die dauer der befehle vom item bis zur antwort
+        # der bridge, jeweils [anzahl, summe, maximum, letzter wert], und das histogramm der befehle
+        self._classLockWait = [[0, 0.0, 0.0, 0.0] for priority in PRIORITY_NAMES]
+        self._classCommands = [[0, 0.0, 0.0, 0.0] for priority in PRIORITY_NAMES]
+        self._classHistograms = [[0] * (len(self._latencyBuckets) + 1) for priority in PRIORITY_NAMES]
+
+    def _add(self, timing, duration):
+        timing[0] += 1
+        timing[1] += duration
+        if duration > timing[2]:
+            timing[2] = duration
+        timing[3] = duration
+
+    def _get(self, timing):
+        return {'count': timing[0], 'mean_ms': round(timing[1] * 1000 / timing[0], 2) if timing[0] else 0.0, 'max_ms': round(timing[2] * 1000, 2), 'last_ms': round(timing[3] * 1000, 2)}
+
+    def add_request(self, duration, error=False, timeout=False):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.requestErrors += 1
+            if timeout:
+                self.requestTimeouts += 1
+            self._add(self._latency, duration)
+            self._latencyHistogram[bisect.bisect_left(self._latencyBuckets, duration * 1000)] += 1
+
+    def add_lock(self, wait, hold, priority=PRIORITY_POLL):
+        with self._lock:
+            self._add(self._lockWait, wait)
+            self._add(self._lockHold, hold)
+            self._add(self._classLockWait[priority], wait)
+
+    def add_command_latency(self, priority, duration):
+        with self._lock:
+            self._add(self._classCommands[priority], duration)
+            self._classHistograms[priority][bisect.bisect_left(self._latencyBuckets, duration * 1000)] += 1
+
+    def _get_histogram(self, counts):
+        histogram = OrderedDict()
+        for bucket, count in zip(self._latencyBuckets, counts):
+            histogram['<=' + str(bucket)] = count
+        histogram['>' + str(self._latencyBuckets[-1])] = counts[-1]
+        return histogram
+
+    def add_poll(self, pollName, duration):
+        with self._lock:
+            self._add(self._polls.setdefault(pollName, [0, 0.0, 0.0, 0.0]), duration)
+
+    def add_rejected(self):
+        with self._lock:
+            self.requestsRejected += 1
+
+    def add_command_error(self):
+        with self._lock:
+            self.commandErrors += 1
+
+    def add_command(self, valuesSuppressed=0, suppressed=False):
+        # ein befehl, der gesendet oder komplett unterdrückt wurde, und die daraus entfernten werte
+        with self._lock:
+            if suppressed:
+                self.commandsSuppressed += 1
+            else:
+                self.commandsSent += 1
+            self.commandValuesSuppressed += valuesSuppressed
+
+    def get(self):
+        # momentaufnahme aller werte als dict
+        with self._lock:
+            latency = self._get(self._latency)
+            latency['histogram_ms'] = self._get_histogram(self._latencyHistogram)
+            priorities = {}
+            for priority, priorityName in enumerate(PRIORITY_NAMES):
+                priorities[priorityName] = {'lock_wait': self._get(self._classLockWait[priority])}
+                if priority != PRIORITY_POLL:
+                    priorities[priorityName]['command_latency'] = self._get(self._classCommands[priority])
+                    priorities[priorityName]['command_latency']['histogram_ms'] = self._get_histogram(self._classHistograms[priority])
+            return {'requests': self.requests, 'request_errors': self.requestErrors, 'request_timeouts': self.requestTimeouts, 'requests_rejected': self.requestsRejected, 'command_errors': self.commandErrors,
+                    'commands_sent': self.commandsSent, 'commands_suppressed': self.commandsSuppressed, 'command_values_suppressed': self.commandValuesSuppressed,
+                    'request_latency': latency, 'lock_wait': self._get(self._lockWait), 'lock_hold': self._get(self._lockHold),
+                    'poll': dict((pollName, self._get(timing)) for pollName, timing in self._polls.items()), 'priority': priorities}
+
 class HUE():
 
-    def __init__(self, smarthome, hue_ip = '', hue_user = '', hue_port = '80', cycle_lamps = '10', cycle_bridges = '60', default_transitionTime = '0.4'):
+    def __init__(self, smarthome, hue_ip = '', hue_user = '', hue_port = '80', cycle_lamps = '10', cycle_bridges = '60', default_transitionTime = '0.4', poll_workers = '0', connection_pool_size = '2', command_rate = '10', group_window = '0.1', cycle_lamps_fast = '0', lamp_gamuts = '', event_stream = 'off', cycle_lamps_stream = '300', max_response_size = '4096', cycle_static = '3600', transport = 'thread', breaker_threshold = '3', breaker_backoff = '5', breaker_backoff_max = '300', state_cache = 'on', poll_mode = 'split', read_after_write = '0.5', suppress_commands = 'on', bulk_callers = 'Logic, Eval, Scheduler, Fader, Autotimer'):
 
         # parameter zu übergabe aus der konfiguration pulgin.conf
         self._sh = smarthome
+        self.alive = False
         # parmeter übernehmen, aufteilen und leerzeichen herausnehmen
         self._hue_ip = hue_ip.replace(' ','').split(',')
         self._hue_user = hue_user.replace(' ','').split(',')
@@ -65,7 +1060,26 @@ class HUE():
         self._cycle_bridges = int(cycle_bridges)
         if self._cycle_bridges < 10:
             # beschränkung der wiederholrate 
-            self._cycle_lamps = 10
+            self._cycle_bridges = 10
+        # die statischen attribute werden nach dem start einmal und dann im zyklus cycle_static neu gelesen. 0 heisst
+        # nur beim start und auf anforderung über refresh_static()
+        self._cycle_static = int(cycle_static)
+        if self._cycle_static < 0:
+            self._cycle_static = 0
+        # adaptives polling: nach einem schreibbefehl oder einer erkannten änderung wird jede bridge im schnellen
+        # zyklus abgefragt, danach wird der zyklus bis auf cycle_lamps verdoppelt. 0 heisst fester zyklus cycle_lamps
+        self._cycle_lamps_fast = int(cycle_lamps_fast)
+        if self._cycle_lamps_fast >= self._cycle_lamps:
+            self._cycle_lamps_fast = 0
+        elif self._cycle_lamps_fast < 0:
+            self._cycle_lamps_fast = 0
+        # abfrage der bridges: 'split' fragt /lights, /groups und /config getrennt ab, 'full' holt den gesamten status
+        # /api/<user> mit einer abfrage pro bridge und zyklus. die konfiguration wird daraus nur im zyklus
+        # cycle_bridges übernommen
+        self._pollMode = poll_mode.strip().lower()
+        if self._pollMode not in ('split', 'full'):
+            logger.warning('HUE: Error in plugin.conf: poll_mode [{0}] is not split or full. It is set to split'.format(poll_mode))
+            self._pollMode = 'split'
         self._hueDefaultTransitionTime = float(default_transitionTime)
         if self._hueDefaultTransitionTime < 0:
             # beschränkung der wiederholrate 
@@ -81,8 +1095,118 @@ class HUE():
         # hier werden alle bekannte items für die hues eingetragen
         self._sendBridgeItems = {}
         self._listenBridgeItems = {}
-        # locks für die absicherung
-        self._hueLock = threading.Lock()
+        # die in parse_item vorbereiteten daten der send items: id(item) -> HueItemBinding
+        self._itemBindings = {}
+        # lampentyp der lampen aus den items: (bridge, lampe) -> lampentyp, für die farbumrechnung der effekte
+        self._lampTypes = {}
+        # die items der gleichen lampe / gruppe, die beim schreiben zusätzlich gebraucht werden
+        self._lampSiblingKeys = ['on', 'bri', 'col_r', 'col_g', 'col_b']
+        self._groupSiblingKeys = ['on', 'bri']
+        # routing index für die rückmeldungen der bridge, wird in parse_item aufgebaut. damit muss beim polling
+        # nicht mehr über alle listen items gesucht werden, sondern nur noch über die tatsächlich gebundenen
+        # lampen: (bridge, lampe) -> {attribut: (item, typecast)}
+        self._listenLampRoutes = {}
+        # gruppen: (bridge, gruppe) -> {attribut: (item, typecast)}
+        self._listenGroupRoutes = {}
+        # bridges: bridge -> {attribut in /config: (item, typecast)}
+        self._listenBridgeRoutes = {}
+        # die statischen attribute (name, modelid, ...) ändern sich praktisch nie und stehen nicht in den routing
+        # tabellen oben, sondern hier: (bridge, resource, id) -> {attribut: (item, typecast)}. sie werden beim
+        # polling nur übertragen, solange das objekt in _staticPending steht
+        self._listenStaticRoutes = {}
+        self._staticPending = set()
+        # letzte decodierte rückmeldung von /lights, /groups und /config pro bridge
+        self._bridgeSnapshots = {}
+        # die zuletzt auf die items geschriebenen werte: (bridge, resource, id) -> {attribut: wert}. beim polling
+        # werden nur noch die geänderten werte auf die items geschrieben, die anderen werden gezählt
+        self._appliedValues = {}
+        self._itemWritesApplied = {}
+        self._itemWritesSuppressed = {}
+        # locks für die absicherung, jede bridge hat ihren eigenen lock, damit eine langsame oder nicht erreichbare
+        # bridge nicht die anderen bridges blockiert. wartende befehle kommen vor wartenden abfragen dran
+        self._hueLocks = {}
+        # änderungen von items durch diese caller sind massenänderungen und warten hinter den interaktiven
+        # änderungen (visu, knx, ...), aber vor dem polling
+        self._bulkCallers = set(bulkCaller.strip() for bulkCaller in bulk_callers.split(',') if bulkCaller.strip())
+        # laufzeitstatistik pro bridge für get_stats() und die stats items
+        self._bridgeStats = {}
+        # befehle bzw. werte daraus, die den bestätigten status der lampen nicht ändern würden, werden nicht gesendet.
+        # der bestätigte status ist der letzte stand aus _bridgeSnapshots, ergänzt um die bestätigten werte der
+        # schreibbefehle. er gilt erst nach dem ersten polling der lampen, lampen mit einem laufenden befehl oder
+        # nach einem gruppenbefehl gelten bis zur nächsten abfrage als unbekannt
+        self._suppressCommands = suppress_commands.strip().lower() in ('on', 'true', 'yes', '1')
+        self._shadowValid = {}
+        self._unconfirmedLamps = {}
+        self._lampsInFlight = {}
+        self._shadowLock = threading.Lock()
+        # toleranz beim vergleich von xy, die bridge rundet xy auf 4 stellen. alle anderen werte werden genau
+        # verglichen, sonst würde z.b. ein schritt der helligkeit um 1 verworfen
+        self._suppressTolerances = {'xy': 0.001}
+        # die werte, die beim vergleich berücksichtigt werden, und der colormode, zu dem ein farbwert gehört
+        self._suppressKeys = ['on', 'bri', 'xy', 'ct', 'hue', 'sat', 'effect']
+        self._colormodeOfKeys = {'xy': 'xy', 'ct': 'ct', 'hue': 'hs', 'sat': 'hs'}
+        # sperre pro bridge nach breaker_threshold verbindungsfehlern in folge, 0 heisst keine sperre
+        self._breakerThreshold = int(breaker_threshold)
+        self._circuitBreakers = {}
+        # fehler des letzten requests im jeweiligen thread, damit timeouts gezählt werden können
+        self._requestStatus = threading.local()
+        for numberBridgeId in range(self._numberHueBridges):
+            self._hueLocks[str(numberBridgeId)] = HuePriorityLock()
+            self._bridgeSnapshots[str(numberBridgeId)] = {'lights': {}, 'groups': {}, 'config': {}}
+            self._itemWritesApplied[str(numberBridgeId)] = 0
+            self._itemWritesSuppressed[str(numberBridgeId)] = 0
+            self._shadowValid[str(numberBridgeId)] = False
+            self._unconfirmedLamps[str(numberBridgeId)] = set()
+            self._lampsInFlight[str(numberBridgeId)] = {}
+            self._bridgeStats[str(numberBridgeId)] = HueBridgeStats()
+            if self._breakerThreshold > 0:
+                self._circuitBreakers[str(numberBridgeId)] = HueCircuitBreaker(self._breakerThreshold, float(breaker_backoff), float(breaker_backoff_max))
+        # anzahl der threads, mit denen die bridges parallel abgefragt werden. 0 heisst ein thread pro bridge,
+        # 1 heisst die bridges werden wie bisher nacheinander abgefragt
+        self._pollWorkers = int(poll_workers)
+        if self._pollWorkers <= 0 or self._pollWorkers > self._numberHueBridges:
+            self._pollWorkers = self._numberHueBridges
+        if self._pollWorkers > 1:
+            self._pollExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=self._pollWorkers, thread_name_prefix='hue-poll')
+        else:
+            self._pollExecutor = None
+        # keep-alive verbindungen zu den bridges, pro host ein pool. 0 heisst jede verbindung wird nach dem request geschlossen
+        self._connectionPoolSize = int(connection_pool_size)
+        if self._connectionPoolSize < 0:
+            self._connectionPoolSize = 0
+        self._connectionPools = {}
+        self._connectionPoolsLock = threading.Lock()
+        # grösste antwort der bridge in kbyte, grössere antworten werden verworfen. 0 heisst unbegrenzt
+        self._maxResponseSize = int(max_response_size) * 1024
+        if self._maxResponseSize < 0:
+            self._maxResponseSize = 0
+        # transport = asyncio: alle requests laufen in einem event loop in einem eigenen thread. schreibbefehle kehren
+        # sofort zurück, ohne auf die antwort der bridge zu warten. sonst ein pool blockierender verbindungen pro bridge
+        if transport.strip().lower() == 'asyncio':
+            self._asyncTransport = HueAsyncTransport('hue-asyncio', self._connectionPoolSize, maxResponseSize=self._maxResponseSize)
+        else:
+            self._asyncTransport = None
+        # die antworten werden direkt aus den bytes decodiert, mit orjson wenn es installiert ist
+        if orjson is not None:
+            self._jsonLoads = orjson.loads
+        else:
+            self._jsonLoads = json.loads
+        # warteschlange pro bridge für die schreibbefehle, gesendet wird mit maximal command_rate befehlen pro sekunde
+        # bei 0 wird wie bisher direkt im aufrufenden thread gesendet
+        self._commandRate = float(command_rate)
+        # zeitfenster in sekunden, in dem gleiche befehle an alle lampen einer gruppe durch einen gruppenbefehl ersetzt werden
+        # die zugehörigkeit der lampen zu den gruppen wird aus dem polling von /groups gelernt: bridge -> {gruppe: lampen}
+        self._groupWindow = float(group_window)
+        self._groupMembers = {}
+        self._commandQueues = {}
+        if self._commandRate > 0:
+            for numberBridgeId in range(self._numberHueBridges):
+                hueBridgeId = str(numberBridgeId)
+                if self._groupWindow > 0:
+                    groupResolver = self._get_group_resolver(hueBridgeId)
+                else:
+                    groupResolver = None
+                self._commandQueues[hueBridgeId] = HueCommandQueue('hue-command-' + hueBridgeId, self._get_send_method(hueBridgeId), self._commandRate, self._groupWindow, groupResolver, self._limit_command_value)
         # hier ist die liste der einträge, für die der status auf listen gesetzt werden kann
         self._listenLampKeys = ['on', 'bri', 'sat', 'hue', 'reachable', 'effect', 'alert', 'type', 'name', 'modelid', 'uniqueid', 'manufacturername', 'swversion', 'ct']
         # hier ist die liste der einträge, für die der status auf senden gesetzt werden kann
@@ -92,19 +1216,29 @@ class HUE():
         # hier ist die liste der einträge, für die der status auf senden gesetzt werden kann
         self._sendGroupKeys = ['on', 'bri','bri_inc', 'sat' ,'sat_inc', 'hue', 'hue_inc', 'effect', 'alert', 'ct', 'ct_inc']
         # hier ist die liste der einträge, für die der status auf listen gesetzt werden kann
-        self._listenBridgeKeys = ['bridge_name', 'zigbeechannel', 'mac', 'dhcp', 'ipaddress', 'netmask', 'gateway', 'UTC', 'localtime', 'timezone', 'bridge_swversion', 'apiversion', 'swupdate', 'linkbutton', 'portalservices', 'portalconnection', 'portalstate', 'whitelist','errorstatus']
+        self._listenBridgeKeys = ['bridge_name', 'zigbeechannel', 'mac', 'dhcp', 'ipaddress', 'netmask', 'gateway', 'UTC', 'localtime', 'timezone', 'bridge_swversion', 'apiversion', 'swupdate', 'linkbutton', 'portalservices', 'portalconnection', 'portalstate', 'whitelist','errorstatus', 'poll_interval', 'stats', 'request_latency', 'request_errors', 'request_timeouts', 'queue_depth', 'poll_duration']
         # hier ist die liste der einträge, für die der status auf senden gesetzt werden kann
         self._sendBridgeKeys = ['scene']
         # hier ist die liste der einträge, für die ein dimmer DPT3 gesetzt werden kann
         self._dimmKeys = ['bri', 'sat', 'hue']
+        # die farbwerte, die zu einem colormode gehören
+        self._colormodeKeys = {'xy': ['xy'], 'ct': ['ct'], 'hs': ['hue', 'sat']}
+        # grösster relativer wert pro dimmbarem eintrag, wie er an die bridge gesendet werden darf
+        self._dimmRanges = {'bri': 254, 'sat': 254, 'hue': 65534}
         # hier ist die liste der einträge, für rgb gesetzt werden kann
         self._rgbKeys = ['col_r', 'col_g', 'col_b']
         # hier ist die liste der einträge, für string
         self._stringKeys = ['effect', 'alert', 'type', 'name', 'modelid', 'uniqueid', 'manufacturername', 'swversion', 'bridge_name', 'mac', 'ipaddress', 'netmask', 'gateway', 'UTC', 'localtime', 'timezone', 'bridge_swversion', 'apiversion', 'portalconnection']
+        # hier ist die liste der statischen einträge der lampen und gruppen, die nicht in jedem zyklus übertragen werden
+        self._staticKeys = ['type', 'name', 'modelid', 'uniqueid', 'manufacturername', 'swversion']
+        # hier ist die liste der statischen einträge der bridges
+        self._staticBridgeKeys = ['bridge_name', 'zigbeechannel', 'mac', 'dhcp', 'ipaddress', 'netmask', 'gateway', 'timezone', 'bridge_swversion', 'apiversion']
         # hier ist die liste der einträge, für string
         self._boolKeys = ['on', 'reachable', 'linkbutton', 'portalservices', 'dhcp']
         # hier ist die liste der einträge, für string
-        self._dictKeys = ['portalstate', 'swupdate', 'whitelist']
+        self._dictKeys = ['portalstate', 'swupdate', 'whitelist', 'stats']
+        # hier die umbenennung der bridge attribute, die in /config anders heissen als die lampen attribute
+        self._bridgeConfigKeys = {'bridge_name': 'name', 'bridge_swversion': 'swversion'}
         # hier die abgefangenen fehlermeldungen in den connections, die auf das fehleritem gemapped werden
         self._connErrors = ['Host is down', 'timed out', '[Errno 113] No route to host']
         # hier ist die liste der einträge, für wertebereich 0-255
@@ -115,31 +1249,112 @@ class HUE():
         self._rangeInteger16 = ['hue']
         # hier ist die liste der einträge, für wertebereich -65534 bis 65534
         self._rangeSignedInteger16 = ['hue_inc','ct_inc']
-        # konfiguration farbumrechnung. es gibt im Moment 2 lampentypgruppen:
-        # hue bulb the corners index 0 [0] für LivingColors Bloom, Aura and Iris index 1 [1]
-        self._numberHueLampTypes=3
-        self.Red = [XY(0.674, 0.322), XY(0.703, 0.296), XY(1.0, 0.0)]
-        self.Lime =[XY(0.408, 0.517), XY(0.214, 0.709), XY(0.703, 1.0)]
-        self.Blue =[XY(0.168, 0.041), XY(0.139, 0.081), XY(0.0, 0.0)]
+        # konfiguration farbumrechnung. es gibt fest 3 lampentypgruppen:
+        # hue bulb the corners index 0 [0] für LivingColors Bloom, Aura and Iris index 1 [1], standard index 2 [2]
+        # weitere lampentypen ab index 3 kommen aus lamp_gamuts in der plugin.conf
+        self._gamuts = [HueGamut((0.674, 0.322), (0.408, 0.517), (0.168, 0.041)), HueGamut((0.703, 0.296), (0.214, 0.709), (0.139, 0.081)), HueGamut((1.0, 0.0), (0.703, 1.0), (0.0, 0.0))]
+        # die von philips definierten farbräume, die über ihren namen angegeben werden können
+        self._gamutTriangles = {'A': ((0.704, 0.296), (0.2151, 0.7106), (0.138, 0.08)), 'B': ((0.675, 0.322), (0.409, 0.518), (0.167, 0.04)), 'C': ((0.692, 0.308), (0.17, 0.7), (0.153, 0.048))}
+        for lampGamut in lamp_gamuts.split(','):
+            lampGamut = lampGamut.strip()
+            if lampGamut == '':
+                continue
+            try:
+                if lampGamut.upper() in self._gamutTriangles:
+                    self._gamuts.append(HueGamut(*self._gamutTriangles[lampGamut.upper()]))
+                else:
+                    corners = [float(value) for value in lampGamut.split()]
+                    if len(corners) != 6:
+                        raise ValueError('6 values expected')
+                    self._gamuts.append(HueGamut(corners[0:2], corners[2:4], corners[4:6]))
+            except ValueError as e:
+                logger.error('HUE: Error in plugin.conf: lamp_gamuts entry [{0}] is not A, B, C or 6 numbers: {1}'.format(lampGamut, e))
+                raise Exception('HUE: Plugin stopped due to configuration fault in plugin.conf')
+        self._numberHueLampTypes = len(self._gamuts)
+        self.Red = [gamut.red for gamut in self._gamuts]
+        self.Lime = [gamut.lime for gamut in self._gamuts]
+        self.Blue = [gamut.blue for gamut in self._gamuts]
+        if numpy is not None:
+            # ecken der farbräume für die vektorielle umrechnung: lampentyp x (red, lime, blue) x (x, y)
+            self._gamutCorners = numpy.array([(gamut.red, gamut.lime, gamut.blue) for gamut in self._gamuts])
+        # tabelle der sRGB gamma kurve für die werte 0-255, damit muss bei der umrechnung nicht gerechnet werden
+        self._gammaTable = [self._gamma(value / 255.0) for value in range(256)]
+        # die ergebnisse der umrechnung rgb -> xy werden für wiederkehrende farben zwischengespeichert
+        self._xyCache = functools.lru_cache(maxsize=4096)(self._calculate_xy)
+        # beim stop wird der letzte stand der bridges mit der zuordnung der items in eine datei geschrieben, beim start
+        # werden die items sofort daraus gesetzt und dann im hintergrund mit den bridges abgeglichen
+        if state_cache.strip().lower() in ('on', 'true', 'yes', '1'):
+            self._stateCacheFile = os.path.join(self._sh.base_dir, 'var', 'cache', 'hue_state.json')
+        else:
+            self._stateCacheFile = None
+        self._reconcileThread = None
+        # nach einem schreibbefehl an eine lampe wird deren status nach der transitiontime plus read_after_write
+        # sekunden einzeln gelesen. mehrere befehle an die gleiche lampe lösen nur einen lesebefehl aus. 0 schaltet aus
+        self._readAfterWrite = float(read_after_write)
+        if self._readAfterWrite < 0:
+            self._readAfterWrite = 0
+        # die einzelabfragen laufen über eine warteschlange in einem thread. stehen mehrere lampen einer bridge an,
+        # werden sie mit einer abfrage von /lights gelesen. dazu die bei einer abfrage zusätzlich zu setzenden items:
+        # (bridge, resource, id) -> {attribut: item}
+        self._refreshQueue = HueRefreshQueue('hue-refresh', self._refresh_objects)
+        self._refreshItems = {}
+        self._refreshLock = threading.Lock()
+        # effekte, die das plugin selbst rechnet. die standard bildrate pro effekt, die bilder werden mit einer
+        # transitiontime von einem bildabstand gesendet, den übergang dazwischen rechnet die lampe
+        self._effectFunctions = {'candle': self._effect_candle, 'sunrise': self._effect_sunrise, 'sweep': self._effect_sweep}
+        self._effectFps = {'candle': 5.0, 'sunrise': 1.0, 'sweep': 2.0}
+        self._effectIds = itertools.count(1)
+        # lampen mit laufendem effekt, sie werden nach einem schreibbefehl nicht einzeln zurückgelesen
+        self._effectLamps = set()
+        self._effectEngine = HueEffectEngine('hue-effects', self._render_effect, self._finish_effect)
+        # event stream der bridges: 'on' liest den stream über https direkt von der bridge, 'http' ohne verschlüsselung
+        # (z.b. für test bridges). solange der stream verbunden ist, werden lampen und gruppen dieser bridge nur noch
+        # im zyklus cycle_lamps_stream zur sicherheit abgefragt
+        self._eventStreamScheme = {'on': 'https', 'true': 'https', 'https': 'https', 'http': 'http'}.get(event_stream.strip().lower())
+        self._cycle_lamps_stream = int(cycle_lamps_stream)
+        if self._cycle_lamps_stream < self._cycle_lamps:
+            self._cycle_lamps_stream = self._cycle_lamps
+        self._eventStreams = {}
+        self._streamPollNext = {}
+        if self._eventStreamScheme is not None:
+            for numberBridgeId in range(self._numberHueBridges):
+                hueBridgeId = str(numberBridgeId)
+                self._eventStreams[hueBridgeId] = HueEventStream('hue-events-' + hueBridgeId, self._get_event_stream_url(hueBridgeId), self._hue_user[numberBridgeId], self._get_event_method(hueBridgeId))
+        # aktueller abfragezyklus und zeitpunkt der nächsten abfrage der lampen und gruppen pro bridge
+        self._pollIntervals = {}
+        self._pollNext = {}
+        # zeitpunkt, ab dem beim poll_mode = full die konfiguration wieder auf die items übertragen wird
+        self._configNext = {}
+        for numberBridgeId in range(self._numberHueBridges):
+            self._pollIntervals[str(numberBridgeId)] = self._cycle_lamps
+            self._pollNext[str(numberBridgeId)] = 0
+            self._configNext[str(numberBridgeId)] = 0
         # Konfigurationen zur laufzeit
-        # scheduler für das polling der status der lampen über die hue bridge
-        self._sh.scheduler.add('hue-update-lamps', self._update_lamps, cycle = self._cycle_lamps)
-        # scheduler für das polling der status der lampen über die hue bridge
-        # cycle groups ist gleich dem cycle für die lamps
-        self._sh.scheduler.add('hue-update-groups', self._update_groups, cycle = self._cycle_lamps)
-        # scheduler für das polling der status der hue bridge
-        self._sh.scheduler.add('hue-update-bridges', self._update_bridges, cycle = self._cycle_bridges)
+        if self._cycle_lamps_fast > 0:
+            # beim adaptiven polling läuft der scheduler im schnellen zyklus und es werden nur die bridges abgefragt,
+            # deren zyklus abgelaufen ist. lampen und gruppen werden dabei zusammen abgefragt
+            self._sh.scheduler.add('hue-update-lamps', self._update_lamps_adaptive, cycle = self._cycle_lamps_fast)
+        elif self._pollMode == 'full':
+            # scheduler für das polling des gesamten status, lampen, gruppen und bridge in einer abfrage
+            self._sh.scheduler.add('hue-update-lamps', self._update_full, cycle = self._cycle_lamps)
+        else:
+            # scheduler für das polling der status der lampen über die hue bridge
+            self._sh.scheduler.add('hue-update-lamps', self._update_lamps, cycle = self._cycle_lamps)
+            # scheduler für das polling der status der lampen über die hue bridge
+            # cycle groups ist gleich dem cycle für die lamps
+            self._sh.scheduler.add('hue-update-groups', self._update_groups, cycle = self._cycle_lamps)
+        if self._pollMode == 'split':
+            # scheduler für das polling der status der hue bridge
+            self._sh.scheduler.add('hue-update-bridges', self._update_bridges, cycle = self._cycle_bridges)
+        # scheduler für das erneute lesen der statischen attribute
+        if self._cycle_static > 0:
+            self._sh.scheduler.add('hue-update-static', self.refresh_static, cycle = self._cycle_static)
 
     ### following the library parts of the rewritten topics
     def crossProduct(self, p1, p2):
         return (p1.x * p2.y - p1.y * p2.x)
     def checkPointInLampsReach(self, p, lampType):
-        v1 = XY(self.Lime[lampType].x - self.Red[lampType].x, self.Lime[lampType].y - self.Red[lampType].y)
-        v2 = XY(self.Blue[lampType].x - self.Red[lampType].x, self.Blue[lampType].y - self.Red[lampType].y)
-        q = XY(p.x - self.Red[lampType].x, p.y - self.Red[lampType].y)
-        s = self.crossProduct(q, v2) / self.crossProduct(v1, v2)
-        t = self.crossProduct(v1, q) / self.crossProduct(v1, v2)
-        return (s >= 0.0) and (t >= 0.0) and (s + t <= 1.0)
+        return self._gamuts[lampType].contains(p.x, p.y)
     def getClosestPointToLine(self, A, B, P):
         AP = XY(P.x - A.x, P.y - A.y)
         AB = XY(B.x - A.x, B.y - A.y)
@@ -152,31 +1367,23 @@ class HUE():
             t = 1.0
         return XY(A.x + AB.x * t, A.y + AB.y * t)
     def getClosestPointToPoint(self, xyPoint, lampType):
-        pAB = self.getClosestPointToLine(self.Red[lampType], self.Lime[lampType], xyPoint)
-        pAC = self.getClosestPointToLine(self.Blue[lampType], self.Red[lampType], xyPoint)
-        pBC = self.getClosestPointToLine(self.Lime[lampType], self.Blue[lampType], xyPoint)
-        dAB = self.getDistanceBetweenTwoPoints(xyPoint, pAB)
-        dAC = self.getDistanceBetweenTwoPoints(xyPoint, pAC)
-        dBC = self.getDistanceBetweenTwoPoints(xyPoint, pBC)
-        lowest = dAB
-        closestPoint = pAB
-        if (dAC < lowest):
-            lowest = dAC
-            closestPoint = pAC
-        if (dBC < lowest):
-            lowest = dBC
-            closestPoint = pBC
-        cx = closestPoint.x
-        cy = closestPoint.y
-        return XY(cx, cy)
+        return XY(*self._gamuts[lampType].closest(xyPoint.x, xyPoint.y))
     def getDistanceBetweenTwoPoints(self, one, two):
         dx = one.x - two.x
         dy = one.y - two.y
         return math.sqrt(dx * dx + dy * dy) 
-    def getXYPointFromRGB(self, red, green, blue, lampType):
-        r = ((red + 0.055) / (1.0 + 0.055))**2.4 if (red > 0.04045) else (red / 12.92)
-        g = ((green + 0.055) / (1.0 + 0.055))**2.4 if (green > 0.04045) else (green / 12.92)
-        b = ((blue + 0.055) / (1.0 + 0.055))**2.4 if (blue > 0.04045) else (blue / 12.92)
+    def _gamma(self, value):
+        return ((value + 0.055) / (1.0 + 0.055))**2.4 if (value > 0.04045) else (value / 12.92)
+    def _calculate_xy(self, red, green, blue, lampType):
+        # rgb werte 0-255, ganzzahlige werte kommen aus der gamma tabelle
+        if isinstance(red, int) and isinstance(green, int) and isinstance(blue, int):
+            r = self._gammaTable[red]
+            g = self._gammaTable[green]
+            b = self._gammaTable[blue]
+        else:
+            r = self._gamma(red / 255.0)
+            g = self._gamma(green / 255.0)
+            b = self._gamma(blue / 255.0)
         X = r * 0.4360747 + g * 0.3850649 + b * 0.0930804
         Y = r * 0.2225045 + g * 0.7168786 + b * 0.0406169
         Z = r * 0.0139322 + g * 0.0971045 + b * 0.7141733
@@ -185,44 +1392,220 @@ class HUE():
         else:
             cx = X / (X + Y + Z)
             cy = Y / (X + Y + Z)
-        xyPoint = XY(cx, cy)
-        inReachOfLamps = self.checkPointInLampsReach(xyPoint, lampType)
-        if not inReachOfLamps:
-            xyPoint = self.getClosestPointToPoint(xyPoint, lampType)
-        return [xyPoint.x, xyPoint.y]
+        return self._gamuts[lampType].fit(cx, cy)
+    def getXYPointFromRGB(self, red, green, blue, lampType):
+        # rgb werte im bereich 0-255, rückgabe [x, y] im farbraum der lampe
+        return list(self._xyCache(red, green, blue, lampType))
+    def getXYPointsFromRGB(self, rgbValues, lampTypes=0):
+        # umrechnung vieler rgb werte (liste von (r, g, b) oder numpy array n x 3, werte 0-255) in einem durchlauf.
+        # lampTypes ist ein lampentyp für alle oder eine liste mit einem lampentyp pro farbe.
+        # zurückgegeben wird immer eine liste von [x, y], mit numpy wird vektoriell gerechnet
+        if numpy is None:
+            if isinstance(lampTypes, int):
+                lampTypes = [lampTypes] * len(rgbValues)
+            return [self.getXYPointFromRGB(red, green, blue, lampType) for (red, green, blue), lampType in zip(rgbValues, lampTypes)]
+        rgb = numpy.clip(numpy.rint(numpy.asarray(rgbValues, dtype=float)), 0, 255).astype(int).reshape(-1, 3)
+        linear = numpy.asarray(self._gammaTable)[rgb]
+        XYZ = linear.dot(numpy.array([[0.4360747, 0.2225045, 0.0139322], [0.3850649, 0.7168786, 0.0971045], [0.0930804, 0.0406169, 0.7141733]]))
+        total = XYZ.sum(axis=1)
+        total[total == 0] = 1.0
+        points = XYZ[:, :2] / total[:, None]
+        lampTypes = numpy.broadcast_to(numpy.asarray(lampTypes, dtype=int), (len(points),))
+        red = self._gamutCorners[lampTypes, 0]
+        lime = self._gamutCorners[lampTypes, 1]
+        blue = self._gamutCorners[lampTypes, 2]
+        v1 = lime - red
+        v2 = blue - red
+        q = points - red
+        denominator = v1[:, 0] * v2[:, 1] - v1[:, 1] * v2[:, 0]
+        s = (q[:, 0] * v2[:, 1] - q[:, 1] * v2[:, 0]) / denominator
+        t = (v1[:, 0] * q[:, 1] - v1[:, 1] * q[:, 0]) / denominator
+        outside = ~((s >= 0.0) & (t >= 0.0) & (s + t <= 1.0))
+        if outside.any():
+            p = points[outside]
+            closest = None
+            lowest = None
+            for a, b in ((red, lime), (blue, red), (lime, blue)):
+                a = a[outside]
+                ab = b[outside] - a
+                t = numpy.clip(((p - a) * ab).sum(axis=1) / (ab * ab).sum(axis=1), 0.0, 1.0)
+                candidate = a + ab * t[:, None]
+                distance = ((p - candidate) ** 2).sum(axis=1)
+                if closest is None:
+                    closest = candidate
+                    lowest = distance
+                else:
+                    nearer = distance < lowest
+                    closest[nearer] = candidate[nearer]
+                    lowest[nearer] = distance[nearer]
+            points[outside] = closest
+        return points.tolist()
     ### end of library files
     
     def run(self):
         self.alive = True
+        if self._asyncTransport is not None:
+            self._asyncTransport.start()
+        for numberBridgeId in range(self._numberHueBridges):
+            # die erste abfrage erfolgt gleich beim nächsten scheduler aufruf
+            self._set_poll_interval(str(numberBridgeId), self._cycle_lamps)
+            self._pollNext[str(numberBridgeId)] = 0
+        for commandQueue in self._commandQueues.values():
+            commandQueue.start()
+        for eventStream in self._eventStreams.values():
+            eventStream.start()
+        self._refreshQueue.start()
+        self._effectEngine.start()
+        if self._stateCacheFile is not None and self._load_state_cache():
+            # abgleich mit den bridges, ohne auf den scheduler zu warten
+            self._reconcileThread = threading.Thread(target=self._reconcile, name='hue-reconcile')
+            self._reconcileThread.start()
         # if you want to create child threads, do not make them daemon = True!
         # They will not shutdown properly. (It's a python bug)
 
     def stop(self):
         self.alive = False
+        self._effectEngine.stop()
+        for commandQueue in self._commandQueues.values():
+            commandQueue.stop()
+        for eventStream in self._eventStreams.values():
+            eventStream.stop()
+        if self._pollExecutor is not None:
+            self._pollExecutor.shutdown(wait=False)
+        if self._asyncTransport is not None:
+            self._asyncTransport.stop()
+        with self._connectionPoolsLock:
+            for pool in self._connectionPools.values():
+                pool.close()
+        self._refreshQueue.stop()
+        if self._reconcileThread is not None:
+            self._reconcileThread.join()
+            self._reconcileThread = None
+        if self._stateCacheFile is not None:
+            self._save_state_cache()
+
+    def _get_cache_routing(self):
+        # zuordnung der items zu den werten der bridges: [item, bridge, resource, id, attribut]
+        routing = []
+        for (hueBridgeId, hueLampId), hueRoutes in self._listenLampRoutes.items():
+            routing.extend([returnItem.id(), hueBridgeId, 'lights', hueLampId, hueObjectItem] for hueObjectItem, (returnItem, typecast) in hueRoutes.items())
+        for (hueBridgeId, hueGroupId), hueRoutes in self._listenGroupRoutes.items():
+            routing.extend([returnItem.id(), hueBridgeId, 'groups', hueGroupId, hueObjectItem] for hueObjectItem, (returnItem, typecast) in hueRoutes.items())
+        for hueBridgeId, hueRoutes in self._listenBridgeRoutes.items():
+            routing.extend([returnItem.id(), hueBridgeId, 'config', hueBridgeId, hueObjectItem] for hueObjectItem, (returnItem, typecast) in hueRoutes.items())
+        for (hueBridgeId, hueResource, hueObjectId), hueRoutes in self._listenStaticRoutes.items():
+            routing.extend([returnItem.id(), hueBridgeId, hueResource, hueObjectId, hueObjectItem] for hueObjectItem, (returnItem, typecast) in hueRoutes.items())
+        return routing
+
+    def _save_state_cache(self):
+        # letzter stand der bridges und die zuordnung der items. die whitelist enthält die zugangsschlüssel
+        # aller anwendungen und wird nicht gespeichert
+        bridges = {}
+        for hueBridgeId, hueBridgeSnapshot in self._bridgeSnapshots.items():
+            with self._bridge_lock(hueBridgeId):
+                config = dict((hueKey, value) for hueKey, value in hueBridgeSnapshot['config'].items() if hueKey != 'whitelist')
+                bridges[hueBridgeId] = {'hue_ip': self._hue_ip[int(hueBridgeId)], 'lights': hueBridgeSnapshot['lights'], 'groups': hueBridgeSnapshot['groups'], 'config': config}
+        try:
+            os.makedirs(os.path.dirname(self._stateCacheFile), exist_ok=True)
+            with open(self._stateCacheFile + '.tmp', 'w', encoding='utf-8') as cacheFile:
+                json.dump({'version': 1, 'time': time.time(), 'bridges': bridges, 'routing': self._get_cache_routing()}, cacheFile, separators=(',', ':'))
+            os.replace(self._stateCacheFile + '.tmp', self._stateCacheFile)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning('HUE: _save_state_cache: could not write state cache {0}: {1}'.format(self._stateCacheFile, e))
+
+    def _load_state_cache(self):
+        # setzt die items aus dem gespeicherten stand. es werden nur items gesetzt, deren zuordnung gleich geblieben
+        # ist, und nur bridges mit gleicher ip. liefert True, wenn etwas geladen wurde
+        try:
+            with open(self._stateCacheFile, 'rb') as cacheFile:
+                stateCache = self._jsonLoads(cacheFile.read())
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning('HUE: _load_state_cache: could not read state cache {0}: {1}'.format(self._stateCacheFile, e))
+            return False
+        if not isinstance(stateCache, dict) or stateCache.get('version') != 1:
+            return False
+        cachedRouting = set(tuple(route) for route in stateCache.get('routing', ()))
+        loaded = False
+        for hueBridgeId, cachedBridge in stateCache.get('bridges', {}).items():
+            if hueBridgeId not in self._bridgeSnapshots or cachedBridge.get('hue_ip') != self._hue_ip[int(hueBridgeId)]:
+                continue
+            self._preload_bridge(hueBridgeId, cachedBridge, cachedRouting)
+            loaded = True
+        if loaded:
+            logger.info('HUE: _load_state_cache: items preloaded from state cache of {0}'.format(time.ctime(stateCache.get('time', 0))))
+        return loaded
+
+    def _preload_bridge(self, hueBridgeId, cachedBridge, cachedRouting):
+        def cachedRoutes(hueResource, hueObjectId, hueRoutes):
+            return dict((hueObjectItem, route) for hueObjectItem, route in hueRoutes.items() if (route[0].id(), hueBridgeId, hueResource, hueObjectId, hueObjectItem) in cachedRouting)
+        with self._bridge_lock(hueBridgeId):
+            self._bridgeSnapshots[hueBridgeId] = {'lights': cachedBridge.get('lights', {}), 'groups': cachedBridge.get('groups', {}), 'config': cachedBridge.get('config', {})}
+            hueObjects = self._bridgeSnapshots[hueBridgeId]
+            self._groupMembers[hueBridgeId] = dict((hueGroupId, frozenset(hueGroupIdValues.get('lights', ()))) for hueGroupId, hueGroupIdValues in hueObjects['groups'].items())
+            for (routeBridgeId, hueLampId), hueRoutes in self._listenLampRoutes.items():
+                if routeBridgeId == hueBridgeId and hueLampId in hueObjects['lights']:
+                    self._apply_routes(hueBridgeId, 'lights', hueLampId, cachedRoutes('lights', hueLampId, hueRoutes), hueObjects['lights'][hueLampId], ('state',))
+            for (routeBridgeId, hueGroupId), hueRoutes in self._listenGroupRoutes.items():
+                if routeBridgeId == hueBridgeId and hueGroupId in hueObjects['groups']:
+                    self._apply_routes(hueBridgeId, 'groups', hueGroupId, cachedRoutes('groups', hueGroupId, hueRoutes), hueObjects['groups'][hueGroupId], ('state', 'action'))
+            if hueBridgeId in self._listenBridgeRoutes and hueObjects['config']:
+                self._apply_routes(hueBridgeId, 'config', hueBridgeId, cachedRoutes('config', hueBridgeId, self._listenBridgeRoutes[hueBridgeId]), hueObjects['config'])
+            # die statischen werte bleiben ausstehend, damit sie mit der ersten abfrage abgeglichen werden
+            for (routeBridgeId, hueResource, hueObjectId), hueRoutes in self._listenStaticRoutes.items():
+                hueObjectValues = hueObjects[hueResource].get(hueObjectId) if hueResource != 'config' else hueObjects['config']
+                if routeBridgeId == hueBridgeId and hueObjectValues:
+                    self._apply_routes(hueBridgeId, hueResource + '.static', hueObjectId, cachedRoutes(hueResource, hueObjectId, hueRoutes), hueObjectValues)
+
+    def _reconcile(self):
+        # erste abfrage aller bridges nach dem laden des gespeicherten stands. die items werden dabei nur noch
+        # geschrieben, wenn sich der wert gegenüber dem gespeicherten stand geändert hat
+        self._poll_bridges(self._reconcile_bridge)
+
+    def _reconcile_bridge(self, hueBridgeId):
+        if self._pollMode == 'full':
+            self._configNext[hueBridgeId] = 0
+            self._update_full_bridge(hueBridgeId)
+        else:
+            self._update_lamps_bridge(hueBridgeId)
+            self._update_groups_bridge(hueBridgeId)
+            self._update_bridges_bridge(hueBridgeId)
         
-    def _find_item_attribute(self, item, attribute, attributeDefault, attributeLimit=99):
-        # zwischenspeichern für die loggerausgabe
-        itemSearch = item
+    def _find_item_attribute(self, item, attribute, attributeDefault, attributeLimit=None):
+        return self._find_item_attributes(item, [(attribute, attributeDefault, attributeLimit)])[0]
+
+    def _find_item_attributes(self, item, attributes):
+        # sucht mehrere attribute (attribut, default, grenze) in einem durchgang vom item bis zur wurzel
+        # und liefert die werte in der gleichen reihenfolge
+        itemAttributes = {}
         # schleife bis ich ganz oben angekommen bin
-        while (not attribute in itemSearch.conf):
+        itemSearch = item
+        while itemSearch is not self._sh and len(itemAttributes) < len(attributes):
+            for attribute, attributeDefault, attributeLimit in attributes:
+                if attribute not in itemAttributes and attribute in itemSearch.conf:
+                    itemAttributes[attribute] = itemSearch.conf[attribute]
             # eine Stufe in den ebenen nach oben
-            itemSearch = itemSearch.return_parent()                    
-            if (itemSearch is self._sh):
-                # wir sind am root knoten angekommen und haben nichts gefunden !
-                if attribute == 'hue_bridge_id' and self._numberHueBridges > 1:
-                    logger.warning('HUE: _find_item_attribute: could not find [{0}] for item [{1}], setting defined default value {2}'.format(attribute, item, attributeDefault))
-                elif attribute == 'hue_lamp_type':
-                    logger.warning('HUE: _find_item_attribute: could not find [{0}] for item [{1}], setting defined default value {2}'.format(attribute, item, attributeDefault))
-                elif attribute == 'hue_lamp_id':
-                    logger.error('HUE: _find_item_attribute: could not find [{0}] for item [{1}], an value has to be defined'.format(attribute, item))
-                    raise Exception('HUE: Plugin stopped due to missing hue_lamp_id in item.conf')
-                # wenn nicht gefunden, dann wird der standardwert zurückgegeben
-                return str(attributeDefault)
-        itemAttribute = int(itemSearch.conf[attribute])
-        if itemAttribute >= attributeLimit:
-            itemAttribute = attributeLimit
+            itemSearch = itemSearch.return_parent()
+        return [self._check_item_attribute(item, attribute, itemAttributes.get(attribute), attributeDefault, attributeLimit) for attribute, attributeDefault, attributeLimit in attributes]
+
+    def _check_item_attribute(self, item, attribute, itemAttribute, attributeDefault, attributeLimit):
+        if itemAttribute is None:
+            # wir sind am root knoten angekommen und haben nichts gefunden !
+            if attribute == 'hue_bridge_id' and self._numberHueBridges > 1:
+                logger.warning('HUE: _find_item_attribute: could not find [{0}] for item [{1}], setting defined default value {2}'.format(attribute, item, attributeDefault))
+            elif attribute == 'hue_lamp_type':
+                logger.warning('HUE: _find_item_attribute: could not find [{0}] for item [{1}], setting defined default value {2}'.format(attribute, item, attributeDefault))
+            elif attribute == 'hue_lamp_id':
+                logger.error('HUE: _find_item_attribute: could not find [{0}] for item [{1}], an value has to be defined'.format(attribute, item))
+                raise Exception('HUE: Plugin stopped due to missing hue_lamp_id in item.conf')
+            # wenn nicht gefunden, dann wird der standardwert zurückgegeben
+            return str(attributeDefault)
+        itemAttribute = int(itemAttribute)
+        # lampen und gruppen ids haben keine grenze, lampentypen und bridges müssen existieren
+        if attributeLimit is not None and itemAttribute >= attributeLimit:
+            itemAttribute = attributeLimit - 1
             logger.warning('HUE: _find_item_attribute: attribute [{0}] exceeds upper limit and set to default in item [{1}]'.format(attribute,item))
-#        logger.warning('HUE: _find_item_attribute: attribute [{0}] found for item [{1}] at item [{2}]'.format(attribute, item, itemSearch))
         return str(itemAttribute)
     
     def parse_item(self, item):
@@ -238,21 +1621,28 @@ class HUE():
             if not 'hue_dim_time' in item.conf:
                 item.conf['hue_dim_time'] = '1'
                 logger.warning('HUE: dimmenDPT3: no hue_dim_time defined in item [{0}] using default 1'.format(item))
+            # ist das übergeordnete item ein hue send item, dann wird direkt in der bridge gedimmt. dafür werden die
+            # ids gebraucht, bei allen anderen items wird über fade gedimmt
+            parentItem = item.return_parent()
+            if parentItem.conf.get('hue_send') in self._dimmKeys:
+                item.conf['hue_lamp_id'], item.conf['hue_bridge_id'] = self._find_item_attributes(item, [('hue_lamp_id', 1, None), ('hue_bridge_id', 0, self._numberHueBridges)])
+            elif parentItem.conf.get('hue_send_group') in self._dimmKeys:
+                item.conf['hue_group_id'], item.conf['hue_bridge_id'] = self._find_item_attributes(item, [('hue_group_id', 1, None), ('hue_bridge_id', 0, self._numberHueBridges)])
             return self.dimmenDPT3
 
         if 'hue_listen' in item.conf:
             hueListenCommand = item.conf['hue_listen']
             if hueListenCommand in self._listenLampKeys:
                 # wir haben ein sendekommando für die lampen. dafür brauchen wir die bridge und die lampen id
-                hueLampId = self._find_item_attribute(item, 'hue_lamp_id', 1)
-                hueLampType = self._find_item_attribute(item, 'hue_lamp_type', 0, self._numberHueLampTypes)
-                hueBridgeId = self._find_item_attribute(item, 'hue_bridge_id', 0, self._numberHueBridges)
+                hueLampId, hueLampType, hueBridgeId = self._find_item_attributes(item, [('hue_lamp_id', 1, None), ('hue_lamp_type', 0, self._numberHueLampTypes), ('hue_bridge_id', 0, self._numberHueBridges)])
                 item.conf['hue_lamp_id'] = hueLampId
                 item.conf['hue_lamp_type'] = hueLampType
                 item.conf['hue_bridge_id'] = hueBridgeId
+                self._lampTypes[(hueBridgeId, hueLampId)] = int(hueLampType)
                 hueIndex = hueBridgeId + '.' + hueLampId + '.' + hueListenCommand
                 if not hueIndex in self._listenLampItems:
                     self._listenLampItems[hueIndex] = item
+                    self._add_listen_route(hueBridgeId, 'lights', hueLampId, hueListenCommand, item)
                 else:
                     logger.warning('HUE: parse_item: in lamp item [{0}] command hue_listen = {1} is duplicated to item  [{2}]'.format(item,hueListenCommand,self._listenLampItems[hueIndex]))
             elif hueListenCommand in self._listenBridgeKeys:
@@ -262,6 +1652,12 @@ class HUE():
                 hueIndex = hueBridgeId + '.' + hueListenCommand
                 if not hueIndex in self._listenBridgeItems:
                     self._listenBridgeItems[hueIndex] = item
+                    hueConfigKey = self._bridgeConfigKeys.get(hueListenCommand, hueListenCommand)
+                    if hueListenCommand in self._staticBridgeKeys:
+                        self._listenStaticRoutes.setdefault((hueBridgeId, 'config', hueBridgeId), {})[hueConfigKey] = (item, self._get_typecast(hueListenCommand))
+                        self._staticPending.add((hueBridgeId, 'config', hueBridgeId))
+                    else:
+                        self._listenBridgeRoutes.setdefault(hueBridgeId, {})[hueConfigKey] = (item, self._get_typecast(hueListenCommand))
                 else:
                     logger.warning('HUE: parse_item: in bridge item [{0}] command hue_listen = {1} is duplicated to item  [{2}]'.format(item,hueListenCommand,self._listenLampItems[hueIndex]))
             else:
@@ -272,13 +1668,13 @@ class HUE():
             hueListenGroupCommand = item.conf['hue_listen_group']
             if hueListenGroupCommand in self._listenGroupKeys:
                 # wir haben ein sendekommando für die lampen. dafür brauchen wir die bridge und die lampen id
-                hueGroupId = self._find_item_attribute(item, 'hue_group_id', 1)
-                hueBridgeId = self._find_item_attribute(item, 'hue_bridge_id', 0, self._numberHueBridges)
+                hueGroupId, hueBridgeId = self._find_item_attributes(item, [('hue_group_id', 1, None), ('hue_bridge_id', 0, self._numberHueBridges)])
                 item.conf['hue_group_id'] = hueGroupId
                 item.conf['hue_bridge_id'] = hueBridgeId
                 hueIndex = hueBridgeId + '.' + hueGroupId + '.' + hueListenGroupCommand
                 if not hueIndex in self._listenGroupItems:
                     self._listenGroupItems[hueIndex] = item
+                    self._add_listen_route(hueBridgeId, 'groups', hueGroupId, hueListenGroupCommand, item)
                 else:
                     logger.warning('HUE: parse_item: in group item [{0}] command hue_listen_group = {1} is duplicated to item  [{2}]'.format(item,hueListenGroupCommand,self._listenGroupItems[hueIndex]))
         
@@ -286,17 +1682,17 @@ class HUE():
             hueSendCommand = item.conf['hue_send']
             if hueSendCommand in self._sendLampKeys:
                 # wir haben ein sendekommando für die lampen. dafür brauchen wir die bridge und die lampen id
-                hueLampId = self._find_item_attribute(item, 'hue_lamp_id', 1)
-                hueLampType = self._find_item_attribute(item, 'hue_lamp_type', 0, self._numberHueLampTypes)
-                hueBridgeId = self._find_item_attribute(item, 'hue_bridge_id', 0, self._numberHueBridges)
+                hueLampId, hueLampType, hueBridgeId = self._find_item_attributes(item, [('hue_lamp_id', 1, None), ('hue_lamp_type', 0, self._numberHueLampTypes), ('hue_bridge_id', 0, self._numberHueBridges)])
                 item.conf['hue_lamp_id'] = hueLampId
                 item.conf['hue_lamp_type'] = hueLampType
                 item.conf['hue_bridge_id'] = hueBridgeId
+                self._lampTypes[(hueBridgeId, hueLampId)] = int(hueLampType)
                 hueIndex = hueBridgeId + '.' + hueLampId + '.' + hueSendCommand
                 if not hueIndex in self._sendLampItems:
                     self._sendLampItems[hueIndex] = item
                 else:
                     logger.warning('HUE: parse_item: in lamp item [{0}] command hue_send = {1} is duplicated to item  [{2}]'.format(item,hueSendCommand,self._sendLampItems[hueIndex]))
+                self._itemBindings[id(item)] = HueItemBinding(hueBridgeId, hueLampId, hueSendCommand, int(hueLampType), self._get_transition_time(item), self._get_value_range(hueSendCommand))
                 return self.update_lamp_item
             elif hueSendCommand in self._sendBridgeKeys:
                 # hier brauche ich nur eine hue_bridge_id
@@ -306,7 +1702,8 @@ class HUE():
                 if not hueIndex in self._sendBridgeItems:
                     self._sendBridgeItems[hueIndex] = item
                 else:
-                    logger.warning('HUE: parse_item: in bridge item [{0}] command hue_send = {1} is duplicated to item  [{2}]'.format(item,hueSendCommand,self._sendLampItems[hueIndex]))
+                    logger.warning('HUE: parse_item: in bridge item [{0}] command hue_send = {1} is duplicated to item  [{2}]'.format(item,hueSendCommand,self._sendBridgeItems[hueIndex]))
+                self._itemBindings[id(item)] = HueItemBinding(hueBridgeId, None, hueSendCommand, valueRange=self._get_value_range(hueSendCommand, False, False))
                 return self.update_bridge_item
             else:
                 logger.error('HUE: parse_item: command hue_send = {0} not defined in item [{1}]'.format(hueSendCommand,item))
@@ -316,8 +1713,7 @@ class HUE():
             hueSendGroupCommand = item.conf['hue_send_group']
             if hueSendGroupCommand in self._sendGroupKeys:
                 # wir haben ein sendekommando für die lampen. dafür brauchen wir die bridge und die group id
-                hueGroupId = self._find_item_attribute(item, 'hue_group_id', 1)
-                hueBridgeId = self._find_item_attribute(item, 'hue_bridge_id', 0, self._numberHueBridges)
+                hueGroupId, hueBridgeId = self._find_item_attributes(item, [('hue_group_id', 1, None), ('hue_bridge_id', 0, self._numberHueBridges)])
                 item.conf['hue_group_id'] = hueGroupId
                 item.conf['hue_bridge_id'] = hueBridgeId
                 hueIndex = hueBridgeId + '.' + hueGroupId + '.' + hueSendGroupCommand
@@ -325,8 +1721,72 @@ class HUE():
                     self._sendGroupItems[hueIndex] = item
                 else:
                     logger.warning('HUE: parse_item: in group item [{0}] command hue_send_group = {1} is duplicated to item  [{2}]'.format(item,hueSendGroupCommand,self._sendGroupItems[hueIndex]))
+                self._itemBindings[id(item)] = HueItemBinding(hueBridgeId, hueGroupId, hueSendGroupCommand, transitionTime=self._get_transition_time(item), valueRange=self._get_value_range(hueSendGroupCommand, False))
                 return self.update_group_item
 
+    def _add_listen_route(self, hueBridgeId, hueResource, hueObjectId, hueListenCommand, item):
+        # trägt das item in die routing tabelle der lampe oder gruppe ein, statische attribute in die eigene tabelle
+        if hueListenCommand in self._staticKeys:
+            self._listenStaticRoutes.setdefault((hueBridgeId, hueResource, hueObjectId), {})[hueListenCommand] = (item, self._get_typecast(hueListenCommand))
+            self._staticPending.add((hueBridgeId, hueResource, hueObjectId))
+        elif hueResource == 'lights':
+            self._listenLampRoutes.setdefault((hueBridgeId, hueObjectId), {})[hueListenCommand] = (item, self._get_typecast(hueListenCommand))
+        else:
+            self._listenGroupRoutes.setdefault((hueBridgeId, hueObjectId), {})[hueListenCommand] = (item, self._get_typecast(hueListenCommand))
+
+    def _get_transition_time(self, item):
+        # übergangszeit des items in 1/10 sekunden, wie sie an die bridge gesendet wird
+        if 'hue_transitionTime' in item.conf:
+            return int(float(item.conf['hue_transitionTime']) * 10)
+        return int(self._hueDefaultTransitionTime * 10)
+
+    def _get_value_range(self, hueSend, signedRanges=True, ctRange=True):
+        # wertegrenzen, die die bridge verstehen kann. bei gruppen und bridges werden wie bisher die relativen werte
+        # nicht begrenzt
+        if hueSend in self._rangeInteger8:
+            # werte dürfen zwischen 0 und 255 liegen
+            return (0, 255)
+        if hueSend in self._rangeInteger16:
+            # hue darf zwischen 0 und 65535 liegen
+            return (0, 65535)
+        if ctRange and hueSend == 'ct':
+            # ct darf zwischen 153 und 500 liegen
+            return (153, 500)
+        if signedRanges and hueSend in self._rangeSignedInteger8:
+            # werte dürfen zwischen -254 und 254 liegen
+            return (-254, 254)
+        if signedRanges and hueSend in self._rangeSignedInteger16:
+            # hue darf zwischen -65534 und 65534 liegen
+            return (-65534, 65534)
+        return None
+
+    def _limit_command_value(self, hueSend, value):
+        # begrenzung der in der warteschlange zusammengefassten werte, hue läuft im kreis
+        if hueSend == 'hue':
+            return int(value) % 65536
+        valueRange = self._get_value_range(hueSend)
+        if valueRange is None:
+            return value
+        return self._limit_range_int(value, valueRange[0], valueRange[1])
+
+    def _get_siblings(self, binding, hueSendItems, hueSiblingKeys):
+        # die items für on, bri und rgb der gleichen lampe / gruppe werden beim ersten schreiben gesucht, dann sind
+        # alle items geparst, und danach in der bindung gehalten
+        if binding.siblings is None:
+            binding.siblings = dict((hueSiblingKey, hueSendItems.get(binding.hueIndex + '.' + hueSiblingKey)) for hueSiblingKey in hueSiblingKeys)
+        return binding.siblings
+
+    def _get_typecast(self, hueObjectItem):
+        # liefert den typecast für ein attribut, wird einmal beim parsen bestimmt und im routing index abgelegt
+        if hueObjectItem in self._boolKeys:
+            return bool
+        elif hueObjectItem in self._stringKeys:
+            return str
+        elif hueObjectItem in self._dictKeys:
+            return dict
+        else:
+            return int
+
     def _limit_range_int(self, value, minValue, maxValue):
         # kurze routine zur wertebegrenzung
         if value >= maxValue:
@@ -342,84 +1802,67 @@ class HUE():
         # im konkreten fall heisst das, dass der aktuelle status der betroffene lampe komplett zusammengestellt wird
         # und anschliessen neu über die hue bridge gesetzt wird.
         if caller != 'HUE':
-            # lokale speicherung in variablen, damit funktionen nicht immer aufgerufen werden (performance)
+            # alle daten des items wurden in parse_item vorbereitet, es wird nichts mehr gesucht
+            binding = self._itemBindings[id(item)]
+            priority = self._get_priority(caller)
             value = item()
-            hueBridgeId = item.conf['hue_bridge_id']
-            hueLampId = item.conf['hue_lamp_id']
-            hueLampType = item.conf['hue_lamp_type']
-            hueSend = item.conf['hue_send']
-            if 'hue_transitionTime' in item.conf:
-                hueTransitionTime = int(float(item.conf['hue_transitionTime']) * 10)
-            else:
-                hueTransitionTime = int(self._hueDefaultTransitionTime * 10)
+            hueBridgeId = binding.hueBridgeId
+            hueLampId = binding.hueObjectId
+            hueSend = binding.hueSend
+            hueTransitionTime = binding.transitionTime
+            siblings = self._get_siblings(binding, self._sendLampItems, self._lampSiblingKeys)
 
-            # index ist immer bridge_id + lamp_id + hue_send
-            hueIndex = hueBridgeId + '.' + hueLampId
-            
-            if hueIndex + '.on' in self._sendLampItems:
-                hueLampIsOn = self._sendLampItems[(hueIndex + '.on')]()
+            if siblings['on'] is not None:
+                hueLampIsOn = siblings['on']()
             else:
                 logger.warning('HUE: update_lamp_item: no item for on/off defined for bridge {0} lampe {1}'.format(hueBridgeId, hueLampId))
                 hueLampIsOn = False
                 
             # test aus die wertgrenzen, die die bridge verstehen kann
-            if hueSend in self._rangeInteger8:
-                # werte dürfen zwischen 0 und 255 liegen
-                value = self._limit_range_int(value, 0, 255)    
-            if hueSend in self._rangeSignedInteger8:
-                # werte dürfen zwischen -254 und 254 liegen
-                value = self._limit_range_int(value, -254, 254)    
-            if hueSend in self._rangeInteger16:
-                # hue darf zwischen 0 und 65535 liegen
-                value = self._limit_range_int(value, 0, 65535)    
-            if hueSend in self._rangeSignedInteger16:
-                # hue darf zwischen -65534 und 65534 liegen
-                value = self._limit_range_int(value, -65534, 65534)    
-            if hueSend == 'ct':
-                # ct darf zwischen 153 und 500 liegen
-                value = self._limit_range_int(value, 153, 500)
+            if binding.valueRange is not None:
+                value = self._limit_range_int(value, binding.valueRange[0], binding.valueRange[1])
                 
             if hueLampIsOn:
                 # lampe ist an (status in sh). dann können alle befehle gesendet werden
                 if hueSend == 'on':
                     # wenn der status in sh true ist, aber mit dem befehl on, dann muss die lampe auf der hue seite erst eingeschaltet werden
-                    if hueIndex + '.bri' in self._sendLampItems:
+                    if siblings['bri'] is not None:
                         # wenn eingeschaltet wird und ein bri item vorhanden ist, dann wird auch die hellgkeit
                         # mit gesetzt, weil die lmape das im ausgeschalteten zustand vergisst.
-                        self._set_lamp_state(hueBridgeId, hueLampId, {'on': True, 'bri': int(self._sendLampItems[(hueIndex + '.bri')]()) , 'transitiontime': hueTransitionTime})
+                        self._send_lamp_state(hueBridgeId, hueLampId, {'on': True, 'bri': int(siblings['bri']()) , 'transitiontime': hueTransitionTime}, priority)
                     else:
                         # ansonst wird nur eingeschaltet
-                        self._set_lamp_state(hueBridgeId, hueLampId, {'on': True , 'transitiontime': hueTransitionTime})
+                        self._send_lamp_state(hueBridgeId, hueLampId, {'on': True , 'transitiontime': hueTransitionTime}, priority)
                         logger.info('HUE: update_lamp_item: no bri item defined for restoring the brightness after swiching on again')                        
                 else:
                     # anderer befehl gegeben
                     if hueSend in self._rgbKeys:
                         # besonderheit ist der befehl für die rgb variante, da hier alle werte herausgesucht werden müssen
-                        if ((hueIndex + '.col_r') in self._sendLampItems) and ((hueIndex + '.col_g') in self._sendLampItems) and ((hueIndex + '.col_b') in self._sendLampItems):
+                        if siblings['col_r'] is not None and siblings['col_g'] is not None and siblings['col_b'] is not None:
                             # wertebereiche der anderen klären bri darf zwischen 0 und 255 liegen
-                            value_r = self._limit_range_int(self._sendLampItems[(hueIndex + '.col_r')](), 0, 255)    
-                            value_g = self._limit_range_int(self._sendLampItems[(hueIndex + '.col_g')](), 0, 255)    
-                            value_b = self._limit_range_int(self._sendLampItems[(hueIndex + '.col_b')](), 0, 255)    
+                            value_r = self._limit_range_int(siblings['col_r'](), 0, 255)    
+                            value_g = self._limit_range_int(siblings['col_g'](), 0, 255)    
+                            value_b = self._limit_range_int(siblings['col_b'](), 0, 255)    
 
-                            xyPoint = self.getXYPointFromRGB(value_r, value_g, value_b, int(hueLampType))
+                            xyPoint = self.getXYPointFromRGB(value_r, value_g, value_b, binding.hueLampType)
                             # und jetzt der wert setzen
-                            self._set_lamp_state(hueBridgeId, hueLampId, {'xy': xyPoint, 'transitiontime': hueTransitionTime})
+                            self._send_lamp_state(hueBridgeId, hueLampId, {'xy': xyPoint, 'transitiontime': hueTransitionTime}, priority)
                         else:
                             logger.warning('HUE: update_lamp_item: on or more of the col... items around item [{0}] is not defined'.format(item))
                     else:
                         # standardbefehle
-                        self._set_lamp_state(hueBridgeId, hueLampId, {hueSend: value, 'transitiontime': hueTransitionTime})
+                        self._send_lamp_state(hueBridgeId, hueLampId, {hueSend: value, 'transitiontime': hueTransitionTime}, priority)
             else:
                 # lampe ist im status bei sh aus. in diesem zustand sollten keine befehle gesendet werden
                 if hueSend == 'on':
                     # sonderfall, wenn der status die transition erst ausgeöst hat, dann muss die lampe
                     # auf der hue seite erst ausgeschaltet werden
-                    self._set_lamp_state(hueBridgeId, hueLampId, {'on': False , 'transitiontime': hueTransitionTime})
+                    self._send_lamp_state(hueBridgeId, hueLampId, {'on': False , 'transitiontime': hueTransitionTime}, priority)
                 else:
                     # die lampe kann auch über das senden bri angemacht werden
                     if hueSend == 'bri':
                         # jetzt wird die lampe eingeschaltet und der wert von bri auf den letzten wert gesetzt
-                        self._set_lamp_state(hueBridgeId, hueLampId, {'on': True , 'bri': value, 'transitiontime': hueTransitionTime})
+                        self._send_lamp_state(hueBridgeId, hueLampId, {'on': True , 'bri': value, 'transitiontime': hueTransitionTime}, priority)
                     else:
                         # ansonsten wird kein befehl abgesetzt !
                         pass
@@ -429,62 +1872,52 @@ class HUE():
         # im konkreten fall heisst das, dass der aktuelle status der betroffene lampe komplett zusammengestellt wird
         # und anschliessen neu über die hue bridge gesetzt wird.
         if caller != 'HUE':
-            # lokale speicherung in variablen, damit funktionen nicht immer aufgerufen werden (performance)
+            # alle daten des items wurden in parse_item vorbereitet, es wird nichts mehr gesucht
+            binding = self._itemBindings[id(item)]
+            priority = self._get_priority(caller)
             value = item()
-            hueBridgeId = item.conf['hue_bridge_id']
-            hueGroupId = item.conf['hue_group_id']
-            hueSendGroup = item.conf['hue_send_group']
-            if 'hue_transitionTime' in item.conf:
-                hueTransitionTime = int(float(item.conf['hue_transitionTime']) * 10)
-            else:
-                hueTransitionTime = int(self._hueDefaultTransitionTime * 10)
+            hueBridgeId = binding.hueBridgeId
+            hueGroupId = binding.hueObjectId
+            hueSendGroup = binding.hueSend
+            hueTransitionTime = binding.transitionTime
+            siblings = self._get_siblings(binding, self._sendGroupItems, self._groupSiblingKeys)
 
-            # index ist immer bridge_id + lamp_id + hue_send
-            hueIndex = hueBridgeId + '.' + hueGroupId
-            
-            if hueIndex + '.on' in self._sendGroupItems:
-                hueGroupIsOn = self._sendGroupItems[(hueIndex + '.on')]()
+            if siblings['on'] is not None:
+                hueGroupIsOn = siblings['on']()
             else:
                 logger.warning('HUE: update_group_item: no item for on/off defined for bridge {0} group {1}'.format(hueBridgeId, hueGroupId))
                 hueGroupIsOn = False
                 
             # test aus die wertgrenzen, die die bridge verstehen kann
-            if hueSendGroup in self._rangeInteger8:
-                # werte dürfen zwischen 0 und 255 liegen
-                value = self._limit_range_int(value, 0, 255)    
-            if hueSendGroup in self._rangeInteger16:
-                # hue darf zwischen 0 und 65535 liegen
-                value = self._limit_range_int(value, 0, 65535)    
-            if hueSendGroup == 'ct':
-                # hue darf zwischen 0 und 65535 liegen
-                value = self._limit_range_int(value, 153, 500)
+            if binding.valueRange is not None:
+                value = self._limit_range_int(value, binding.valueRange[0], binding.valueRange[1])
                 
             if hueGroupIsOn:
                 # lampe ist an (status in sh). dann können alle befehle gesendet werden
                 if hueSendGroup == 'on':
                     # wenn der status in sh true ist, aber mit dem befehl on, dann muss die lampe auf der hue seite erst eingeschaltet werden
-                    if hueIndex + '.bri' in self._sendLampItems:
+                    if siblings['bri'] is not None:
                         # wenn eingeschaltet wird und ein bri item vorhanden ist, dann wird auch die hellgkeit
                         # mit gesetzt, weil die gruppe das im ausgeschalteten zustand vergisst.
-                        self._set_group_state(hueBridgeId, hueGroupId, {'on': True, 'bri': int(self._sendLampItems[(hueIndex + '.bri')]()) , 'transitiontime': hueTransitionTime})
+                        self._send_group_state(hueBridgeId, hueGroupId, {'on': True, 'bri': int(siblings['bri']()) , 'transitiontime': hueTransitionTime}, priority)
                     else:
                         # ansonst wird nur eingeschaltet
-                        self._set_group_state(hueBridgeId, hueGroupId, {'on': True , 'transitiontime': hueTransitionTime})
-                        logger.info('HUE: update_lamp_item: no bri item defined for restoring the brightness after swiching on again')                        
+                        self._send_group_state(hueBridgeId, hueGroupId, {'on': True , 'transitiontime': hueTransitionTime}, priority)
+                        logger.info('HUE: update_group_item: no bri item defined for restoring the brightness after swiching on again')                        
                 else:
                     # standardbefehle
-                    self._set_group_state(hueBridgeId, hueGroupId, {hueSendGroup: value, 'transitiontime': hueTransitionTime})
+                    self._send_group_state(hueBridgeId, hueGroupId, {hueSendGroup: value, 'transitiontime': hueTransitionTime}, priority)
             else:
                 # lampe ist im status bei sh aus. in diesem zustand sollten keine befehle gesendet werden
                 if hueSendGroup == 'on':
                     # sonderfall, wenn der status die transition erst ausgeöst hat, dann muss die gruppe
                     # auf der hue seite erst ausgeschaltet werden
-                    self._set_group_state(hueBridgeId, hueGroupId, {'on': False , 'transitiontime': hueTransitionTime})
+                    self._send_group_state(hueBridgeId, hueGroupId, {'on': False , 'transitiontime': hueTransitionTime}, priority)
                 else:
                     # die lampe kann auch über das senden bri angemacht werden
                     if hueSendGroup == 'bri':
                         # jetzt wird die gruppe eingeschaltet und der wert von bri auf den letzten wert gesetzt
-                        self._set_group_state(hueBridgeId, hueGroupId, {'on': True , 'bri': value, 'transitiontime': hueTransitionTime})
+                        self._send_group_state(hueBridgeId, hueGroupId, {'on': True , 'bri': value, 'transitiontime': hueTransitionTime}, priority)
                     else:
                         # ansonsten wird kein befehl abgesetzt !
                         pass                           
@@ -495,18 +1928,14 @@ class HUE():
         # im konkreten fall heisst das, dass der aktuelle status der betroffene lampe komplett zusammengestellt wird
         # und anschliessen neu über die hue bridge gesetzt wird.
         if caller != 'HUE':
-            # lokale speicherung in variablen, damit funktionen nicht immer aufgerufen werden (performance)
+            # alle daten des items wurden in parse_item vorbereitet
+            binding = self._itemBindings[id(item)]
+            priority = self._get_priority(caller)
             value = item()
-            hueBridgeId = item.conf['hue_bridge_id']
-            hueSend = item.conf['hue_send']
             # test aus die wertgrenzen, die die bridge verstehen kann
-            if hueSend in self._rangeInteger8:
-                # werte dürfen zwischen 0 und 255 liegen
-                value = self._limit_range_int(value, 0, 255)    
-            if hueSend in self._rangeInteger16:
-                # hue darf zwischen 0 und 65535 liegen
-                value = self._limit_range_int(value, 0, 65535)    
-            self._set_group_state(hueBridgeId, '0', {hueSend: value})
+            if binding.valueRange is not None:
+                value = self._limit_range_int(value, binding.valueRange[0], binding.valueRange[1])
+            self._send_group_state(binding.hueBridgeId, '0', {binding.hueSend: value}, priority)
                                    
     def dimmenDPT3(self, item, caller=None, source=None, dest=None):
         # das ist die methode, die die DPT3 dimmnachrichten auf die dimmbaren hue items mapped
@@ -519,6 +1948,10 @@ class HUE():
             valueMax = float(item.conf['hue_dim_max'])
             valueDimStep = float(item.conf['hue_dim_step'])
             valueDimTime = float(item.conf['hue_dim_time'])
+            if 'hue_bridge_id' in item.conf:
+                # hue item: ein befehl an die bridge, die den übergang selbst rechnet
+                self._dimmen_native(item, valueMax, valueDimStep, valueDimTime, self._get_priority(caller))
+                return
             if item()[1] == 1:
                 # dimmen
                 if item()[0] == 1:
@@ -533,9 +1966,117 @@ class HUE():
                 item.return_parent()(int(item.return_parent()() + 1), 'HUE_FADE')
                 item.return_parent()(int(item.return_parent()() - 1), 'HUE_FADE')
                 
+    @contextlib.contextmanager
+    def _bridge_lock(self, hueBridgeId, priority=PRIORITY_POLL):
+        # lock der bridge mit messung der warte- und haltezeit
+        lockStart = time.time()
+        self._hueLocks[hueBridgeId].acquire(priority)
+        lockAcquired = time.time()
+        try:
+            yield
+        finally:
+            lockHold = time.time() - lockAcquired
+            self._hueLocks[hueBridgeId].release()
+        self._bridgeStats[hueBridgeId].add_lock(lockAcquired - lockStart, lockHold, priority)
+
+    def _get_priority(self, caller):
+        # prioritätsklasse eines schreibbefehls nach dem caller der item änderung
+        if caller in self._bulkCallers:
+            return PRIORITY_BULK
+        return PRIORITY_INTERACTIVE
+
+    def _dimmen_native(self, item, valueMax, valueDimStep, valueDimTime, priority=PRIORITY_INTERACTIVE):
+        # dimmen start: ein relativer befehl (bri_inc, sat_inc, hue_inc) über den ganzen bereich mit einer
+        # transitiontime, die der geschwindigkeit von hue_dim_step pro hue_dim_time entspricht. dimmen stop: ein
+        # relativer befehl 0 hält den übergang in der bridge an, danach wird der erreichte wert einmal zurückgelesen
+        parentItem = item.return_parent()
+        hueBridgeId = item.conf['hue_bridge_id']
+        if 'hue_lamp_id' in item.conf:
+            hueResource = 'lights'
+            hueObjectId = item.conf['hue_lamp_id']
+            hueDimKey = parentItem.conf['hue_send']
+            hueOnItem = self._sendLampItems.get(hueBridgeId + '.' + hueObjectId + '.on')
+            sendState = self._send_lamp_state
+        else:
+            hueResource = 'groups'
+            hueObjectId = item.conf['hue_group_id']
+            hueDimKey = parentItem.conf['hue_send_group']
+            hueOnItem = self._sendGroupItems.get(hueBridgeId + '.' + hueObjectId + '.on')
+            sendState = self._send_group_state
+        if item()[1] == 1:
+            # dimmen
+            increment = int(min(valueMax, self._dimmRanges[hueDimKey]))
+            hueTransitionTime = min(int(valueMax / valueDimStep * valueDimTime * 10), 65535)
+            if item()[0] == 1:
+                # hoch, eine ausgeschaltete lampe wird dabei eingeschaltet
+                state = {hueDimKey + '_inc': increment, 'transitiontime': hueTransitionTime}
+                if hueOnItem is not None and not hueOnItem():
+                    state['on'] = True
+            else:
+                # runter
+                state = {hueDimKey + '_inc': -increment, 'transitiontime': hueTransitionTime}
+            sendState(hueBridgeId, hueObjectId, state, priority)
+        else:
+            # stop und nach dem senden des befehls den erreichten wert zurücklesen
+            sendState(hueBridgeId, hueObjectId, {hueDimKey + '_inc': 0}, priority)
+            # der erreichte wert geht auch auf das gedimmte item, wenn es selbst kein listen item ist
+            self._schedule_refresh(hueBridgeId, hueResource, hueObjectId, self._get_command_delay(hueBridgeId) + 0.2, parentItem, hueDimKey)
+
+    def _schedule_refresh(self, hueBridgeId, hueResource, hueObjectId, delay, returnItem=None, hueKey=None):
+        # plant das lesen einer einzelnen lampe oder gruppe in delay sekunden. eine noch ausstehende abfrage des
+        # gleichen objektes wird dabei ersetzt, die zusätzlich zu setzenden items bleiben erhalten
+        refreshKey = (hueBridgeId, hueResource, hueObjectId)
+        with self._refreshLock:
+            if not self.alive:
+                return
+            if returnItem is not None:
+                self._refreshItems.setdefault(refreshKey, {})[hueKey] = returnItem
+            self._refreshQueue.put(refreshKey, delay)
+
+    def _refresh_objects(self, hueBridgeId, hueObjects):
+        # ausführung der fälligen abfragen einer bridge aus der warteschlange. mehrere lampen (gruppen) werden mit
+        # einer abfrage von /lights (/groups) gelesen statt mit einer abfrage pro lampe
+        with self._refreshLock:
+            returnItems = dict((hueObject, self._refreshItems.pop((hueBridgeId,) + hueObject, {})) for hueObject in hueObjects)
+        for hueResource, updateMethod in (('lights', self._update_lamps_bridge), ('groups', self._update_groups_bridge)):
+            hueObjectIds = [hueObjectId for refreshResource, hueObjectId in hueObjects if refreshResource == hueResource]
+            if len(hueObjectIds) > 1:
+                returnValues = updateMethod(hueBridgeId)
+            elif hueObjectIds:
+                returnValues = {hueObjectIds[0]: self._refresh_object(hueBridgeId, hueResource, hueObjectIds[0])}
+            else:
+                continue
+            if returnValues is None:
+                continue
+            for hueObjectId in hueObjectIds:
+                hueObjectValues = returnValues.get(hueObjectId)
+                if hueObjectValues is None:
+                    continue
+                for hueKey, returnItem in returnItems[(hueResource, hueObjectId)].items():
+                    value = hueObjectValues.get('state' if hueResource == 'lights' else 'action', {}).get(hueKey)
+                    if value is not None and returnItem() != value:
+                        returnItem(value, 'HUE')
+
+    def _get_command_delay(self, hueBridgeId):
+        # zeit, bis ein jetzt abgesetzter befehl bei der bridge ist
+        if hueBridgeId in self._commandQueues and self._commandQueues[hueBridgeId].alive:
+            return self._commandQueues[hueBridgeId].delay()
+        return 0
+
+    def _get_connection_pool(self, host, plain):
+        # liefert den keep-alive pool für den host, er wird beim ersten request angelegt
+        with self._connectionPoolsLock:
+            pool = self._connectionPools.get(host)
+            if pool is None:
+                pool = HueConnectionPool(host, not plain, self._connectionPoolSize, maxResponseSize=self._maxResponseSize)
+                self._connectionPools[host] = pool
+        return pool
+
     def _fetch_url_v2(self, url, auth=None, username=None, password=None, timeout=2, method='GET', headers={}, body=None, errorItem=None):
         # im vergleich zu fetch_url habe ich einen error item, den ich setzen bei bekannten durch den user herbeigeführten connection fehlern
         # und die entsprechende fehlerabfragen, damit ich das log nicht voll schreibe
+        # die verbindungen kommen aus dem keep-alive pool der bridge und werden nicht nach jedem request geschlossen,
+        # bei transport = asyncio läuft der request im event loop und hier wird auf das ergebnis gewartet
         plain = True
         if url.startswith('https'):
             plain = False
@@ -543,271 +2084,904 @@ class HUE():
         host = lurl[2]
         purl = '/' + '/'.join(lurl[3:])
         path = host + purl
-        if plain:
-            conn = http.client.HTTPConnection(host, timeout=timeout)
+        if self._is_async():
+            request = functools.partial(self._asyncTransport.request_blocking, host, not plain)
         else:
-            conn = http.client.HTTPSConnection(host, timeout=timeout)
+            request = self._get_connection_pool(host, plain).request
         if auth == 'basic':
             headers['Authorization'] = self.basic_auth(username, password)
         elif auth == 'digest' and path in self.__paths:
             headers['Authorization'] = self.digest_auth(host, purl, {}, username, password, method)
+        self._requestStatus.error = None
         try:
-            conn.request(method, purl, body, headers)
-            resp = conn.getresponse()
+            resp, content = request(method, purl, body, headers, timeout)
+            if resp.status == 401 and auth == 'digest':
+                rheaders = self.parse_headers(resp.getheaders())
+                headers['Authorization'] = self.digest_auth(host, purl, rheaders, username, password, method)
+                resp, content = request(method, purl, body, headers, timeout)
         except Exception as e:
-            # jetzt suchen wir nach bekannten, definierten fehlern
-            if format(e) in self._connErrors:
-                # diese fehler bekommen einen status, der in der visu oder sonst genutzt werden kann
-                # wenn der item abgelegt ist, dann kann er auch gesetzt werden, wenn nicht schreiben wir halt ins log !
-                if errorItem != None:
-                    errorItem(True,'_request')
-                else:
-                    logger.warning('_request: error status set, not status item defined')
+            self._requestStatus.error = e
+            self._handle_request_error(e, errorItem)
+            return None
+        return self._handle_response(url, resp, content, errorItem)
+
+    def _handle_request_error(self, error, errorItem):
+        # jetzt suchen wir nach bekannten, definierten fehlern
+        if format(error) in self._connErrors:
+            # diese fehler bekommen einen status, der in der visu oder sonst genutzt werden kann
+            # wenn der item abgelegt ist, dann kann er auch gesetzt werden, wenn nicht schreiben wir halt ins log !
+            if errorItem != None:
+                errorItem(True,'_request')
             else:
-                logger.error('_request: problem in http.client exception : [{0}]'.format(e))
-            if conn:
-                conn.close()
-                return None
+                logger.warning('_request: error status set, not status item defined')
+        else:
+            logger.error('_request: problem in http.client exception : [{0!r}]'.format(error))
+
+    def _handle_response(self, url, resp, content, errorItem):
         # ansonsten ist alles gut durchgelaufen, dann wird das item zurückgesetzt
-        if errorItem != None:
-            # wenn der item abgelegt ist, dann kann er auch rückgesetzt werden
+        if errorItem != None and errorItem():
+            # wenn der item abgelegt ist, dann kann er auch rückgesetzt werden, aber nur wenn er gesetzt war
             errorItem(False,'_request')
         # jetzt geht es an die auswertung der rueckmeldungen
         # rückmeldung 200 ist OK
-        if resp.status == 200:
-            content = resp.read()
-        elif resp.status == 401 and auth == 'digest':
-            content = resp.read()
-            rheaders = self.parse_headers(resp.getheaders())
-            headers['Authorization'] = self.digest_auth(host, purl, rheaders, username, password, method)
-            conn.request(method, purl, body, headers)
-            resp = conn.getresponse()
-            content = resp.read()
-        else:
+        if resp.status != 200:
             logger.warning("Problem fetching {0}: {1} {2}".format(url, resp.status, resp.reason))
-            content = None
-        conn.close()
+            return None
         return content
 
+    def _is_async(self):
+        return self._asyncTransport is not None and self._asyncTransport.alive
+
+    def _get_bridge_url(self, hueBridgeId, path):
+        return 'http://' + self._hue_ip[int(hueBridgeId)] + '/api/' + self._hue_user[int(hueBridgeId)] + path
+
+    def _get_error_item(self, hueBridgeId):
+        # setzen des fehlerstatus items
+        if hueBridgeId + '.' + 'errorstatus' in self._listenBridgeItems:
+            return self._listenBridgeItems[hueBridgeId + '.' + 'errorstatus']
+        logger.debug('HUE: _get_web_content: no errorstatus item defined for bridge {0}'.format(hueBridgeId))
+        return None
+
     def  _get_web_content(self, hueBridgeId='0', path='', method='GET', body=None):
         # in dieser routine erfolgt der umbau und die speziellen themen zur auswertung der verbindung, die speziell für das plugin ist
         # der rest sollte standard in der routine fetch_url() enthalten sein. leider fehlt dort aber die auswertung der fehllerconditions
-        # erst einmal die komplette url
-        url = 'http://' + self._hue_ip[int(hueBridgeId)] + '/api/' + self._hue_user[int(hueBridgeId)] + path
-        # setzen des fehlerstatus items
-        if hueBridgeId + '.' + 'errorstatus' in self._listenBridgeItems:
-            errorItem = self._listenBridgeItems[hueBridgeId + '.' + 'errorstatus']
-        else:
-            errorItem = None
-            logger.warning(hueBridgeId)
+        if not self._allow_request(hueBridgeId):
+            return None
         # dann der aufruf kompatibel, aber inhaltlich nicht identisch fetch_url aus lib.www
-        response = self._fetch_url_v2(url, None, None, None, 2, method, {}, body, errorItem)
-        if response != None:
-            # und jetzt der anteil der decodierung, der nicht in der fetch_url drin ist
-            # lesen, decodieren nach utf-8 (ist pflicht nach der api definition philips) und in ein python objekt umwandeln
-            responseJson = response.decode('utf-8')
-            returnValues = json.loads(responseJson)
-            # fehlerauswertung der rückmeldung, muss noch vervollständigt werden
-            if isinstance(returnValues, list) and returnValues[0].get('error', None):
-                error = returnValues[0]["error"]
-                description = error['description']
-                if error['type'] == 1:
-                    logger.error('HUE: _request: Error: {0} (Need to specify correct hue user?)'.format(description))
-                else:
-                    logger.error('HUE: _request: Error: {0}'.format(description))
-                return None
-            return returnValues
-        else:
+        requestStart = time.time()
+        response = self._fetch_url_v2(self._get_bridge_url(hueBridgeId, path), None, None, None, 2, method, {}, body, self._get_error_item(hueBridgeId))
+        requestError = getattr(self._requestStatus, 'error', None)
+        self._update_circuit_breaker(hueBridgeId, requestError)
+        return self._decode_response(hueBridgeId, response, time.time() - requestStart, requestError)
+
+    def _allow_request(self, hueBridgeId):
+        # eine gesperrte bridge wird nicht angefragt, der aufruf schlägt sofort fehl
+        if hueBridgeId in self._circuitBreakers and not self._circuitBreakers[hueBridgeId].allow():
+            self._bridgeStats[hueBridgeId].add_rejected()
+            return False
+        return True
+
+    def _update_circuit_breaker(self, hueBridgeId, requestError):
+        # nur verbindungsfehler zählen, eine fehlermeldung der bridge heisst, dass sie erreichbar ist. für die probe
+        # zählt jeder fehler, auch z.b. eine zu grosse oder abgebrochene antwort
+        if hueBridgeId not in self._circuitBreakers:
+            return
+        circuitBreaker = self._circuitBreakers[hueBridgeId]
+        if requestError is None:
+            if circuitBreaker.success():
+                logger.info('HUE: _update_circuit_breaker: bridge {0} is reachable again'.format(hueBridgeId))
+        elif circuitBreaker.failure(isinstance(requestError, (OSError, http.client.HTTPException))):
+            logger.warning('HUE: _update_circuit_breaker: bridge {0} not reachable, requests are suspended and retried with a backoff starting at {1} seconds'.format(hueBridgeId, circuitBreaker.backoff()))
+            # der status der sperre wird über das fehlerstatus item angezeigt, es wird erst mit der nächsten
+            # erfolgreichen antwort zurückgesetzt
+            errorItem = self._get_error_item(hueBridgeId)
+            if errorItem != None and not errorItem():
+                errorItem(True, '_request')
+
+    def _get_web_content_async(self, hueBridgeId, path, method, body, callback):
+        # wie _get_web_content, aber der request läuft im event loop von transport = asyncio und der aufruf kehrt
+        # sofort zurück. callback bekommt das ergebnis (oder None) und wird im thread des event loops aufgerufen
+        if not self._allow_request(hueBridgeId):
+            callback(None)
+            return
+        url = self._get_bridge_url(hueBridgeId, path)
+        lurl = url.split('/')
+        errorItem = self._get_error_item(hueBridgeId)
+        requestStart = time.time()
+        def done(future):
+            try:
+                resp, content = future.result()
+            except (asyncio.CancelledError, concurrent.futures.CancelledError) as e:
+                # der transport wurde beendet, eine laufende probe gilt als fehlgeschlagen. der callback wird trotzdem
+                # aufgerufen, sonst bleibt z.b. der befehl an eine lampe für immer unterwegs
+                self._update_circuit_breaker(hueBridgeId, e)
+                callback(self._decode_response(hueBridgeId, None, time.time() - requestStart, e))
+                return
+            except BaseException as e:
+                self._handle_request_error(e, errorItem)
+                self._update_circuit_breaker(hueBridgeId, e)
+                callback(self._decode_response(hueBridgeId, None, time.time() - requestStart, e))
+                return
+            self._update_circuit_breaker(hueBridgeId, None)
+            response = self._handle_response(url, resp, content, errorItem)
+            callback(self._decode_response(hueBridgeId, response, time.time() - requestStart, None))
+        self._asyncTransport.submit(self._asyncTransport.request(lurl[2], False, method, '/' + '/'.join(lurl[3:]), body)).add_done_callback(done)
+
+    def _decode_response(self, hueBridgeId, response, requestDuration, requestError):
+        # auswertung der antwort der bridge und eintrag in die statistik
+        if response == None:
+            self._bridgeStats[hueBridgeId].add_request(requestDuration, True, isinstance(requestError, socket.timeout) or format(requestError) == 'timed out')
             return None
+        # und jetzt der anteil der decodierung, der nicht in der fetch_url drin ist
+        # die antwort ist utf-8 (ist pflicht nach der api definition philips) und wird ohne den umweg über einen
+        # string direkt aus den bytes in ein python objekt umgewandelt
+        try:
+            returnValues = self._jsonLoads(response)
+        except ValueError as e:
+            logger.error('HUE: _request: Error: response of bridge {0} is no valid json: {1}'.format(hueBridgeId, e))
+            self._bridgeStats[hueBridgeId].add_request(requestDuration, True)
+            return None
+        # fehlerauswertung der rückmeldung, muss noch vervollständigt werden
+        if isinstance(returnValues, list) and returnValues[0].get('error', None):
+            error = returnValues[0]["error"]
+            description = error['description']
+            if error['type'] == 1:
+                logger.error('HUE: _request: Error: {0} (Need to specify correct hue user?)'.format(description))
+            else:
+                logger.error('HUE: _request: Error: {0}'.format(description))
+            self._bridgeStats[hueBridgeId].add_request(requestDuration, True)
+            return None
+        self._bridgeStats[hueBridgeId].add_request(requestDuration)
+        return returnValues
+
+    def _get_send_method(self, hueBridgeId):
+        # sendemethode für die warteschlange einer bridge
+        def sendMethod(resource, resourceId, state, priority, commandTime):
+            if resource == 'lights':
+                self._set_lamp_state(hueBridgeId, resourceId, state, priority, commandTime)
+            else:
+                self._set_group_state(hueBridgeId, resourceId, state, priority, commandTime)
+        return sendMethod
+
+    def _get_group_resolver(self, hueBridgeId):
+        # liefert für eine menge von lampen die bekannten gruppen, deren lampen vollständig darin enthalten sind.
+        # die grössten gruppen zuerst, jede lampe wird nur einer gruppe zugeordnet
+        def groupResolver(hueLampIds):
+            hueGroups = []
+            hueLampIdsLeft = set(hueLampIds)
+            hueGroupMembers = self._groupMembers.get(hueBridgeId, {})
+            for hueGroupId in sorted(hueGroupMembers, key=lambda groupId: len(hueGroupMembers[groupId]), reverse=True):
+                hueGroupLampIds = hueGroupMembers[hueGroupId]
+                if len(hueGroupLampIds) > 1 and hueGroupLampIds <= hueLampIdsLeft:
+                    hueGroups.append((hueGroupId, hueGroupLampIds))
+                    hueLampIdsLeft -= hueGroupLampIds
+            return hueGroups
+        return groupResolver
+
+    def _send_lamp_state(self, hueBridgeId, hueLampId, state, priority=PRIORITY_BULK):
+        # der befehl geht in die warteschlange der bridge, damit kehrt der aufruf sofort zurück
+        self._invalidate_applied_values(hueBridgeId, 'lights', hueLampId)
+        if self._cycle_lamps_fast > 0 and not self._is_streaming(hueBridgeId):
+            # nach einem schreibbefehl wird die bridge wieder im schnellen zyklus abgefragt
+            self._set_poll_interval(hueBridgeId, self._cycle_lamps_fast)
+        if hueBridgeId in self._commandQueues and self._commandQueues[hueBridgeId].alive:
+            self._commandQueues[hueBridgeId].put('lights', hueLampId, state, priority)
+        else:
+            self._set_lamp_state(hueBridgeId, hueLampId, state, priority, time.time())
+
+    def _send_group_state(self, hueBridgeId, hueGroupId, state, priority=PRIORITY_BULK):
+        # der befehl geht in die warteschlange der bridge, damit kehrt der aufruf sofort zurück
+        self._invalidate_applied_values(hueBridgeId, 'groups', hueGroupId)
+        if self._cycle_lamps_fast > 0 and not self._is_streaming(hueBridgeId):
+            # nach einem schreibbefehl wird die bridge wieder im schnellen zyklus abgefragt
+            self._set_poll_interval(hueBridgeId, self._cycle_lamps_fast)
+        if hueBridgeId in self._commandQueues and self._commandQueues[hueBridgeId].alive:
+            self._commandQueues[hueBridgeId].put('groups', hueGroupId, state, priority)
+        else:
+            self._set_group_state(hueBridgeId, hueGroupId, state, priority, time.time())
 
-    def _set_lamp_state(self, hueBridgeId, hueLampId, state):
+    def _set_lamp_state(self, hueBridgeId, hueLampId, state, priority=PRIORITY_BULK, commandTime=None):
         # hier erfolgt das setzen des status einer lampe
         # hier kommt der PUT request, um die stati an die hue bridge zu übertragen
-        self._hueLock.acquire()
-        returnValues = self._get_web_content(hueBridgeId, '/lights/%s/state' % hueLampId, 'PUT', json.dumps(state))
+        state = self._filter_command(hueBridgeId, (hueLampId,), state)
+        if not state:
+            return
+        with self._shadowLock:
+            self._lampsInFlight[hueBridgeId][hueLampId] = self._lampsInFlight[hueBridgeId].get(hueLampId, 0) + 1
+        if self._is_async():
+            # der request läuft im event loop, die rückmeldung wird dort ausgewertet. der bridge lock wird dabei nicht
+            # genommen, weil der event loop sonst auf einen poll warten würde, der selbst auf den event loop wartet
+            self._get_web_content_async(hueBridgeId, '/lights/%s/state' % hueLampId, 'PUT', json.dumps(state), lambda returnValues: self._evaluate_lamp_state(hueBridgeId, hueLampId, state, returnValues, priority, commandTime))
+            return
+        with self._bridge_lock(hueBridgeId, priority):
+            returnValues = self._get_web_content(hueBridgeId, '/lights/%s/state' % hueLampId, 'PUT', json.dumps(state))
+            self._evaluate_lamp_state(hueBridgeId, hueLampId, state, returnValues, priority, commandTime)
+
+    def _evaluate_lamp_state(self, hueBridgeId, hueLampId, state, returnValues, priority=PRIORITY_BULK, commandTime=None):
+        self._add_command_latency(hueBridgeId, priority, commandTime)
+        with self._shadowLock:
+            self._lampsInFlight[hueBridgeId][hueLampId] -= 1
+            if returnValues == None:
+                # ob der befehl ausgeführt wurde, ist unbekannt
+                self._unconfirmedLamps[hueBridgeId].add(hueLampId)
         if returnValues == None:
-            self._hueLock.release()
+            self._bridgeStats[hueBridgeId].add_command_error()
             return
         # der aufruf liefert eine bestätigung zurück, was den numgesetzt werden konnte
+        hueLampRoutes = self._listenLampRoutes.get((hueBridgeId, hueLampId), {})
+        appliedValues = self._appliedValues.setdefault((hueBridgeId, 'lights', hueLampId), {})
         for hueObject in returnValues:
             for hueObjectStatus, hueObjectReturnString in hueObject.items():
                 if hueObjectStatus == 'success':
                     for hueObjectReturnStringPath, hueObjectReturnStringValue in hueObjectReturnString.items():
                         hueObjectReturnStringPathItem = hueObjectReturnStringPath.split('/')[4]
+                        self._confirm_lamp_value(hueBridgeId, hueLampId, hueObjectReturnStringPathItem, hueObjectReturnStringValue)
                         # hier werden jetzt die bestätigten werte aus der rückübertragung im item gesetzt
-                        # wir gehen durch alle listen items, um die zuordnung zu machen
-                        for returnItem in self._listenLampItems:
-                            # wenn ein listen item angelegt wurde und dafür ein status zurückkam
-                            # verglichen wird mit dem referenzkey, der weiter oben aus lampid und state gebaut wurde
-                            if returnItem == (hueBridgeId + '.' + hueLampId + '.' + hueObjectReturnStringPathItem):
-                                # dafür wir der reale wert der hue bridge gesetzt
-                                if hueObjectReturnStringPathItem in self._boolKeys:
-                                    # typecast auf bool
-                                    value = bool(hueObjectReturnStringValue)
-                                elif hueObjectReturnStringPathItem in self._stringKeys:
-                                    # typecast auf string
-                                    value = str(hueObjectReturnStringValue)
-                                else:
-                                    # sonst ist es int
-                                    value = int(hueObjectReturnStringValue)
-                                self._listenLampItems[returnItem](value, 'HUE')
+                        # die zuordnung erfolgt direkt über den routing index der lampe
+                        if hueObjectReturnStringPathItem in hueLampRoutes:
+                            returnItem, typecast = hueLampRoutes[hueObjectReturnStringPathItem]
+                            returnItem(typecast(hueObjectReturnStringValue), 'HUE')
+                            appliedValues[hueObjectReturnStringPathItem] = hueObjectReturnStringValue
                 else:
+                    self._bridgeStats[hueBridgeId].add_command_error()
                     logger.warning('HUE: hue_set_lamp_state - hueObjectStatus no success:: {0}: {1} command state {2}'.format(hueObjectStatus, hueObjectReturnString, state))
-        self._hueLock.release()
+        if self._readAfterWrite > 0 and (hueLampRoutes or (hueBridgeId, 'lights', hueLampId) in self._refreshItems) and (hueBridgeId, hueLampId) not in self._effectLamps:
+            # den tatsächlich erreichten status der lampe nach dem ende des übergangs lesen. ohne transitiontime
+            # nimmt die bridge 4/10 sekunden
+            self._schedule_refresh(hueBridgeId, 'lights', hueLampId, state.get('transitiontime', 4) / 10.0 + self._readAfterWrite)
 
-    def _set_group_state(self, hueBridgeId, hueGroupId , state):
+    def _set_group_state(self, hueBridgeId, hueGroupId , state, priority=PRIORITY_BULK, commandTime=None):
         # hier erfolgt das setzen des status einer gruppe im Moment ist nur der abruf einer szene implementiert
         # hier kommt der PUT request, um die stati an die hue bridge zu übertragen
-        self._hueLock.acquire()
-        returnValues = self._get_web_content(hueBridgeId, '/groups/%s/action' % hueGroupId, 'PUT', json.dumps(state))
+        hueLampIds = self._get_group_lamps(hueBridgeId, hueGroupId)
+        state = self._filter_command(hueBridgeId, hueLampIds, state)
+        if not state:
+            return
+        # was die lampen der gruppe danach tatsächlich haben, zeigt erst die nächste abfrage
+        with self._shadowLock:
+            if hueLampIds is None:
+                self._shadowValid[hueBridgeId] = False
+            else:
+                self._unconfirmedLamps[hueBridgeId].update(hueLampIds)
+        if self._is_async():
+            self._get_web_content_async(hueBridgeId, '/groups/%s/action' % hueGroupId, 'PUT', json.dumps(state), lambda returnValues: self._evaluate_group_state(hueBridgeId, hueGroupId, state, returnValues, priority, commandTime))
+            return
+        with self._bridge_lock(hueBridgeId, priority):
+            returnValues = self._get_web_content(hueBridgeId, '/groups/%s/action' % hueGroupId, 'PUT', json.dumps(state))
+        self._evaluate_group_state(hueBridgeId, hueGroupId, state, returnValues, priority, commandTime)
+
+    def _add_command_latency(self, hueBridgeId, priority, commandTime):
+        # dauer eines befehls von der änderung des items bis zur antwort der bridge
+        if commandTime is not None:
+            self._bridgeStats[hueBridgeId].add_command_latency(priority, time.time() - commandTime)
+
+    def _get_group_lamps(self, hueBridgeId, hueGroupId):
+        # die lampen einer gruppe, gruppe 0 sind alle lampen der bridge. None, wenn die gruppe nicht bekannt ist
+        if hueGroupId == '0':
+            return list(self._bridgeSnapshots[hueBridgeId]['lights'].keys())
+        return self._groupMembers.get(hueBridgeId, {}).get(hueGroupId)
+
+    def _filter_command(self, hueBridgeId, hueLampIds, state):
+        # entfernt aus dem befehl die werte, die alle betroffenen lampen laut bestätigtem status schon haben.
+        # liefert den restlichen befehl oder ein leeres dict, wenn nichts mehr zu senden ist
+        if not self._suppressCommands or not hueLampIds:
+            self._bridgeStats[hueBridgeId].add_command()
+            return state
+        shadows = []
+        with self._shadowLock:
+            if not self._shadowValid[hueBridgeId]:
+                self._bridgeStats[hueBridgeId].add_command()
+                return state
+            for hueLampId in hueLampIds:
+                shadow = self._bridgeSnapshots[hueBridgeId]['lights'].get(hueLampId, {}).get('state')
+                if not shadow or hueLampId in self._unconfirmedLamps[hueBridgeId] or self._lampsInFlight[hueBridgeId].get(hueLampId):
+                    self._bridgeStats[hueBridgeId].add_command()
+                    return state
+                shadows.append(shadow)
+            filteredState = dict((hueKey, value) for hueKey, value in state.items() if hueKey == 'transitiontime' or not all(self._is_confirmed_value(shadow, hueKey, value) for shadow in shadows))
+        valuesSuppressed = len(state) - len(filteredState)
+        if list(filteredState.keys()) in ([], ['transitiontime']):
+            self._bridgeStats[hueBridgeId].add_command(valuesSuppressed, True)
+            return {}
+        self._bridgeStats[hueBridgeId].add_command(valuesSuppressed)
+        return filteredState
+
+    def _is_confirmed_value(self, shadow, hueKey, value):
+        # True, wenn der wert an der lampe laut bestätigtem status schon eingestellt ist
+        if hueKey not in self._suppressKeys or hueKey not in shadow:
+            return False
+        if hueKey != 'on' and not shadow.get('on'):
+            # eine ausgeschaltete lampe bekommt alle werte, sie vergisst sie beim ausschalten
+            return False
+        if hueKey in self._colormodeOfKeys and shadow.get('colormode') != self._colormodeOfKeys[hueKey]:
+            # gleicher farbwert in einem anderen colormode ändert trotzdem die farbe
+            return False
+        if hueKey == 'xy':
+            return abs(shadow['xy'][0] - value[0]) <= self._suppressTolerances['xy'] and abs(shadow['xy'][1] - value[1]) <= self._suppressTolerances['xy']
+        return shadow[hueKey] == value
+
+    def _confirm_lamp_value(self, hueBridgeId, hueLampId, hueKey, value):
+        # überträgt einen von der bridge bestätigten wert in den bestätigten status der lampe
+        with self._shadowLock:
+            shadow = self._bridgeSnapshots[hueBridgeId]['lights'].get(hueLampId, {}).get('state')
+            if shadow is None:
+                return
+            if hueKey.endswith('_inc'):
+                # der erreichte wert ist erst nach dem nächsten lesen bekannt
+                self._unconfirmedLamps[hueBridgeId].add(hueLampId)
+                return
+            shadow[hueKey] = value
+            if hueKey in self._colormodeOfKeys:
+                shadow['colormode'] = self._colormodeOfKeys[hueKey]
+
+    def _evaluate_group_state(self, hueBridgeId, hueGroupId, state, returnValues, priority=PRIORITY_BULK, commandTime=None):
+        self._add_command_latency(hueBridgeId, priority, commandTime)
         if returnValues == None:
-            self._hueLock.release()
+            self._bridgeStats[hueBridgeId].add_command_error()
             return
         # der aufruf liefert eine bestätigung zurück, was den numgesetzt werden konnte
-
         for hueObject in returnValues:
             for hueObjectStatus, hueObjectReturnString in hueObject.items():
                 if hueObjectStatus == 'success':
                     pass
                 else:
+                    self._bridgeStats[hueBridgeId].add_command_error()
                     logger.warning('HUE: _set_group_state - hueObjectStatus no success:: {0}: {1} command state {2}'.format(hueObjectStatus, hueObjectReturnString, state))
 
-    def _update_lamps(self):
-        # mache ich mit der API get all lights
-        # hier kommt der PUT request, um die stati an die hue bridge zu übertragen beispiel:
-        numberBridgeId = 0
-        while numberBridgeId < self._numberHueBridges:
+    def _apply_routes(self, hueBridgeId, hueResource, hueObjectId, hueRoutes, hueObjectValues, hueSections=()):
+        # überträgt die werte eines objektes (lampe, gruppe, bridge) auf die gebundenen items. es wird nur über die
+        # im routing index eingetragenen attribute gegangen, nicht mehr über alle rückmeldungen und alle items.
+        # die states liegen eine ebene tiefer als die restlichen infos, daher werden die sections mit durchsucht.
+        # geschrieben werden nur werte, die sich gegenüber dem letzten geschriebenen wert geändert haben
+        appliedValues = self._appliedValues.setdefault((hueBridgeId, hueResource, hueObjectId), {})
+        written = 0
+        suppressed = 0
+        for hueObjectItem, (returnItem, typecast) in hueRoutes.items():
+            found, hueObjectItemValue = self._find_route_value(hueObjectValues, hueObjectItem, hueSections)
+            if not found:
+                # attribut ist in der rückmeldung nicht enthalten
+                continue
+            if hueObjectItem in appliedValues and appliedValues[hueObjectItem] == hueObjectItemValue:
+                # unverändert, das item muss nicht geschrieben werden
+                suppressed += 1
+                continue
+            # wenn der wert gerade im fading ist, dann nicht überschreiben, sonst bleibt es stehen !
+            if returnItem._fading:
+                continue
+            if hueObjectItem == 'bri':
+                # bei brightness gibt es eine fallunterscheidung. geht aber nur, wenn ein on item vorhanden ist
+                # die brightness darf nur bei lamp = on zurückgeschrieben werden, den bei aus ist sie immer 0.
+                # entscheidend ist on aus der gleichen rückmeldung, das on item kann noch den alten wert haben
+                if 'on' not in hueRoutes:
+                    continue
+                found, hueOn = self._find_route_value(hueObjectValues, 'on', hueSections)
+                if not (hueOn if found else hueRoutes['on'][0]()):
+                    continue
+            # bei allen anderen kann zurückgeschrieben werden
+            returnItem(typecast(hueObjectItemValue), 'HUE')
+            appliedValues[hueObjectItem] = hueObjectItemValue
+            written += 1
+        self._itemWritesApplied[hueBridgeId] += written
+        self._itemWritesSuppressed[hueBridgeId] += suppressed
+
+    def _find_route_value(self, hueObjectValues, hueObjectItem, hueSections):
+        # sucht das attribut in der rückmeldung und in ihren sections, liefert (gefunden, wert)
+        if hueObjectItem in hueObjectValues:
+            return True, hueObjectValues[hueObjectItem]
+        for hueSection in hueSections:
+            if hueObjectItem in hueObjectValues.get(hueSection, ()):
+                return True, hueObjectValues[hueSection][hueObjectItem]
+        return False, None
+
+    def _apply_static_routes(self, hueBridgeId, hueResource, hueObjectsValues):
+        # überträgt die statischen attribute der objekte, die noch ausstehen. danach werden sie nicht mehr ausgewertet
+        for hueStaticKey in [hueStaticKey for hueStaticKey in list(self._staticPending) if hueStaticKey[0] == hueBridgeId and hueStaticKey[1] == hueResource]:
+            if hueStaticKey[2] in hueObjectsValues:
+                # die geschriebenen werte werden getrennt gemerkt, damit ein schreibbefehl sie nicht verwirft
+                self._apply_routes(hueBridgeId, hueResource + '.static', hueStaticKey[2], self._listenStaticRoutes[hueStaticKey], hueObjectsValues[hueStaticKey[2]])
+                self._staticPending.discard(hueStaticKey)
+
+    def snapshot(self, bridges=None):
+        # sichert den status aller lampen einer liste von bridges (alle bridges bei None) aus den daten des letzten
+        # pollings: {bridge: {lampe: status}}. gesichert werden nur die werte, die für restore() gebraucht werden
+        if bridges is None:
+            bridges = [str(numberBridgeId) for numberBridgeId in range(self._numberHueBridges)]
+        snapshot = {}
+        for hueBridgeId in bridges:
+            hueBridgeId = str(hueBridgeId)
+            with self._bridge_lock(hueBridgeId):
+                snapshot[hueBridgeId] = dict((hueLampId, self._get_restore_state(hueLampIdValues.get('state', {}))) for hueLampId, hueLampIdValues in self._bridgeSnapshots[hueBridgeId]['lights'].items())
+        return snapshot
+
+    def _get_restore_state(self, state):
+        # bei eingeschalteter lampe die helligkeit, den effekt und die farbe passend zum colormode
+        restoreState = {'on': state.get('on', False)}
+        if restoreState['on']:
+            for hueKey in ['bri', 'effect', 'colormode'] + self._colormodeKeys.get(state.get('colormode'), []):
+                if hueKey in state:
+                    restoreState[hueKey] = state[hueKey]
+        return restoreState
+
+    def restore(self, snapshot, parallel=True, transitionTime=None):
+        # stellt den mit snapshot() gesicherten status wieder her. pro lampe wird höchstens ein befehl gesendet, der
+        # nur die gegenüber dem aktuellen status abweichenden werte enthält. die befehle gehen über die warteschlangen
+        # der bridges. bei parallel = True werden die bridges gleichzeitig bearbeitet. liefert die anzahl der befehle
+        if transitionTime is None:
+            transitionTime = self._hueDefaultTransitionTime
+        hueBridgeIds = [hueBridgeId for hueBridgeId in snapshot if hueBridgeId in self._bridgeSnapshots]
+        if parallel and self._pollExecutor is not None and len(hueBridgeIds) > 1:
+            futures = [self._pollExecutor.submit(self._restore_bridge, hueBridgeId, snapshot[hueBridgeId], transitionTime) for hueBridgeId in hueBridgeIds]
+            return sum(future.result() for future in futures)
+        return sum(self._restore_bridge(hueBridgeId, snapshot[hueBridgeId], transitionTime) for hueBridgeId in hueBridgeIds)
+
+    def _restore_bridge(self, hueBridgeId, hueLampStates, transitionTime):
+        commands = 0
+        for hueLampId, restoreState in hueLampStates.items():
+            currentState = self._bridgeSnapshots[hueBridgeId]['lights'].get(hueLampId, {}).get('state', {})
+            state = self._get_restore_command(restoreState, currentState)
+            if state:
+                state['transitiontime'] = int(transitionTime * 10)
+                self._send_lamp_state(hueBridgeId, hueLampId, state)
+                commands += 1
+        return commands
+
+    def _get_restore_command(self, restoreState, currentState):
+        # der kleinste befehl, der eine lampe vom aktuellen status in den gesicherten status bringt
+        if not restoreState['on']:
+            if currentState.get('on', True):
+                return {'on': False}
+            return {}
+        state = {}
+        for hueKey, value in restoreState.items():
+            if hueKey == 'colormode':
+                continue
+            if not currentState.get('on', False) or currentState.get(hueKey) != value:
+                # eine ausgeschaltete lampe bekommt alle werte
+                state[hueKey] = value
+            elif hueKey in self._colormodeKeys.get(restoreState.get('colormode'), ()) and currentState.get('colormode') != restoreState.get('colormode'):
+                # gleicher wert, aber anderer colormode: die farbe muss trotzdem gesendet werden
+                state[hueKey] = value
+        return state
+
+    def start_effect(self, effect, lamps=None, group=None, hueBridgeId='0', fps=None, duration=0, **params):
+        # startet einen effekt (candle, sunrise, sweep) auf einer liste von lampen oder einer gruppe einer bridge.
+        # laufende effekte auf den gleichen lampen / der gleichen gruppe werden beendet. liefert die id des effekts
+        if effect not in self._effectFunctions:
+            logger.error('HUE: start_effect: effect [{0}] is unknown, possible are {1}'.format(effect, ', '.join(sorted(self._effectFunctions))))
+            return None
+        hueBridgeId = str(hueBridgeId)
+        if hueBridgeId not in self._hueLocks:
+            logger.error('HUE: start_effect: bridge [{0}] is unknown'.format(hueBridgeId))
+            return None
+        if group is not None:
+            targets = [('groups', str(group), int(params.pop('lampType', 0)))]
+        elif lamps is not None:
+            if isinstance(lamps, str):
+                lamps = lamps.split(',')
+            hueLampIds = [str(hueLampId).strip() for hueLampId in lamps]
+            targets = [('lights', hueLampId, self._lampTypes.get((hueBridgeId, hueLampId), 0)) for hueLampId in hueLampIds]
+        else:
+            logger.error('HUE: start_effect: lamps or group have to be given for effect [{0}]'.format(effect))
+            return None
+        if fps is None:
+            fps = self._effectFps[effect]
+        fps = min(max(float(fps), 0.1), 25.0)
+        if effect == 'sunrise' and not duration:
+            duration = 600
+        targetKeys = set((hueResource, hueObjectId) for hueResource, hueObjectId, lampType in targets)
+        self.stop_effect([runningEffect.effectId for runningEffect in self._effectEngine.get() if runningEffect.hueBridgeId == hueBridgeId and targetKeys & set((hueResource, hueObjectId) for hueResource, hueObjectId, lampType in runningEffect.targets)])
+        hueEffect = HueEffect(next(self._effectIds), effect, hueBridgeId, targets, fps, float(duration), params)
+        if hueBridgeId in self._commandQueues and fps * len(targets) > self._commandRate:
+            logger.info('HUE: start_effect: effect {0} needs {1} commands per second, more than command_rate {2}. Frames will be dropped'.format(effect, fps * len(targets), self._commandRate))
+        self._effectLamps.update((hueBridgeId, hueObjectId) for hueResource, hueObjectId, lampType in targets if hueResource == 'lights')
+        self._effectEngine.add(hueEffect)
+        return hueEffect.effectId
+
+    def stop_effect(self, effectIds=None):
+        # beendet einen effekt, eine liste von effekten oder ohne parameter alle effekte. die lampen bleiben im
+        # zustand des letzten bildes. liefert die anzahl der beendeten effekte
+        if effectIds is None:
+            effectIds = [runningEffect.effectId for runningEffect in self._effectEngine.get()]
+        elif not isinstance(effectIds, (list, tuple, set)):
+            effectIds = [effectIds]
+        removed = self._effectEngine.remove(effectIds)
+        for hueEffect in removed:
+            self._finish_effect(hueEffect)
+        return len(removed)
+
+    def get_effects(self):
+        # die laufenden effekte: id -> effekt, bridge, ziele, bildrate, dauer, laufzeit und die zahl der gesendeten
+        # und ausgelassenen bilder
+        return dict((hueEffect.effectId, {'effect': hueEffect.name, 'bridge': hueEffect.hueBridgeId, 'targets': [hueResource + '/' + hueObjectId for hueResource, hueObjectId, lampType in hueEffect.targets],
+                                          'fps': hueEffect.fps, 'duration': hueEffect.duration, 'running': round(time.time() - hueEffect.start, 1), 'frames': hueEffect.frames, 'frames_dropped': hueEffect.framesDropped})
+                    for hueEffect in self._effectEngine.get())
+
+    def _finish_effect(self, hueEffect):
+        # nach dem ende eines effekts wird der erreichte status der lampen einmal gelesen, sofern sie nicht in einem
+        # anderen effekt weiterlaufen
+        runningLamps = set((runningEffect.hueBridgeId, hueObjectId) for runningEffect in self._effectEngine.get() for hueResource, hueObjectId, lampType in runningEffect.targets if hueResource == 'lights')
+        for hueResource, hueObjectId, lampType in hueEffect.targets:
+            if hueResource == 'lights' and (hueEffect.hueBridgeId, hueObjectId) not in runningLamps:
+                self._effectLamps.discard((hueEffect.hueBridgeId, hueObjectId))
+                self._schedule_refresh(hueEffect.hueBridgeId, hueResource, hueObjectId, self._get_command_delay(hueEffect.hueBridgeId) + 1.0 / hueEffect.fps + max(self._readAfterWrite, 0.5))
+
+    def _render_effect(self, hueEffect, elapsed):
+        # berechnet ein bild für alle ziele des effekts. die farben werden in einem durchgang nach xy umgerechnet,
+        # unveränderte ziele bekommen keinen befehl. wartet für ein ziel noch der befehl des letzten bildes, dann
+        # ist die bridge im rückstand und das alte bild wird in der warteschlange durch das neue ersetzt
+        effectFunction = self._effectFunctions[hueEffect.name]
+        colors = []
+        brightnesses = []
+        for targetIndex in range(len(hueEffect.targets)):
+            rgb, bri = effectFunction(hueEffect, elapsed, targetIndex)
+            colors.append(rgb)
+            brightnesses.append(int(min(max(bri, 1), 254)))
+        xyPoints = self.getXYPointsFromRGB(colors, [lampType for hueResource, hueObjectId, lampType in hueEffect.targets])
+        hueTransitionTime = max(int(round(10.0 / hueEffect.fps)), 1)
+        commandQueue = self._commandQueues.get(hueEffect.hueBridgeId)
+        stale = False
+        for (hueResource, hueObjectId, lampType), xyPoint, bri in zip(hueEffect.targets, xyPoints, brightnesses):
+            state = {'xy': [round(float(xyPoint[0]), 4), round(float(xyPoint[1]), 4)], 'bri': bri}
+            if hueEffect.lastStates.get(hueObjectId) == state:
+                continue
+            if hueObjectId not in hueEffect.lastStates:
+                state['on'] = True
+            hueEffect.lastStates[hueObjectId] = {'xy': state['xy'], 'bri': bri}
+            state['transitiontime'] = hueTransitionTime
+            if commandQueue is not None and commandQueue.alive and commandQueue.is_pending(hueResource, hueObjectId):
+                stale = True
+            if hueResource == 'lights':
+                self._send_lamp_state(hueEffect.hueBridgeId, hueObjectId, state, PRIORITY_BULK)
+            else:
+                self._send_group_state(hueEffect.hueBridgeId, hueObjectId, state, PRIORITY_BULK)
+        if stale:
+            hueEffect.framesDropped += 1
+
+    def _effect_candle(self, hueEffect, elapsed, targetIndex):
+        # flackern um die grundhelligkeit bri (default 150) in der farbe color (default kerzenlicht)
+        bri = float(hueEffect.params.get('bri', 150))
+        flicker = hueEffect.random.random()
+        return hueEffect.params.get('color', (255, 147, 41)), bri * (0.7 + 0.3 * flicker * flicker)
+
+    def _effect_sunrise(self, hueEffect, elapsed, targetIndex):
+        # sonnenaufgang über die dauer des effekts von dunklem rot bis warmweiss in der helligkeit bri (default 254)
+        keyFrames = ((0.0, (255, 30, 0), 0.0), (0.3, (255, 90, 0), 0.25), (0.7, (255, 170, 70), 0.65), (1.0, (255, 230, 200), 1.0))
+        progress = min(max(elapsed / hueEffect.duration, 0.0), 1.0)
+        for (startProgress, startColor, startBri), (endProgress, endColor, endBri) in zip(keyFrames, keyFrames[1:]):
+            if progress <= endProgress:
+                break
+        share = (progress - startProgress) / (endProgress - startProgress)
+        rgb = tuple(int(round(start + (end - start) * share)) for start, end in zip(startColor, endColor))
+        return rgb, float(hueEffect.params.get('bri', 254)) * (startBri + (endBri - startBri) * share)
+
+    def _effect_sweep(self, hueEffect, elapsed, targetIndex):
+        # farbkreis, der in period sekunden (default 30) einmal durchlaufen wird. die ziele sind um spread (default
+        # 1.0 = ein ganzer farbkreis) über die lampen versetzt
+        period = float(hueEffect.params.get('period', 30))
+        spread = float(hueEffect.params.get('spread', 1.0))
+        hue = (elapsed / period + spread * targetIndex / len(hueEffect.targets)) % 1.0
+        rgb = tuple(int(round(value * 255)) for value in colorsys.hsv_to_rgb(hue, 1.0, 1.0))
+        return rgb, float(hueEffect.params.get('bri', 254))
+
+    def refresh_static(self, hueBridgeId=None):
+        # liest die statischen attribute (name, modelid, swversion, ...) einer oder aller bridges neu und überträgt
+        # die geänderten werte auf die items. wird im zyklus cycle_static aufgerufen oder auf anforderung
+        if hueBridgeId is None:
+            hueBridgeIds = [str(numberBridgeId) for numberBridgeId in range(self._numberHueBridges)]
+        else:
+            hueBridgeIds = [hueBridgeId]
+        for hueStaticKey in self._listenStaticRoutes:
+            if hueStaticKey[0] in hueBridgeIds:
+                self._staticPending.add(hueStaticKey)
+        self._poll_bridges(self._update_static_bridge, hueBridgeIds)
+
+    def _update_static_bridge(self, hueBridgeId):
+        # es werden nur die ressourcen abgefragt, für die noch statische attribute ausstehen
+        for hueResource in ('lights', 'groups', 'config'):
+            if not [hueStaticKey for hueStaticKey in list(self._staticPending) if hueStaticKey[0] == hueBridgeId and hueStaticKey[1] == hueResource]:
+                continue
+            with self._bridge_lock(hueBridgeId):
+                returnValues = self._get_web_content(hueBridgeId, '/' + hueResource)
+                if returnValues == None:
+                    continue
+                if hueResource == 'config':
+                    returnValues = {hueBridgeId: returnValues}
+                self._apply_static_routes(hueBridgeId, hueResource, returnValues)
+
+    def _invalidate_applied_values(self, hueBridgeId, hueResource, hueObjectId):
+        # nach einem schreibbefehl stimmen die items nicht mehr sicher mit der bridge überein. damit das nächste
+        # polling sie wieder setzt, werden die gemerkten werte verworfen. bei gruppen betrifft das auch die lampen
+        self._appliedValues.pop((hueBridgeId, hueResource, hueObjectId), None)
+        if hueResource == 'groups':
+            if hueObjectId == '0':
+                hueLampIds = self._bridgeSnapshots[hueBridgeId]['lights'].keys()
+            else:
+                hueLampIds = self._groupMembers.get(hueBridgeId, {}).get(hueObjectId, ())
+            for hueLampId in list(hueLampIds):
+                self._appliedValues.pop((hueBridgeId, 'lights', hueLampId), None)
+
+    def _poll_bridges(self, pollMethod, hueBridgeIds=None):
+        # führt die abfrage für alle bridges aus. bei mehreren bridges und poll_workers > 1 werden die bridges
+        # parallel im thread pool abgefragt, jede bridge unter ihrem eigenen lock. gewartet wird auf alle,
+        # damit sich die scheduler aufrufe nicht überholen
+        if hueBridgeIds is None:
+            hueBridgeIds = [str(numberBridgeId) for numberBridgeId in range(self._numberHueBridges)]
+        if self._pollExecutor is None or len(hueBridgeIds) < 2:
+            for hueBridgeId in hueBridgeIds:
+                self._timed_poll(pollMethod, hueBridgeId)
+        else:
+            futures = [self._pollExecutor.submit(self._timed_poll, pollMethod, hueBridgeId) for hueBridgeId in hueBridgeIds]
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is not None:
+                    logger.error('HUE: _poll_bridges: problem in {0}: {1}'.format(pollMethod.__name__, future.exception()))
+
+    def _timed_poll(self, pollMethod, hueBridgeId):
+        # abfrage einer bridge mit messung der dauer, die statistik läuft unter dem namen der abfrage (lamps, groups, ...)
+        pollStart = time.time()
+        try:
+            pollMethod(hueBridgeId)
+        finally:
+            self._bridgeStats[hueBridgeId].add_poll(pollMethod.__name__.replace('_update_', '').replace('_bridge', '').strip('_'), time.time() - pollStart)
+
+    def _set_poll_interval(self, hueBridgeId, interval):
+        # setzt den abfragezyklus der lampen und gruppen einer bridge und zeigt ihn im item poll_interval an
+        self._pollIntervals[hueBridgeId] = interval
+        self._pollNext[hueBridgeId] = time.time() + interval
+        if hueBridgeId + '.poll_interval' in self._listenBridgeItems:
+            pollIntervalItem = self._listenBridgeItems[hueBridgeId + '.poll_interval']
+            if pollIntervalItem() != interval:
+                pollIntervalItem(interval, 'HUE')
+
+    def _update_lamps_adaptive(self):
+        # abfrage aller bridges, deren zyklus abgelaufen ist. ein halber schneller zyklus toleranz, damit die
+        # abweichungen im scheduler nicht einen ganzen zyklus kosten
+        dueTime = time.time() + self._cycle_lamps_fast / 2
+        hueBridgeIds = [hueBridgeId for hueBridgeId, pollNext in self._pollNext.items() if pollNext <= dueTime]
+        if self._pollMode == 'full':
+            # die konfiguration kommt im poll_mode = full nur mit der gesamten abfrage
+            hueBridgeIds.extend(hueBridgeId for hueBridgeId in self._get_config_due_bridges(dueTime) if hueBridgeId not in hueBridgeIds)
+        if hueBridgeIds:
+            self._poll_bridges(self._update_lamps_adaptive_bridge, hueBridgeIds)
+
+    def _update_lamps_adaptive_bridge(self, hueBridgeId):
+        # nach einer änderung aus der bridge (z.b. wandschalter) geht es zurück auf den schnellen zyklus,
+        # sonst wird der zyklus bis zum langsamen zyklus cycle_lamps verdoppelt
+        itemWritesApplied = self._itemWritesApplied[hueBridgeId]
+        if self._pollMode == 'full':
+            self._update_full_bridge(hueBridgeId)
+        else:
+            self._update_lamps_bridge(hueBridgeId)
+            self._update_groups_bridge(hueBridgeId)
+        if self._is_streaming(hueBridgeId):
+            self._set_poll_interval(hueBridgeId, self._cycle_lamps_stream)
+        elif self._itemWritesApplied[hueBridgeId] > itemWritesApplied:
+            self._set_poll_interval(hueBridgeId, self._cycle_lamps_fast)
+        else:
+            self._set_poll_interval(hueBridgeId, min(self._pollIntervals[hueBridgeId] * 2, self._cycle_lamps))
+
+    def _get_poll_bridges(self, hueResource):
+        # bridges mit verbundenem event stream werden nur noch im langsamen zyklus cycle_lamps_stream abgefragt
+        hueBridgeIds = []
+        now = time.time()
+        for numberBridgeId in range(self._numberHueBridges):
             hueBridgeId = str(numberBridgeId)
-            self._hueLock.acquire()
+            if self._is_streaming(hueBridgeId):
+                if self._streamPollNext.get((hueBridgeId, hueResource), 0) > now:
+                    continue
+                self._streamPollNext[(hueBridgeId, hueResource)] = now + self._cycle_lamps_stream
+            hueBridgeIds.append(hueBridgeId)
+        return hueBridgeIds
+
+    def _refresh_object(self, hueBridgeId, hueResource, hueObjectId):
+        # liest den status einer einzelnen lampe oder gruppe und überträgt ihn auf die items
+        with self._bridge_lock(hueBridgeId):
+            returnValues = self._get_web_content(hueBridgeId, '/%s/%s' % (hueResource, hueObjectId))
+            if returnValues == None:
+                return None
+            with self._shadowLock:
+                self._bridgeSnapshots[hueBridgeId][hueResource][hueObjectId] = returnValues
+                if hueResource == 'lights':
+                    self._unconfirmedLamps[hueBridgeId].discard(hueObjectId)
+            if hueResource == 'lights':
+                hueRoutes = self._listenLampRoutes.get((hueBridgeId, hueObjectId))
+                hueSections = ('state',)
+            else:
+                hueRoutes = self._listenGroupRoutes.get((hueBridgeId, hueObjectId))
+                hueSections = ('state', 'action')
+            if hueRoutes:
+                self._apply_routes(hueBridgeId, hueResource, hueObjectId, hueRoutes, returnValues, hueSections)
+            return returnValues
+
+    def _update_lamps(self):
+        # mache ich mit der API get all lights für alle bridges
+        self._poll_bridges(self._update_lamps_bridge, self._get_poll_bridges('lights'))
+
+    def _update_lamps_bridge(self, hueBridgeId):
+        with self._bridge_lock(hueBridgeId):
             returnValues = self._get_web_content(hueBridgeId, '/lights')
             if returnValues == None:
-                self._hueLock.release()
-                return
-            # schleife über alle gefundenen lampen
-            for hueLampId, hueLampIdValues in returnValues.items():
-                # schleife über alle rückmeldungen der lampen.
-                # jetzt muss ich etwas tricksen, da die states eine ebene tiefer als die restlichen infos der lampe liegen
-                # in den items ist das aber eine flache hierachie. um nur eine schleife darüber zu haben, baue ich mir ein
-                # entsprechendes dict zusammen. 'state' ist zwar doppelt drin, stört aber nicht, da auch auf unterer ebene.
-                dictOptimized = hueLampIdValues['state'].copy()
-                dictOptimized.update(returnValues[hueLampId].items())
-                # jetzt kann der durchlauf beginnen
-                for hueObjectItem, hueObjectItemValue in dictOptimized.items():
-                    # nachdem alle objekte und werte auf die gleiche ebene gebracht wurden, beginnt die zuordnung
-                    # vor hier an werden die ganzen listen items durchgesehen und die werte aus der rückmeldung zugeordnet
-                    for returnItem in self._listenLampItems:
-                        # wenn ein listen item angelegt wurde und dafür ein status zurückkam
-                        # verglichen wird mit dem referenzkey, der weiter oben aus lampid und state gebaut wurde
-                        if returnItem == (hueBridgeId + '.' + hueLampId + '.' + hueObjectItem):
-                            # dafür wir der reale wert der hue bridge gesetzt
-                            if hueObjectItem in self._boolKeys:
-                                value = bool(hueObjectItemValue)
-                            elif hueObjectItem in self._stringKeys:
-                                value = str(hueObjectItemValue)
-                            else:
-                                value = int(hueObjectItemValue)
-                            # wenn der wert gerade im fading ist, dann nicht überschreiben, sonst bleibt es stehen !
-                            if not self._listenLampItems[returnItem]._fading:
-                                # es werden nur die Einträge zurückgeschrieben, falls die Lampe nich im fading betrieb ist
-                                if hueObjectItem == 'bri':
-                                    # bei brightness gibt es eine fallunterscheidung
-                                    if hueBridgeId + '.' + hueLampId + '.on' in self._listenLampItems:
-                                        # geht aber nur, wenn ein solches item vorhanden ist
-                                        if self._listenLampItems[(hueBridgeId + '.' + hueLampId + '.on')]():
-                                            # die brightness darf nur bei lamp = on zurückgeschrieben werden, den bei aus ist sie immer 0
-                                            self._listenLampItems[returnItem](value, 'HUE')
-                                else:
-                                    # bei allen anderen kann zurückgeschrieben werden
-                                    self._listenLampItems[returnItem](value, 'HUE')
-            self._hueLock.release()
-            numberBridgeId = numberBridgeId + 1
+                return None
+            self._apply_lights(hueBridgeId, returnValues)
+            return returnValues
+
+    def _apply_lights(self, hueBridgeId, returnValues):
+        # überträgt die antwort von /lights auf die items, aufruf unter dem lock der bridge
+        with self._shadowLock:
+            self._bridgeSnapshots[hueBridgeId]['lights'] = returnValues
+            self._shadowValid[hueBridgeId] = True
+            self._unconfirmedLamps[hueBridgeId].clear()
+        # schleife über alle gefundenen lampen, es werden nur die lampen mit gebundenen items bearbeitet
+        for hueLampId, hueLampIdValues in returnValues.items():
+            hueLampRoutes = self._listenLampRoutes.get((hueBridgeId, hueLampId))
+            if hueLampRoutes:
+                self._apply_routes(hueBridgeId, 'lights', hueLampId, hueLampRoutes, hueLampIdValues, ('state',))
+        if self._staticPending:
+            self._apply_static_routes(hueBridgeId, 'lights', returnValues)
 
     def _update_groups(self):
-        # mache ich mit der API get all groups
-        # hier kommt der PUT request, um die stati an die hue bridge zu übertragen beispiel:
-        numberBridgeId = 0
-        while numberBridgeId < self._numberHueBridges:
-            hueBridgeId = str(numberBridgeId)
-            self._hueLock.acquire()
+        # mache ich mit der API get all groups für alle bridges
+        self._poll_bridges(self._update_groups_bridge, self._get_poll_bridges('groups'))
+
+    def _update_groups_bridge(self, hueBridgeId):
+        with self._bridge_lock(hueBridgeId):
             returnValues = self._get_web_content(hueBridgeId, '/groups')
             if returnValues == None:
-                self._hueLock.release()
-                return
-            # schleife über alle gefundenen lampen
-            for hueGroupId, hueGroupIdValues in returnValues.items():
-                # schleife über alle rückmeldungen der lampen.
-                # jetzt muss ich etwas tricksen, da die states eine ebene tiefer als die restlichen infos der lampe liegen
-                # in den items ist das aber eine flache hierachie. um nur eine schleife darüber zu haben, baue ich mir ein
-                # entsprechendes dict zusammen. 'state' ist zwar doppelt drin, stört aber nicht, da auch auf unterer ebene.
-                if 'state' in hueGroupIdValues:
-                    dictOptimized = hueGroupIdValues['state'].copy()
-                    dictOptimized.update(returnValues[hueGroupId].items())
-                    # jetzt kann der durchlauf beginnen
-                    for hueObjectItem, hueObjectItemValue in dictOptimized.items():
-                        # nachdem alle objekte und werte auf die gleiche ebene gebracht wurden, beginnt die zuordnung
-                        # vor hier an werden die ganzen listen items durchgesehen und die werte aus der rückmeldung zugeordnet
-                        for returnItem in self._listenGroupItems:
-                            # wenn ein listen item angelegt wurde und dafür ein status zurückkam
-                            # verglichen wird mit dem referenzkey, der weiter oben aus lampid und state gebaut wurde
-                            if returnItem == (hueBridgeId + '.' + hueGroupId + '.' + hueObjectItem):
-                                # dafür wir der reale wert der hue bridge gesetzt
-                                if hueObjectItem in self._boolKeys:
-                                    value = bool(hueObjectItemValue)
-                                elif hueObjectItem in self._stringKeys:
-                                    value = str(hueObjectItemValue)
-                                else:
-                                    value = int(hueObjectItemValue)
-                                # wenn der wert gerade im fading ist, dann nicht überschreiben, sonst bleibt es stehen !
-                                if not self._listenGroupItems[returnItem]._fading:
-                                    # es werden nur die Einträge zurückgeschrieben, falls die Lampe nich im fading betrieb ist
-                                    if hueObjectItem == 'bri':
-                                        # bei brightness gibt es eine fallunterscheidung
-                                        if hueBridgeId + '.' + hueGroupId + '.on' in self._listenGroupItems:
-                                            # geht aber nur, wenn ein solches item vorhanden ist
-                                            if self._listenGroupItems[(hueBridgeId + '.' + hueGroupId + '.on')]():
-                                                # die brightness darf nur bei lamp = on zurückgeschrieben werden, den bei aus ist sie immer 0
-                                                self._listenGroupItems[returnItem](value, 'HUE')
-                                    else:
-                                        # bei allen anderen kann zurückgeschrieben werden
-                                        self._listenLampItems[returnItem](value, 'HUE')
-            self._hueLock.release()
-            numberBridgeId = numberBridgeId + 1
+                return None
+            self._apply_groups(hueBridgeId, returnValues)
+            return returnValues
+
+    def _apply_groups(self, hueBridgeId, returnValues):
+        # überträgt die antwort von /groups auf die items, aufruf unter dem lock der bridge
+        self._bridgeSnapshots[hueBridgeId]['groups'] = returnValues
+        # die lampen der gruppen merken für die ersetzung von lampenbefehlen durch gruppenbefehle
+        self._groupMembers[hueBridgeId] = dict((hueGroupId, frozenset(hueGroupIdValues.get('lights', ()))) for hueGroupId, hueGroupIdValues in returnValues.items())
+        # schleife über alle gefundenen gruppen, es werden nur die gruppen mit gebundenen items bearbeitet
+        # die lampen attribute einer gruppe liegen in 'action', der zusammengefasste status in 'state'
+        for hueGroupId, hueGroupIdValues in returnValues.items():
+            hueGroupRoutes = self._listenGroupRoutes.get((hueBridgeId, hueGroupId))
+            if hueGroupRoutes:
+                self._apply_routes(hueBridgeId, 'groups', hueGroupId, hueGroupRoutes, hueGroupIdValues, ('state', 'action'))
+        if self._staticPending:
+            self._apply_static_routes(hueBridgeId, 'groups', returnValues)
 
     def _update_bridges(self):
-        # der datenabruf besteht aus dem befehl get configuration bridge
-        numberBridgeId = 0
-        while numberBridgeId < self._numberHueBridges:
-            hueBridgeId = str(numberBridgeId)
-            self._hueLock.acquire()
+        # der datenabruf besteht aus dem befehl get configuration bridge für alle bridges
+        self._poll_bridges(self._update_bridges_bridge)
+
+    def _update_bridges_bridge(self, hueBridgeId):
+        with self._bridge_lock(hueBridgeId):
             returnValues = self._get_web_content(hueBridgeId, '/config')
             if returnValues == None:
-                self._hueLock.release()
                 return
-            # schleife über alle gefundenen lampen
-            for hueObjectItem, hueObjectItemValue in returnValues.items():
-                # nachdem alle objekte und werte auf die gleiche ebene gebracht wurden, beginnt die zuordnung
-                # vor hier an werden die ganzen listen items durchgesehen und die werte aus der rückmeldung zugeordnet
-                for returnItem in self._listenBridgeItems:
-                    # wenn ein listen item angelegt wurde und dafür ein status zurückkam
-                    # verglichen wird mit dem referenzkey, der weiter oben aus lampid und state gebaut wurde
-                    if hueObjectItem == 'swversion':
-                        hueObjectItem = 'bridge_swversion'
-                    if hueObjectItem == 'name':
-                        hueObjectItem = 'bridge_name'
-                    if returnItem == (hueBridgeId + '.' + hueObjectItem):
-                        # dafür wir der reale wert der hue bridge gesetzt
-                        if hueObjectItem in self._boolKeys:
-                            value = bool(hueObjectItemValue)
-                        elif hueObjectItem in self._stringKeys:
-                            value = str(hueObjectItemValue)
-                        elif hueObjectItem in self._dictKeys:
-                            value = dict(hueObjectItemValue)
-                        else:
-                            value = int(hueObjectItemValue)
-                        # wenn der wert gerade im fading ist, dann nicht überschreiben, sonst bleibt es stehen !
-                        self._listenBridgeItems[returnItem](value, 'HUE')
-            self._hueLock.release()
-            numberBridgeId = numberBridgeId + 1
+            self._apply_config(hueBridgeId, returnValues)
+        self._update_stats_items(hueBridgeId)
+
+    def _apply_config(self, hueBridgeId, returnValues):
+        # überträgt die antwort von /config auf die items, aufruf unter dem lock der bridge
+        self._bridgeSnapshots[hueBridgeId]['config'] = returnValues
+        hueBridgeRoutes = self._listenBridgeRoutes.get(hueBridgeId)
+        if hueBridgeRoutes:
+            self._apply_routes(hueBridgeId, 'config', hueBridgeId, hueBridgeRoutes, returnValues)
+        if self._staticPending:
+            self._apply_static_routes(hueBridgeId, 'config', {hueBridgeId: returnValues})
+
+    def _update_full(self):
+        # mache ich mit der API get full state für alle bridges. bridges mit event stream werden nur im langsamen
+        # zyklus abgefragt, aber mindestens dann, wenn die konfiguration wieder fällig ist
+        hueBridgeIds = self._get_poll_bridges('full')
+        hueBridgeIds.extend(hueBridgeId for hueBridgeId in self._get_config_due_bridges(time.time()) if hueBridgeId not in hueBridgeIds)
+        self._poll_bridges(self._update_full_bridge, hueBridgeIds)
+
+    def _get_config_due_bridges(self, dueTime):
+        return [hueBridgeId for hueBridgeId, configNext in self._configNext.items() if configNext <= dueTime]
+
+    def _update_full_bridge(self, hueBridgeId):
+        # lampen, gruppen und konfiguration kommen aus einer antwort. die konfiguration wird nur im zyklus
+        # cycle_bridges übertragen, mit einem halben lampenzyklus toleranz für die abweichungen im scheduler
+        with self._bridge_lock(hueBridgeId):
+            returnValues = self._get_web_content(hueBridgeId, '')
+            if returnValues == None:
+                return
+            self._apply_lights(hueBridgeId, returnValues.get('lights', {}))
+            self._apply_groups(hueBridgeId, returnValues.get('groups', {}))
+            now = time.time()
+            applyConfig = self._configNext[hueBridgeId] <= now + self._cycle_lamps / 2
+            if applyConfig:
+                self._configNext[hueBridgeId] = now + self._cycle_bridges
+                self._apply_config(hueBridgeId, returnValues.get('config', {}))
+        if applyConfig:
+            self._update_stats_items(hueBridgeId)
+
+    def _update_stats_items(self, hueBridgeId):
+        # die statistik wird im zyklus der bridge abfrage auf die stats items geschrieben
+        hueStatsItems = [hueStatsKey for hueStatsKey in ('stats', 'request_latency', 'request_errors', 'request_timeouts', 'queue_depth', 'poll_duration') if hueBridgeId + '.' + hueStatsKey in self._listenBridgeItems]
+        if not hueStatsItems:
+            return
+        stats = self.get_stats(hueBridgeId)
+        hueStatsValues = {'stats': stats, 'request_latency': stats['request_latency']['mean_ms'], 'request_errors': stats['request_errors'], 'request_timeouts': stats['request_timeouts'], 'queue_depth': stats['queue_depth'],
+                          'poll_duration': stats['poll'].get(self._get_poll_name(), {}).get('last_ms', 0)}
+        for hueStatsKey in hueStatsItems:
+            hueStatsItem = self._listenBridgeItems[hueBridgeId + '.' + hueStatsKey]
+            if hueStatsItem() != hueStatsValues[hueStatsKey]:
+                hueStatsItem(hueStatsValues[hueStatsKey], 'HUE')
+
+    def _get_poll_name(self):
+        # name der abfrage, die im zyklus cycle_lamps die lampen liest, für poll_duration
+        if self._cycle_lamps_fast > 0:
+            return 'lamps_adaptive'
+        if self._pollMode == 'full':
+            return 'full'
+        return 'lamps'
+
+    def get_stats(self, hueBridgeId=None):
+        # laufzeitstatistik einer bridge oder aller bridges (dict bridge -> statistik), z.b. für die cli
+        if hueBridgeId is None:
+            return dict((str(numberBridgeId), self.get_stats(str(numberBridgeId))) for numberBridgeId in range(self._numberHueBridges))
+        stats = self._bridgeStats[hueBridgeId].get()
+        if hueBridgeId in self._commandQueues:
+            stats['queue_depth'] = self._commandQueues[hueBridgeId].qsize()
+            stats['queue_depth_max'] = self._commandQueues[hueBridgeId].maxDepth
+        else:
+            stats['queue_depth'] = 0
+            stats['queue_depth_max'] = 0
+        stats['item_writes_applied'] = self._itemWritesApplied[hueBridgeId]
+        stats['item_writes_suppressed'] = self._itemWritesSuppressed[hueBridgeId]
+        stats['poll_interval'] = self._pollIntervals[hueBridgeId]
+        stats['breaker_state'] = self._circuitBreakers[hueBridgeId].state if hueBridgeId in self._circuitBreakers else 'closed'
+        return stats
+
+    def _is_streaming(self, hueBridgeId):
+        return hueBridgeId in self._eventStreams and self._eventStreams[hueBridgeId].connected
+
+    def _get_event_stream_url(self, hueBridgeId):
+        return self._eventStreamScheme + '://' + self._hue_ip[int(hueBridgeId)] + '/eventstream/clip/v2'
+
+    def _get_event_method(self, hueBridgeId):
+        # verarbeitung der events aus dem stream einer bridge
+        def eventMethod(events):
+            for event in events:
+                if event.get('type') in ('update', 'add'):
+                    for eventData in event.get('data', ()):
+                        self._apply_event(hueBridgeId, eventData)
+        return eventMethod
+
+    def _apply_event(self, hueBridgeId, eventData):
+        # der event stream liefert die objekte der API v2. zugeordnet wird über id_v1 (z.b. '/lights/3'), die werte
+        # werden in die attribute der API v1 umgerechnet und wie beim polling auf die items geschrieben
+        idV1 = eventData.get('id_v1', '').split('/')
+        if len(idV1) != 3 or idV1[1] not in ('lights', 'groups'):
+            return
+        hueResource = idV1[1]
+        hueObjectId = idV1[2]
+        values = {}
+        if 'on' in eventData:
+            values['on'] = eventData['on']['on']
+        if 'dimming' in eventData:
+            values['bri'] = max(1, int(round(eventData['dimming']['brightness'] * 254 / 100)))
+        if 'color' in eventData and 'xy' in eventData['color']:
+            values['xy'] = [eventData['color']['xy']['x'], eventData['color']['xy']['y']]
+        if 'color_temperature' in eventData and eventData['color_temperature'].get('mirek') is not None:
+            values['ct'] = eventData['color_temperature']['mirek']
+        if 'status' in eventData and hueResource == 'lights':
+            # zigbee_connectivity der lampe
+            values['reachable'] = eventData['status'] == 'connected'
+        if not values:
+            return
+        with self._bridge_lock(hueBridgeId):
+            # der letzte stand der bridge wird mitgeführt. meldet das event den status einer lampe, ist er damit wieder
+            # bestätigt, z.b. nach einem gruppenbefehl, und gleiche befehle werden wieder unterdrückt
+            with self._shadowLock:
+                hueObjectValues = self._bridgeSnapshots[hueBridgeId][hueResource].get(hueObjectId)
+                if hueObjectValues is not None:
+                    hueObjectValues.setdefault('action' if hueResource == 'groups' else 'state', {}).update(values)
+                    if hueResource == 'lights':
+                        self._unconfirmedLamps[hueBridgeId].discard(hueObjectId)
+            if hueResource == 'lights':
+                hueRoutes = self._listenLampRoutes.get((hueBridgeId, hueObjectId))
+            else:
+                hueRoutes = self._listenGroupRoutes.get((hueBridgeId, hueObjectId))
+            if hueRoutes:
+                self._apply_routes(hueBridgeId, hueResource, hueObjectId, hueRoutes, values)
 
     def get_config(self, hueBridgeId='0'):
         # hier eine interaktive routing für di ecli, um den user herauszubekommen, 
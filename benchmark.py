@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#
+#  Copyright (C) 2014,2015 Michael Würtenberger
+#
+#  Benchmark des HUE plugins gegen simulierte bridges (simulator.py). Gemessen werden die dauer und die cpu zeit
+#  eines polling zyklus, die latenz der befehle vom item bis zur bridge und die kosten der zuordnung der
+#  rückmeldungen zu den items in abhängigkeit von der anzahl der gebundenen items.
+#  Aufruf aus dem plugins verzeichnis von smarthome.py:
+#
+#  python3 -m hue.benchmark --bridges 1,5,10 --lamps 10,150,500
+#
+#  APL2.0
+#
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from . import HUE
+from .simulator import HueBridgeSimulator
+
+class BenchmarkScheduler():
+    # die jobs werden nur gemerkt, der benchmark ruft die methoden selbst auf
+    def __init__(self):
+        self.jobs = {}
+
+    def add(self, name, obj, prio=3, cron=None, cycle=None, value=None, offset=None, next=None):
+        self.jobs[name] = obj
+
+    def remove(self, name):
+        self.jobs.pop(name, None)
+
+class BenchmarkSmartHome():
+    # base_dir ist ein temporäres verzeichnis, es wird mit cleanup() wieder entfernt
+    def __init__(self):
+        self.scheduler = BenchmarkScheduler()
+        self._baseDir = tempfile.TemporaryDirectory(prefix='hue-benchmark-')
+        self.base_dir = self._baseDir.name
+
+    def cleanup(self):
+        self._baseDir.cleanup()
+
+class BenchmarkItem():
+    # die teile eines smarthome.py items, die das plugin benutzt
+    def __init__(self, smarthome, path, conf, parent=None, value=None):
+        self._sh = smarthome
+        self._path = path
+        self._parent = parent
+        self._value = value
+        self._fading = False
+        self._methods = []
+        self.conf = dict(conf)
+        self.writes = 0
+
+    def __call__(self, value=None, caller='Logic', source=None, dest=None):
+        if value is None:
+            return self._value
+        self._value = value
+        self.writes += 1
+        for method in self._methods:
+            method(self, caller, source, dest)
+
+    def __str__(self):
+        return self._path
+
+    def id(self):
+        return self._path
+
+    def return_parent(self):
+        if self._parent is None:
+            return self._sh
+        return self._parent
+
+    def fade(self, dest, step=1, delta=1):
+        self(dest, 'Fader')
+
+class BenchmarkHUE(HUE):
+    # misst die cpu zeit der abfragen pro bridge, auch wenn sie parallel in den threads des plugins laufen
+    def __init__(self, *args, **kwargs):
+        self.cpuTime = 0.0
+        self._cpuTimeLock = threading.Lock()
+        HUE.__init__(self, *args, **kwargs)
+
+    def _poll_bridges(self, pollMethod, hueBridgeIds=None):
+        def measuredPollMethod(hueBridgeId):
+            cpuStart = time.thread_time()
+            try:
+                pollMethod(hueBridgeId)
+            finally:
+                with self._cpuTimeLock:
+                    self.cpuTime += time.thread_time() - cpuStart
+        measuredPollMethod.__name__ = pollMethod.__name__
+        HUE._poll_bridges(self, measuredPollMethod, hueBridgeIds)
+
+class HueBenchmark():
+
+    # attribute der items pro lampe
+    _lampListen = ['on', 'bri', 'hue', 'sat', 'ct', 'reachable', 'alert', 'effect', 'name', 'modelid', 'swversion']
+    _lampSend = ['on', 'bri', 'hue', 'sat', 'ct', 'alert', 'effect', 'col_r', 'col_g', 'col_b']
+
+    def __init__(self, bridges, lamps, latency=0.0, commandRate=0, pluginArgs={}):
+        self.smarthome = BenchmarkSmartHome()
+        self.simulators = []
+        for numberBridgeId in range(bridges):
+            simulator = HueBridgeSimulator(lamps=lamps, latency=latency, commandRate=commandRate)
+            simulator.start()
+            self.simulators.append(simulator)
+        args = {'hue_ip': ','.join(simulator.address for simulator in self.simulators), 'hue_user': ','.join(simulator.user for simulator in self.simulators),
+                'hue_port': ','.join(['80'] * bridges)}
+        args.update(pluginArgs)
+        self.hue = BenchmarkHUE(self.smarthome, **args)
+        self.items = []
+        self.lampItems = {}
+        for numberBridgeId in range(bridges):
+            hueBridgeId = str(numberBridgeId)
+            bridge = self._add_item('hue.b' + hueBridgeId, {'hue_bridge_id': hueBridgeId})
+            for hueListen in ('errorstatus', 'bridge_name', 'zigbeechannel', 'poll_interval'):
+                self._add_item(bridge._path + '.' + hueListen, {'hue_listen': hueListen}, bridge)
+            for hueLampId in self.simulators[numberBridgeId].lights:
+                self.lampItems[(hueBridgeId, hueLampId)] = self._add_lamp(hueBridgeId, hueLampId)
+            for hueGroupId in self.simulators[numberBridgeId].groups:
+                group = self._add_item('hue.b{0}.g{1}'.format(hueBridgeId, hueGroupId), {'hue_bridge_id': hueBridgeId, 'hue_group_id': hueGroupId})
+                for hueAttribute in ('on', 'bri'):
+                    self._add_item(group._path + '.' + hueAttribute, {'hue_listen_group': hueAttribute, 'hue_send_group': hueAttribute}, group)
+        self.hue.run()
+
+    def _add_item(self, path, conf, parent=None, value=None):
+        item = BenchmarkItem(self.smarthome, path, conf, parent, value)
+        method = self.hue.parse_item(item)
+        if method is not None:
+            item._methods.append(method)
+        self.items.append(item)
+        return item
+
+    def _add_lamp(self, hueBridgeId, hueLampId):
+        lamp = self._add_item('hue.b{0}.l{1}'.format(hueBridgeId, hueLampId), {'hue_bridge_id': hueBridgeId, 'hue_lamp_id': hueLampId, 'hue_lamp_type': '0'})
+        lampItems = {}
+        for hueAttribute in self._lampListen + [key for key in self._lampSend if key not in self._lampListen]:
+            conf = {}
+            if hueAttribute in self._lampListen:
+                conf['hue_listen'] = hueAttribute
+            if hueAttribute in self._lampSend:
+                conf['hue_send'] = hueAttribute
+            lampItems[hueAttribute] = self._add_item(lamp._path + '.' + hueAttribute, conf, lamp, 0 if hueAttribute in ('bri', 'hue', 'sat', 'ct', 'col_r', 'col_g', 'col_b') else None)
+        return lampItems
+
+    def stop(self):
+        self.hue.stop()
+        for simulator in self.simulators:
+            simulator.stop()
+        self.smarthome.cleanup()
+
+    def poll_cycle(self):
+        # ein zyklus cycle_lamps: lampen und gruppen aller bridges. liefert dauer und cpu zeit
+        self.hue.cpuTime = 0.0
+        start = time.perf_counter()
+        if self.hue._pollMode == 'full':
+            self.hue._update_full()
+        else:
+            self.hue._update_lamps()
+            self.hue._update_groups()
+        return time.perf_counter() - start, self.hue.cpuTime
+
+    def command_latency(self, commands, interval, timeout=10):
+        # setzt bri items zufälliger lampen und misst die zeit bis der befehl in der bridge angekommen ist
+        waiting = {}
+        latencies = []
+        done = threading.Condition()
+
+        def commandCallback(simulator):
+            def callback(resource, hueObjectId, state, commandTime):
+                with done:
+                    key = (simulator, hueObjectId)
+                    if resource == 'lights' and key in waiting and state.get('bri') == waiting[key][0]:
+                        latencies.append(commandTime - waiting.pop(key)[1])
+                        done.notify()
+            return callback
+
+        for simulator in self.simulators:
+            simulator.commandCallback = commandCallback(simulator)
+        for lampItems in self.lampItems.values():
+            lampItems['on']._value = True
+        keys = list(self.lampItems.keys())
+        for command in range(commands):
+            hueBridgeId, hueLampId = random.choice(keys)
+            value = command % 253 + 1
+            with done:
+                waiting[(self.simulators[int(hueBridgeId)], hueLampId)] = (value, time.time())
+            self.lampItems[(hueBridgeId, hueLampId)]['bri'](value, 'Visu')
+            time.sleep(interval)
+        end = time.time() + timeout
+        with done:
+            while waiting and time.time() < end:
+                done.wait(end - time.time())
+            lost = len(waiting)
+        for simulator in self.simulators:
+            simulator.commandCallback = None
+        return sorted(latencies), lost
+
+def percentile(values, percent):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+def benchmark_poll(bridgeCounts, lampCounts, cycles, latency, commands, interval, pluginArgs):
+    print('poll cycle (lamps + groups) and command latency')
+    print('{0:>7} {1:>6} {2:>7} {3:>12} {4:>12} {5:>12} {6:>9} {7:>9} {8:>9} {9:>5}'.format('bridges', 'lamps', 'items', 'first [ms]', 'cycle [ms]', 'cpu [ms]', 'p50 [ms]', 'p90 [ms]', 'p99 [ms]', 'lost'))
+    for bridges in bridgeCounts:
+        for lamps in lampCounts:
+            benchmark = HueBenchmark(bridges, lamps, latency, 0, pluginArgs)
+            try:
+                first, cpuFirst = benchmark.poll_cycle()
+                durations = []
+                cpuTimes = []
+                for cycle in range(cycles):
+                    duration, cpuTime = benchmark.poll_cycle()
+                    durations.append(duration)
+                    cpuTimes.append(cpuTime)
+                latencies, lost = benchmark.command_latency(commands, interval)
+                print('{0:>7} {1:>6} {2:>7} {3:>12.1f} {4:>12.1f} {5:>12.1f} {6:>9.1f} {7:>9.1f} {8:>9.1f} {9:>5}'.format(bridges, lamps, len(benchmark.items), first * 1000, sum(durations) / len(durations) * 1000,
+                      sum(cpuTimes) / len(cpuTimes) * 1000, percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000, percentile(latencies, 99) * 1000, lost))
+            finally:
+                benchmark.stop()
+
+def benchmark_dispatch(cases, cycles):
+    # kosten der decodierung und zuordnung einer /lights rückmeldung zu den items. cases ist eine liste von (lampen
+    # in der rückmeldung, davon gebundene lampen). die rückmeldung wird einmal geholt und dann ohne http immer wieder
+    # decodiert und zugeordnet. die decodierung wächst mit den lampen der rückmeldung, die zuordnung soll nur mit den
+    # gebundenen items wachsen und nicht mit lampen x items. alloc ist der höchste zusätzliche speicher während eines
+    # zyklus, gemessen mit tracemalloc
+    print('decode and dispatch of a /lights response')
+    print('{0:>7} {1:>12} {2:>12} {3:>12} {4:>14} {5:>16} {6:>12}'.format('lamps', 'bound lamps', 'bound items', 'decode [ms]', 'dispatch [ms]', 'dispatch/item [us]', 'alloc [kB]'))
+    for lamps, boundLamps in cases:
+        simulator = HueBridgeSimulator(lamps=lamps)
+        simulator.start()
+        try:
+            payload = json.dumps(simulator._get(['lights'])).encode('utf-8')
+            smarthome = BenchmarkSmartHome()
+            hue = HUE(smarthome, hue_ip=simulator.address, hue_user=simulator.user, command_rate='0', state_cache='off')
+            hue._fetch_url_v2 = lambda *args: payload
+            try:
+                items = 0
+                for numberLampId in range(1, boundLamps + 1):
+                    lamp = BenchmarkItem(smarthome, 'l{0}'.format(numberLampId), {'hue_bridge_id': '0', 'hue_lamp_id': str(numberLampId), 'hue_lamp_type': '0'})
+                    for hueAttribute in HueBenchmark._lampListen:
+                        hue.parse_item(BenchmarkItem(smarthome, lamp._path + '.' + hueAttribute, {'hue_listen': hueAttribute}, lamp))
+                        items += 1
+                cpuStart = time.thread_time()
+                for cycle in range(cycles):
+                    returnValues = hue._jsonLoads(payload)
+                decodeTime = (time.thread_time() - cpuStart) / cycles
+                cpuStart = time.thread_time()
+                for cycle in range(cycles):
+                    # ohne die gemerkten werte wird jedes mal wieder zugeordnet und geschrieben
+                    hue._appliedValues.clear()
+                    hue._apply_lights('0', returnValues)
+                dispatchTime = (time.thread_time() - cpuStart) / cycles
+                # die speichermessung läuft getrennt, weil tracemalloc die laufzeit verfälscht
+                hue._appliedValues.clear()
+                tracemalloc.start()
+                allocStart = tracemalloc.get_traced_memory()[0]
+                hue._update_lamps_bridge('0')
+                allocPeak = tracemalloc.get_traced_memory()[1] - allocStart
+                tracemalloc.stop()
+                print('{0:>7} {1:>12} {2:>12} {3:>12.3f} {4:>14.3f} {5:>16.2f} {6:>12.1f}'.format(lamps, boundLamps, items, decodeTime * 1000, dispatchTime * 1000, dispatchTime / max(items, 1) * 1000000, allocPeak / 1024.0))
+            finally:
+                hue.stop()
+                smarthome.cleanup()
+        finally:
+            simulator.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark of the hue plugin against simulated bridges')
+    parser.add_argument('--bridges', default='1,2,5,10', help='comma separated numbers of bridges')
+    parser.add_argument('--lamps', default='10,50,150,500', help='comma separated numbers of lamps per bridge')
+    parser.add_argument('--cycles', type=int, default=5, help='poll cycles per measurement')
+    parser.add_argument('--latency', type=float, default=0.005, help='response time of the simulated bridges in seconds')
+    parser.add_argument('--commands', type=int, default=50, help='number of commands for the latency measurement')
+    parser.add_argument('--interval', type=float, default=0.02, help='time between two commands in seconds')
+    parser.add_argument('--plugin', action='append', default=[], help='plugin.conf parameter as name=value, can be repeated')
+    args = parser.parse_args()
+    pluginArgs = dict(parameter.split('=', 1) for parameter in args.plugin)
+    lampCounts = [int(lamps) for lamps in args.lamps.split(',')]
+    # gebundene lampen bei fester zahl von lampen und lampen bei fester zahl von gebundenen lampen
+    boundCounts = sorted(set([min(lampCounts)] + [lamps for lamps in (10, 50, 150, 500) if lamps <= max(lampCounts)]))
+    cases = [(max(lampCounts), boundLamps) for boundLamps in boundCounts]
+    cases += [(lamps, min(lampCounts)) for lamps in sorted(set(lampCounts)) if (lamps, min(lampCounts)) not in cases]
+    benchmark_dispatch(cases, args.cycles)
+    print()
+    benchmark_poll([int(bridges) for bridges in args.bridges.split(',')], lampCounts, args.cycles, args.latency, args.commands, args.interval, pluginArgs)
+
+if __name__ == '__main__':
+    main()
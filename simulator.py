@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#
+#  Copyright (C) 2014,2015 Michael Würtenberger
+#
+#  Simulation einer hue bridge (API v1 und event stream der API v2) für tests und benchmarks ohne hardware.
+#  Die bridge läuft als http server im eigenen prozess. Anzahl der lampen, antwortzeit, fehlerrate und die
+#  maximale befehlsrate sind einstellbar.
+#
+#  APL2.0
+#
+
+import json
+import random
+import threading
+import time
+import queue
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class HueBridgeSimulator():
+
+    def __init__(self, lamps=10, groupSize=10, user='simulator', latency=0.0, errorRate=0.0, commandRate=0, host='127.0.0.1', port=0):
+        # latency: antwortzeit jedes requests in sekunden
+        # errorRate: anteil der requests, die mit http status 503 beantwortet werden
+        # commandRate: maximale anzahl der PUT befehle pro sekunde, darüber antwortet die bridge mit fehler 901
+        # und verwirft den befehl. 0 heisst keine begrenzung
+        self.user = user
+        self.latency = latency
+        self.errorRate = errorRate
+        self.commandRate = commandRate
+        self.lights = {}
+        for numberLampId in range(1, lamps + 1):
+            hueLampId = str(numberLampId)
+            self.lights[hueLampId] = {'state': {'on': False, 'bri': 254, 'hue': 8418, 'sat': 140, 'effect': 'none', 'xy': [0.4573, 0.41], 'ct': 366, 'alert': 'none', 'colormode': 'ct', 'reachable': True},
+                                      'type': 'Extended color light', 'name': 'Lamp ' + hueLampId, 'modelid': 'LCT007', 'manufacturername': 'Philips',
+                                      'uniqueid': '00:17:88:01:00:%02x:%02x:%02x-0b' % (numberLampId >> 16 & 255, numberLampId >> 8 & 255, numberLampId & 255), 'swversion': '5.23.1.13452'}
+        # die lampen werden in gruppen (räume) zu je groupSize lampen aufgeteilt
+        self.groups = {}
+        if groupSize > 0:
+            for numberGroupId in range(1, (lamps + groupSize - 1) // groupSize + 1):
+                hueGroupId = str(numberGroupId)
+                hueLampIds = [str(numberLampId) for numberLampId in range((numberGroupId - 1) * groupSize + 1, min(numberGroupId * groupSize, lamps) + 1)]
+                self.groups[hueGroupId] = {'name': 'Room ' + hueGroupId, 'lights': hueLampIds, 'type': 'Room', 'class': 'Living room', 'state': {}, 'action': {}}
+                self._update_group_state(hueGroupId)
+        self.config = {'name': 'Simulator', 'zigbeechannel': 15, 'mac': '00:17:88:00:00:00', 'dhcp': True, 'ipaddress': host, 'netmask': '255.255.255.0',
+                       'gateway': host, 'proxyaddress': 'none', 'proxyport': 0, 'UTC': '', 'localtime': '', 'timezone': 'Europe/Berlin',
+                       'whitelist': {user: {'name': 'smarthome'}}, 'swversion': '01036659', 'apiversion': '1.16.0', 'swupdate': {'updatestate': 0},
+                       'linkbutton': False, 'portalservices': False, 'portalconnection': 'disconnected', 'portalstate': {'signedon': False}}
+        # statistik
+        self.requests = 0
+        self.commands = 0
+        self.droppedCommands = 0
+        self.failedRequests = 0
+        # optionaler callback (resource, id, state, zeitpunkt) nach jedem ausgeführten befehl
+        self.commandCallback = None
+        self._commandTimes = []
+        self._lock = threading.RLock()
+        self._eventQueues = []
+        self._server = ThreadingHTTPServer((host, port), self._get_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        # host:port, so wie es in hue_ip angegeben wird
+        return '{0}:{1}'.format(*self._server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='hue-simulator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.drop_event_streams()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def drop_event_streams(self):
+        # beendet die verbindungen des event streams wie bei einem neustart der bridge, der server läuft weiter
+        with self._lock:
+            for eventQueue in self._eventQueues:
+                eventQueue.put(None)
+
+    def simulate_change(self, hueLampId, state):
+        # änderung einer lampe von aussen, z.b. über einen wandschalter oder die app
+        with self._lock:
+            self._set_lamp(hueLampId, state)
+
+    def _update_group_state(self, hueGroupId):
+        group = self.groups[hueGroupId]
+        states = [self.lights[hueLampId]['state'] for hueLampId in group['lights']]
+        group['state'] = {'all_on': all(state['on'] for state in states), 'any_on': any(state['on'] for state in states)}
+        if states:
+            group['action'] = dict((key, value) for key, value in states[0].items() if key != 'reachable')
+            group['action']['on'] = group['state']['any_on']
+
+    def _set_lamp(self, hueLampId, state):
+        lampState = self.lights[hueLampId]['state']
+        for key, value in state.items():
+            if key.endswith('_inc'):
+                limits = {'bri_inc': (1, 254), 'sat_inc': (0, 254), 'hue_inc': (0, 65535), 'ct_inc': (153, 500)}[key]
+                lampState[key[:-4]] = min(max(lampState[key[:-4]] + value, limits[0]), limits[1])
+            elif key != 'transitiontime':
+                lampState[key] = value
+            if key in ('xy', 'ct', 'hue', 'sat'):
+                lampState['colormode'] = 'hs' if key in ('hue', 'sat') else key
+        for hueGroupId, group in self.groups.items():
+            if hueLampId in group['lights']:
+                self._update_group_state(hueGroupId)
+        self._push_event('/lights/' + hueLampId, lampState)
+
+    def _push_event(self, idV1, state):
+        # event im format der API v2
+        eventData = {'id': idV1.replace('/', '-')[1:], 'id_v1': idV1, 'type': 'light', 'on': {'on': state['on']}, 'dimming': {'brightness': state['bri'] * 100.0 / 254}}
+        if 'xy' in state:
+            eventData['color'] = {'xy': {'x': state['xy'][0], 'y': state['xy'][1]}}
+        if 'ct' in state:
+            eventData['color_temperature'] = {'mirek': state['ct']}
+        event = [{'creationtime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'type': 'update', 'data': [eventData]}]
+        for eventQueue in self._eventQueues:
+            eventQueue.put(event)
+
+    def _accept_command(self):
+        # begrenzung der befehlsrate über ein gleitendes fenster von einer sekunde
+        if self.commandRate <= 0:
+            return True
+        now = time.time()
+        while self._commandTimes and self._commandTimes[0] < now - 1.0:
+            self._commandTimes.pop(0)
+        if len(self._commandTimes) >= self.commandRate:
+            return False
+        self._commandTimes.append(now)
+        return True
+
+    def _command(self, resource, hueObjectId, state):
+        with self._lock:
+            if not self._accept_command():
+                self.droppedCommands += 1
+                return [{'error': {'type': 901, 'address': '/{0}/{1}'.format(resource, hueObjectId), 'description': 'Internal error, 503'}}]
+            self.commands += 1
+            if resource == 'lights':
+                if hueObjectId not in self.lights:
+                    return [{'error': {'type': 3, 'address': '/lights/' + hueObjectId, 'description': 'resource, /lights/{0}, not available'.format(hueObjectId)}}]
+                self._set_lamp(hueObjectId, state)
+                address = '/lights/{0}/state/'.format(hueObjectId)
+            else:
+                if hueObjectId == '0':
+                    hueLampIds = list(self.lights.keys())
+                elif hueObjectId in self.groups:
+                    hueLampIds = self.groups[hueObjectId]['lights']
+                else:
+                    return [{'error': {'type': 3, 'address': '/groups/' + hueObjectId, 'description': 'resource, /groups/{0}, not available'.format(hueObjectId)}}]
+                lampState = dict((key, value) for key, value in state.items() if key != 'scene')
+                for hueLampId in hueLampIds:
+                    self._set_lamp(hueLampId, lampState)
+                address = '/groups/{0}/action/'.format(hueObjectId)
+            if self.commandCallback is not None:
+                self.commandCallback(resource, hueObjectId, state, time.time())
+            return [{'success': {address + key: value}} for key, value in state.items()]
+
+    def _get(self, path):
+        with self._lock:
+            if not path:
+                return {'lights': self.lights, 'groups': self.groups, 'config': self.config, 'scenes': {}, 'schedules': {}, 'sensors': {}, 'rules': {}}
+            resources = {'lights': self.lights, 'groups': self.groups, 'config': self.config, 'scenes': {}}
+            if path[0] not in resources:
+                return [{'error': {'type': 4, 'address': '/' + '/'.join(path), 'description': 'method, GET, not available for resource, /' + '/'.join(path)}}]
+            values = resources[path[0]]
+            for key in path[1:]:
+                if not isinstance(values, dict) or key not in values:
+                    return [{'error': {'type': 3, 'address': '/' + '/'.join(path), 'description': 'resource, /{0}, not available'.format('/'.join(path))}}]
+                values = values[key]
+            # kopie über json, damit der aufrufer keinen halb geänderten stand sieht
+            return json.loads(json.dumps(values))
+
+    def _get_handler(self):
+        simulator = self
+
+        class HueBridgeHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # header und inhalt gehen getrennt raus, ohne das würde jede antwort auf das delayed ack warten
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, values, status=200):
+                content = json.dumps(values).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _prepare(self):
+                # gemeinsamer teil aller requests: antwortzeit, fehler und user prüfen. liefert den pfad hinter dem user
+                simulator.requests += 1
+                if simulator.latency > 0:
+                    time.sleep(simulator.latency)
+                if simulator.errorRate > 0 and random.random() < simulator.errorRate:
+                    simulator.failedRequests += 1
+                    self._send_json({}, 503)
+                    return None
+                path = self.path.split('?')[0].strip('/').split('/')
+                if len(path) < 2 or path[0] != 'api':
+                    self._send_json([{'error': {'type': 4, 'address': self.path, 'description': 'method not available'}}])
+                    return None
+                if path[1] != simulator.user:
+                    self._send_json([{'error': {'type': 1, 'address': '/', 'description': 'unauthorized user'}}])
+                    return None
+                return path[2:]
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length', 0))
+                return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+            def do_GET(self):
+                if self.path.startswith('/eventstream/clip/v2'):
+                    self._event_stream()
+                    return
+                path = self._prepare()
+                if path is not None:
+                    self._send_json(simulator._get(path))
+
+            def do_PUT(self):
+                body = self._read_body()
+                path = self._prepare()
+                if path is None:
+                    return
+                if len(path) == 3 and path[0] == 'lights' and path[2] == 'state':
+                    self._send_json(simulator._command('lights', path[1], body))
+                elif len(path) == 3 and path[0] == 'groups' and path[2] == 'action':
+                    self._send_json(simulator._command('groups', path[1], body))
+                else:
+                    self._send_json([{'error': {'type': 4, 'address': self.path, 'description': 'method, PUT, not available'}}])
+
+            def do_POST(self):
+                # anmeldung eines users, der link button gilt als gedrückt
+                body = self._read_body()
+                username = body.get('username', simulator.user)
+                self._send_json([{'success': {'username': username}}])
+
+            def _event_stream(self):
+                if self.headers.get('hue-application-key') != simulator.user:
+                    self._send_json([{'error': {'type': 1, 'address': '/', 'description': 'unauthorized user'}}], 403)
+                    return
+                eventQueue = queue.Queue()
+                with simulator._lock:
+                    simulator._eventQueues.append(eventQueue)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    self.wfile.write(b': hi\n\n')
+                    self.wfile.flush()
+                    eventId = 0
+                    while True:
+                        try:
+                            event = eventQueue.get(timeout=10)
+                        except queue.Empty:
+                            # keep-alive kommentar wie bei der bridge
+                            self.wfile.write(b': hi\n\n')
+                            self.wfile.flush()
+                            continue
+                        if event is None:
+                            return
+                        eventId += 1
+                        self.wfile.write('id: {0}:0\ndata: {1}\n\n'.format(eventId, json.dumps(event)).encode('utf-8'))
+                        self.wfile.flush()
+                except OSError:
+                    pass
+                finally:
+                    with simulator._lock:
+                        simulator._eventQueues.remove(eventQueue)
+
+        return HueBridgeHandler
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#
+#  Copyright (C) 2014,2015 Michael Würtenberger
+#
+#  Tests der sperre nicht erreichbarer bridges (HueCircuitBreaker) gegen die simulierte bridge.
+#  Aufruf aus dem verzeichnis des plugins:
+#
+#  python3 -m pytest tests
+#
+#  APL2.0
+#
+
+import importlib
+import os
+import sys
+import time
+import unittest
+
+# das plugin ist ein paket (plugins/hue), es wird über das übergeordnete verzeichnis importiert
+packageDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(packageDir))
+packageName = os.path.basename(packageDir)
+benchmark = importlib.import_module(packageName + '.benchmark')
+simulator = importlib.import_module(packageName + '.simulator')
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = simulator.HueBridgeSimulator(lamps=3)
+        self.simulator.start()
+        self.smarthome = benchmark.BenchmarkSmartHome()
+        self.hue = benchmark.HUE(self.smarthome, hue_ip=self.simulator.address, hue_user=self.simulator.user, command_rate='0', state_cache='off',
+                                 breaker_threshold='1', breaker_backoff='0')
+        self.circuitBreaker = self.hue._circuitBreakers['0']
+
+    def tearDown(self):
+        self.hue.stop()
+        self.simulator.stop()
+        self.smarthome.cleanup()
+
+    def test_probe_with_other_error_reopens(self):
+        # die probe scheitert nicht an der verbindung, sondern an einer zu grossen antwort
+        self.circuitBreaker.failure()
+        self.assertEqual(self.circuitBreaker.state, 'open')
+        self.hue._update_circuit_breaker('0', ValueError('response exceeds max_response_size'))
+        self.assertEqual(self.circuitBreaker.state, 'open')
+        self.assertTrue(self.circuitBreaker.allow())
+        self.hue._update_circuit_breaker('0', ValueError('response exceeds max_response_size'))
+        self.assertEqual(self.circuitBreaker.state, 'open')
+        # die nächste probe geht durch und gibt die bridge wieder frei
+        time.sleep(0.01)
+        self.assertIsNotNone(self.hue._get_web_content('0', '/lights'))
+        self.assertEqual(self.circuitBreaker.state, 'closed')
+
+    def test_other_error_when_closed_is_ignored(self):
+        self.hue._update_circuit_breaker('0', ValueError('response exceeds max_response_size'))
+        self.assertEqual(self.circuitBreaker.state, 'closed')
+
+if __name__ == '__main__':
+    unittest.main()
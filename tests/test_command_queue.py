@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#
+#  Copyright (C) 2014,2015 Michael Würtenberger
+#
+#  Tests der zusammenfassung von befehlen in der warteschlange einer bridge (HueCommandQueue).
+#  Aufruf aus dem verzeichnis des plugins:
+#
+#  python3 -m pytest tests
+#
+#  APL2.0
+#
+
+import importlib
+import os
+import sys
+import threading
+import unittest
+
+# das plugin ist ein paket (plugins/hue), es wird über das übergeordnete verzeichnis importiert
+packageDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(packageDir))
+hue = importlib.import_module(os.path.basename(packageDir))
+
+class TestCommandQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.sentEvent = threading.Event()
+        def sendMethod(resource, resourceId, state, priority, commandTime):
+            self.sent.append((resource, resourceId, state))
+            self.sentEvent.set()
+        self.commandQueue = hue.HueCommandQueue('hue-command-test', sendMethod, rate=100)
+
+    def tearDown(self):
+        self.commandQueue.stop()
+
+    def send(self, *states):
+        # die befehle werden vor dem start eingestellt und damit sicher zusammengefasst
+        for state in states:
+            self.commandQueue.put('lights', '1', state)
+        self.commandQueue.start()
+        self.assertTrue(self.sentEvent.wait(5))
+        return self.sent[0][2]
+
+    def test_ct_after_xy(self):
+        self.assertEqual(self.send({'xy': [0.3, 0.3], 'transitiontime': 4}, {'ct': 300, 'transitiontime': 4}), {'ct': 300, 'transitiontime': 4})
+
+    def test_xy_after_ct(self):
+        self.assertEqual(self.send({'ct': 300, 'bri': 100}, {'xy': [0.3, 0.3]}), {'bri': 100, 'xy': [0.3, 0.3]})
+
+    def test_hue_after_ct_inc(self):
+        self.assertEqual(self.send({'ct_inc': 20}, {'hue': 1000, 'sat': 200}), {'hue': 1000, 'sat': 200})
+
+if __name__ == '__main__':
+    unittest.main()
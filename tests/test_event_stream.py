@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#
+#  Copyright (C) 2014,2015 Michael Würtenberger
+#
+#  Tests des event streams gegen die simulierte bridge (simulator.py): zuordnung der events zu den items, rückfall
+#  auf das polling bei abbruch des streams und neu verbinden.
+#  Aufruf aus dem verzeichnis des plugins:
+#
+#  python3 -m pytest tests
+#
+#  APL2.0
+#
+
+import importlib
+import os
+import sys
+import time
+import unittest
+
+# das plugin ist ein paket (plugins/hue), es wird über das übergeordnete verzeichnis importiert
+packageDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(packageDir))
+packageName = os.path.basename(packageDir)
+benchmark = importlib.import_module(packageName + '.benchmark')
+simulator = importlib.import_module(packageName + '.simulator')
+
+def wait_for(condition, timeout=5.0):
+    # wartet, bis condition() wahr ist, und liefert das ergebnis
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.02)
+    return condition()
+
+class TestEventStream(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = simulator.HueBridgeSimulator(lamps=3)
+        self.simulator.start()
+        self.smarthome = benchmark.BenchmarkSmartHome()
+        self.hue = benchmark.HUE(self.smarthome, hue_ip=self.simulator.address, hue_user=self.simulator.user, event_stream='http', command_rate='0', state_cache='off')
+        lamp = benchmark.BenchmarkItem(self.smarthome, 'lamp', {'hue_bridge_id': '0', 'hue_lamp_id': '1', 'hue_lamp_type': '0'})
+        self.items = {}
+        for hueAttribute in ('on', 'bri'):
+            self.items[hueAttribute] = benchmark.BenchmarkItem(self.smarthome, 'lamp.' + hueAttribute, {'hue_listen': hueAttribute}, lamp)
+            self.hue.parse_item(self.items[hueAttribute])
+        # die events werden gezählt, bevor sie wie bisher zugeordnet werden
+        self.events = []
+        applyEvent = self.hue._apply_event
+        def countedApplyEvent(hueBridgeId, eventData):
+            self.events.append((hueBridgeId, eventData.get('id_v1')))
+            applyEvent(hueBridgeId, eventData)
+        self.hue._apply_event = countedApplyEvent
+        self.eventStream = self.hue._eventStreams['0']
+
+    def tearDown(self):
+        self.hue.stop()
+        self.simulator.stop()
+        self.smarthome.cleanup()
+
+    def test_change_updates_item(self):
+        self.hue.run()
+        self.assertTrue(wait_for(lambda: self.eventStream.connected))
+        self.simulator.simulate_change('1', {'on': True, 'bri': 100})
+        self.assertTrue(wait_for(lambda: self.items['bri']() == 100))
+        self.assertEqual(self.items['on'](), True)
+        self.assertIn(('0', '/lights/1'), self.events)
+        # änderungen an lampen ohne items kommen an, schreiben aber nichts
+        writes = self.items['bri'].writes
+        self.simulator.simulate_change('2', {'bri': 10})
+        self.assertTrue(wait_for(lambda: ('0', '/lights/2') in self.events))
+        self.assertEqual(self.items['bri'].writes, writes)
+
+    def test_poll_fallback_and_reconnect(self):
+        self.hue.run()
+        self.assertTrue(wait_for(lambda: self.eventStream.connected))
+        # mit verbundenem stream wird nur noch im zyklus cycle_lamps_stream abgefragt
+        self.assertEqual(self.hue._get_poll_bridges('lights'), ['0'])
+        self.assertEqual(self.hue._get_poll_bridges('lights'), [])
+        self.simulator.drop_event_streams()
+        self.assertTrue(wait_for(lambda: not self.eventStream.connected))
+        # ohne stream wird wieder im normalen zyklus abgefragt und der wert kommt über das polling
+        self.assertEqual(self.hue._get_poll_bridges('lights'), ['0'])
+        self.simulator.simulate_change('1', {'on': True, 'bri': 50})
+        self.hue._update_lamps()
+        self.assertEqual(self.items['bri'](), 50)
+        # nach dem neu verbinden kommen die events wieder an
+        self.assertTrue(wait_for(lambda: self.eventStream.connected))
+        self.simulator.simulate_change('1', {'bri': 150})
+        self.assertTrue(wait_for(lambda: self.items['bri']() == 150))
+
+    def test_event_confirms_lamp(self):
+        self.hue.run()
+        self.assertTrue(wait_for(lambda: self.eventStream.connected))
+        self.hue._update_lamps()
+        # ein gruppenbefehl lässt den status der lampen offen, bis die bridge ihn meldet
+        self.hue._unconfirmedLamps['0'].add('1')
+        self.assertEqual(self.hue._filter_command('0', ['1'], {'on': False}), {'on': False})
+        self.simulator.simulate_change('1', {'on': True, 'bri': 100})
+        self.assertTrue(wait_for(lambda: '1' not in self.hue._unconfirmedLamps['0']))
+        self.assertEqual(self.hue._filter_command('0', ['1'], {'on': True, 'bri': 100}), {})
+        self.assertEqual(self.hue._filter_command('0', ['1'], {'on': False}), {'on': False})
+
+if __name__ == '__main__':
+    unittest.main()
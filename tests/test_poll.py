@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# vim: set encoding=utf-8 tabstop=4 softtabstop=4 shiftwidth=4 expandtab
+#
+#  Copyright (C) 2014,2015 Michael Würtenberger
+#
+#  Tests der zuordnung der abfragen zu den items gegen die simulierte bridge (simulator.py).
+#  Aufruf aus dem verzeichnis des plugins:
+#
+#  python3 -m pytest tests
+#
+#  APL2.0
+#
+
+import importlib
+import os
+import sys
+import unittest
+
+# das plugin ist ein paket (plugins/hue), es wird über das übergeordnete verzeichnis importiert
+packageDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(packageDir))
+packageName = os.path.basename(packageDir)
+benchmark = importlib.import_module(packageName + '.benchmark')
+simulator = importlib.import_module(packageName + '.simulator')
+
+class TestPoll(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = simulator.HueBridgeSimulator(lamps=3)
+        self.simulator.start()
+        self.smarthome = benchmark.BenchmarkSmartHome()
+        self.hue = benchmark.HUE(self.smarthome, hue_ip=self.simulator.address, hue_user=self.simulator.user, command_rate='0', state_cache='off')
+        lamp = benchmark.BenchmarkItem(self.smarthome, 'lamp', {'hue_bridge_id': '0', 'hue_lamp_id': '1', 'hue_lamp_type': '0'})
+        self.items = {}
+        # bri wird vor on geparst, die reihenfolge der items darf keine rolle spielen
+        for hueAttribute in ('bri', 'on'):
+            self.items[hueAttribute] = benchmark.BenchmarkItem(self.smarthome, 'lamp.' + hueAttribute, {'hue_listen': hueAttribute}, lamp)
+            self.hue.parse_item(self.items[hueAttribute])
+
+    def tearDown(self):
+        self.hue.stop()
+        self.simulator.stop()
+        self.smarthome.cleanup()
+
+    def test_bri_with_on_in_same_poll(self):
+        self.hue._update_lamps()
+        self.assertEqual(self.items['on'](), False)
+        self.simulator.simulate_change('1', {'on': True, 'bri': 120})
+        self.hue._update_lamps()
+        self.assertEqual(self.items['on'](), True)
+        self.assertEqual(self.items['bri'](), 120)
+
+    def test_bri_step_is_sent(self):
+        self.simulator.simulate_change('1', {'on': True, 'bri': 120})
+        self.hue._update_lamps()
+        self.assertEqual(self.hue._filter_command('0', ['1'], {'bri': 120}), {})
+        self.assertEqual(self.hue._filter_command('0', ['1'], {'bri': 121}), {'bri': 121})
+
+if __name__ == '__main__':
+    unittest.main()